@@ -0,0 +1,107 @@
+from cnf_syntax import CNFFormula, CNFClause, VariableTable
+from first_order_logic.syntax import Formula as FO_Formula
+from random import Random
+from typing import List
+
+
+# Clause to variable ratios at which random k-SAT formulae are SAT with probability about 1/2, and hardest to solve
+PHASE_TRANSITION_RATIOS = {3: 4.26, 4: 9.93, 5: 21.12}
+
+
+def new_CNFFormula(clauses: List[List[str]]) -> CNFFormula:
+    """ Clauses given as lists of names, with '~' for negation """
+    variable_table = VariableTable()
+    return CNFFormula([CNFClause([-variable_table.add_variable(literal[1:]) if literal[0] == '~'
+                                  else variable_table.add_variable(literal) for literal in clause])
+                       for clause in clauses], variable_table)
+
+
+def random_k_sat(num_variables: int, k: int = 3, ratio: float = None, seed: int = 0) -> CNFFormula:
+    """ Uniform random k-SAT: each clause has k distinct variables, each negated with probability 1/2. By default the
+    number of clauses is at the phase transition """
+    rng = Random(seed)
+    ratio = ratio if ratio is not None else PHASE_TRANSITION_RATIOS[k]
+    variable_table = VariableTable("x" + str(variable) for variable in range(1, num_variables + 1))
+    clauses = [CNFClause([variable if rng.random() < 0.5 else -variable for variable in rng.sample(range(1, num_variables + 1), k)])
+               for _ in range(round(ratio * num_variables))]
+    return CNFFormula(clauses, variable_table)
+
+
+def pigeonhole(num_pigeons: int, num_holes: int) -> CNFFormula:
+    """ p<i>h<j> means pigeon i is in hole j. Every pigeon is in some hole, and no two pigeons share one, which is UNSAT
+    if there are more pigeons than holes, and needs exponentially many resolution steps to refute """
+    def in_hole(pigeon: int, hole: int) -> str:
+        return "p" + str(pigeon) + "h" + str(hole)
+
+    clauses = [[in_hole(pigeon, hole) for hole in range(num_holes)] for pigeon in range(num_pigeons)]
+    clauses += [["~" + in_hole(pigeon, hole), "~" + in_hole(other_pigeon, hole)]
+                for hole in range(num_holes) for pigeon in range(num_pigeons) for other_pigeon in range(pigeon + 1, num_pigeons)]
+    return new_CNFFormula(clauses)
+
+
+def get_xor_clauses(output: str, first: str, second: str) -> List[List[str]]:
+    """ output <-> (first xor second) """
+    return [["~" + output, first, second], ["~" + output, "~" + first, "~" + second],
+            [output, "~" + first, second], [output, first, "~" + second]]
+
+
+def parity_chain(num_variables: int, is_satisfiable: bool = False, seed: int = 0) -> CNFFormula:
+    """ The parity of x1..xn computed twice, by chains of xors over two different orders of the variables, and the two
+    results are required to differ (or, if is_satisfiable, to differ from a fixed value instead). Easy for Gaussian
+    elimination, but hard for resolution when the orders disagree """
+    order = ["x" + str(variable) for variable in range(1, num_variables + 1)]
+    shuffled_order = list(order)
+    Random(seed).shuffle(shuffled_order)
+
+    clauses = list()
+    for chain_name, chain_order in (("s", order), ("t", shuffled_order)):
+        previous = chain_order[0]
+        for index, variable in enumerate(chain_order[1:], start=1):
+            current = chain_name + str(index)
+            clauses += get_xor_clauses(current, previous, variable)
+            previous = current
+
+    first_result, second_result = "s" + str(num_variables - 1), "t" + str(num_variables - 1)
+    if is_satisfiable:
+        clauses += [[first_result], [second_result]]
+    else:
+        clauses += [[first_result, second_result], ["~" + first_result, "~" + second_result]]
+    return new_CNFFormula(clauses)
+
+
+def graph_coloring(num_vertices: int, num_colors: int, edge_probability: float = 0.5, seed: int = 0) -> CNFFormula:
+    """ A random graph (every edge with edge_probability), colored with num_colors: v<i>c<j> means vertex i has color j.
+    Every vertex has exactly one color, and adjacent vertices have different ones """
+    def has_color(vertex: int, color: int) -> str:
+        return "v" + str(vertex) + "c" + str(color)
+
+    rng = Random(seed)
+    edges = [(vertex, other_vertex) for vertex in range(num_vertices) for other_vertex in range(vertex + 1, num_vertices)
+             if rng.random() < edge_probability]
+
+    clauses = [[has_color(vertex, color) for color in range(num_colors)] for vertex in range(num_vertices)]
+    clauses += [["~" + has_color(vertex, color), "~" + has_color(vertex, other_color)]
+                for vertex in range(num_vertices) for color in range(num_colors) for other_color in range(color + 1, num_colors)]
+    clauses += [["~" + has_color(vertex, color), "~" + has_color(other_vertex, color)]
+                for vertex, other_vertex in edges for color in range(num_colors)]
+    return new_CNFFormula(clauses)
+
+
+def diamond_chain(length: int, is_satisfiable: bool = False) -> FO_Formula:
+    """ The QF_UF diamonds: ((a<i>=b<i> & b<i>=a<i+1>) | (a<i>=c<i> & c<i>=a<i+1>)) for i < length, so a0 equals a<length>
+    whichever side of each diamond holds. With ~a0=a<length> that's UNSAT, but only after the propositional skeleton was
+    refuted for all 2^length combinations of sides, one congruence conflict at a time. If is_satisfiable, ~a0=b0 is asserted
+    instead """
+    def get_equality(first: str, second: str) -> str:
+        return first + "=" + second
+
+    formula = None
+    for index in range(length):
+        current, next_one = "a" + str(index), "a" + str(index + 1)
+        middle, other_middle = "b" + str(index), "c" + str(index)
+        diamond = "((" + get_equality(current, middle) + "&" + get_equality(middle, next_one) + ")|(" \
+                  + get_equality(current, other_middle) + "&" + get_equality(other_middle, next_one) + "))"
+        formula = diamond if formula is None else "(" + formula + "&" + diamond + ")"
+
+    last_constraint = "~" + (get_equality("a0", "b0") if is_satisfiable else get_equality("a0", "a" + str(length)))
+    return FO_Formula.parse("(" + formula + "&" + last_constraint + ")")
@@ -0,0 +1,156 @@
+"""
+Times the solvers on generated instances, and compares the results to a JSON baseline. Run from the repository root:
+---- python -m benchmarks.run_benchmarks --save        (records the baseline)
+---- python -m benchmarks.run_benchmarks               (compares to it, and exits with 1 on a regression)
+"""
+from benchmarks.generators import *
+from cnf_syntax import UNSAT, SAT
+from decision_heuristics import PhaseSaving, VSIDS
+from restart_policies import LubyRestarts
+from sat_solver import decide, solve_with_preprocessing, CONTINUE_UNTIL_MODEL_FULL
+from smt_solver import smt_solver
+from solver_statistics import SolverStatistics
+from typing import Dict, List, Optional
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.2  # A metric regresses if it's worse than the baseline by more than this fraction
+SAT_BENCHMARK, SMT_BENCHMARK = "sat", "smt"
+
+# name: (kind, generator, arguments, expected result or None if unknown)
+BENCHMARKS = {
+    "random_3_sat_100": (SAT_BENCHMARK, random_k_sat, dict(num_variables=100, seed=1), None),
+    "random_3_sat_150": (SAT_BENCHMARK, random_k_sat, dict(num_variables=150, seed=3), None),
+    "random_4_sat_50": (SAT_BENCHMARK, random_k_sat, dict(num_variables=50, k=4, seed=2), None),
+    "random_5_sat_30": (SAT_BENCHMARK, random_k_sat, dict(num_variables=30, k=5, seed=4), None),
+    "pigeonhole_7_6": (SAT_BENCHMARK, pigeonhole, dict(num_pigeons=7, num_holes=6), UNSAT),
+    "pigeonhole_8_8": (SAT_BENCHMARK, pigeonhole, dict(num_pigeons=8, num_holes=8), SAT),
+    "parity_chain_16": (SAT_BENCHMARK, parity_chain, dict(num_variables=16), UNSAT),
+    "parity_chain_40_sat": (SAT_BENCHMARK, parity_chain, dict(num_variables=40, is_satisfiable=True), SAT),
+    "graph_coloring_30_4": (SAT_BENCHMARK, graph_coloring, dict(num_vertices=30, num_colors=4, edge_probability=0.25, seed=5), None),
+    "graph_coloring_20_3": (SAT_BENCHMARK, graph_coloring, dict(num_vertices=20, num_colors=3, edge_probability=0.3, seed=1), None),
+    "diamond_chain_3": (SMT_BENCHMARK, diamond_chain, dict(length=3), UNSAT),
+    "diamond_chain_12_sat": (SMT_BENCHMARK, diamond_chain, dict(length=12, is_satisfiable=True), SAT),
+}
+
+# Metrics compared to the baseline, and whether a higher value is worse
+COMPARED_METRICS = {"wall_time": True, "peak_rss_kb": True, "propagations_per_second": False}
+
+
+def run_benchmark(name: str) -> Dict:
+    """ Generates the instance and solves it. Meant to run in a fresh process, so the peak RSS is this instance's """
+    kind, generator, arguments, expected_result = BENCHMARKS[name]
+    instance = generator(**arguments)
+    statistics = SolverStatistics()
+
+    start_time = time.perf_counter()
+    if kind == SAT_BENCHMARK:
+        result = solve_with_preprocessing(instance, dict(),
+                                          lambda cnf_formula: decide(cnf_formula, dict(), max_rounds=CONTINUE_UNTIL_MODEL_FULL,
+                                                                     decision_heuristic=PhaseSaving(VSIDS()),
+                                                                     restart_policy=LubyRestarts(), statistics=statistics),
+                                          statistics)[0]
+    else:
+        result = smt_solver(instance, statistics=statistics)[0]
+    wall_time = time.perf_counter() - start_time
+
+    assert expected_result is None or result == expected_result, name + " should be " + expected_result + ", got " + result
+    return dict(result=result, wall_time=wall_time, conflicts=statistics.conflicts, decisions=statistics.decisions,
+                propagations=statistics.propagations, propagations_per_second=statistics.propagations_per_second,
+                peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,  # In KB on Linux
+                statistics=statistics.to_dict())
+
+
+def run_benchmark_in_process(name: str, repeat: int) -> Dict:
+    """ The run with the lowest wall time, each in a new process """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        measurements = [pool.apply(run_benchmark, (name,)) for _ in range(repeat)]
+    return min(measurements, key=lambda measurement: measurement["wall_time"])
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """ Descriptions of the metrics that regressed """
+    regressions = list()
+    for name, measurement in results.items():
+        if name not in baseline:
+            continue
+        if measurement["result"] != baseline[name]["result"]:
+            regressions.append(name + ": result " + measurement["result"] + " instead of " + baseline[name]["result"])
+        for metric, is_higher_worse in COMPARED_METRICS.items():
+            current, previous = measurement.get(metric), baseline[name].get(metric)
+            if current is None or previous is None or previous == 0:
+                continue
+            change = (current - previous) / previous if is_higher_worse else (previous - current) / current
+            if change > threshold:
+                regressions.append(name + ": " + metric + " " + format_value(previous) + " -> " + format_value(current)
+                                   + " (" + format(change, "+.0%") + ")")
+    return regressions
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    return format(value, ".3f") if isinstance(value, float) else str(value)
+
+
+def print_results(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]]):
+    columns = ["result", "wall_time", "conflicts", "decisions", "propagations_per_second", "peak_rss_kb"]
+    print("benchmark".ljust(24) + "".join(column.rjust(25) for column in columns))
+    for name, measurement in results.items():
+        print(name.ljust(24) + "".join(format_value(measurement.get(column)).rjust(25) for column in columns))
+        if baseline is not None and name in baseline:
+            print("  baseline".ljust(24) + "".join(format_value(baseline[name].get(column)).rjust(25) for column in columns))
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the SAT and SMT solvers")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="the JSON baseline to compare to or save")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="the fraction by which a metric may be worse than the baseline")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per benchmark, of which the fastest is kept")
+    parser.add_argument("--filter", default="", help="run only the benchmarks whose names contain this")
+    options = parser.parse_args(arguments)
+
+    names = [name for name in BENCHMARKS if options.filter in name]
+    results = {name: run_benchmark_in_process(name, options.repeat) for name in names}
+
+    if options.save:
+        baseline = dict()
+        if os.path.exists(options.baseline):  # Benchmarks that weren't run keep their old numbers
+            with open(options.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        with open(options.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        print_results(results, None)
+        print("\nSaved the baseline to " + options.baseline)
+        return 0
+
+    baseline = None
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+    if baseline is None:
+        print("\nNo baseline at " + options.baseline + ", run with --save to record one")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, options.threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    if len(regressions) == 0:
+        print("\nNo regressions beyond " + format(options.threshold, ".0%"))
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
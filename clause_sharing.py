@@ -0,0 +1,134 @@
+from cnf_syntax import *
+from multiprocessing import shared_memory
+from typing import List, Tuple
+import multiprocessing
+
+
+DEFAULT_BUFFER_CAPACITY = 1 << 16  # Words in the ring. A reader that falls this far behind skips what it missed
+RECORD_HEADER_SIZE = 3  # Each clause is written as its length, its producer and its LBD, and then its literals
+WRITE_POSITION_INDEX = 0  # The first word counts every word ever written, so positions never wrap, only their slots do
+RING_START = 1
+
+
+class SharedClauseBuffer:
+    """ A ring buffer of clauses in shared memory, for solver processes that work on the same formula. Writers append
+    under a lock; every reader keeps its own position, and reads what was appended since. Positions only grow, so a reader
+    that was lapped (more than capacity words behind) notices it, and jumps to the newest clauses instead.
+
+    Created once by the parent process, and sent to the workers as a process argument, which attaches them to the same
+    memory. Only the creator unlinks it """
+
+    def __init__(self, capacity: int = DEFAULT_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.lock = multiprocessing.Lock()
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=(RING_START + capacity) * 8)
+        self.is_owner = True
+        self.words = self.shared_memory.buf.cast('q')
+        self.words[WRITE_POSITION_INDEX] = 0
+
+
+    def __getstate__(self):
+        return self.shared_memory.name, self.capacity, self.lock
+
+
+    def __setstate__(self, state):
+        name, self.capacity, self.lock = state
+        self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.is_owner = False
+        self.words = self.shared_memory.buf.cast('q')
+
+
+    def close(self):
+        self.words.release()
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
+
+
+    def get_write_position(self) -> int:
+        return self.words[WRITE_POSITION_INDEX]
+
+
+    def append(self, producer: int, lbd: int, literals: List[int]):
+        record = [len(literals), producer, lbd] + literals
+        assert len(record) <= self.capacity
+        words, capacity = self.words, self.capacity
+        with self.lock:
+            position = words[WRITE_POSITION_INDEX]
+            for offset, word in enumerate(record):
+                words[RING_START + (position + offset) % capacity] = word
+            words[WRITE_POSITION_INDEX] = position + len(record)
+
+
+    def read_from(self, position: int) -> Tuple[List[Tuple[int, int, List[int]]], int]:
+        """ The (producer, lbd, literals) of every clause appended since position, and the position to read from next """
+        words, capacity = self.words, self.capacity
+        records = list()
+        with self.lock:
+            write_position = words[WRITE_POSITION_INDEX]
+            if write_position - position > capacity:  # Lapped, so record boundaries before write_position are unknown
+                return records, write_position
+
+            while position < write_position:
+                length = words[RING_START + position % capacity]
+                producer = words[RING_START + (position + 1) % capacity]
+                lbd = words[RING_START + (position + 2) % capacity]
+                literals_start = position + RECORD_HEADER_SIZE
+                records.append((producer, lbd, [words[RING_START + (literals_start + offset) % capacity]
+                                                for offset in range(length)]))
+                position = literals_start + length
+        return records, position
+
+
+class ClauseExchange:
+    """ One solver's end of a SharedClauseBuffer. Learned clauses that pass the filter (short, or with a low LBD) are
+    exported, and the peers' clauses are imported by the search on level 0. A clause that this solver already exported
+    or imported, in any literal order, is never exported or imported again """
+
+    def __init__(self, shared_buffer: SharedClauseBuffer, producer: int, max_length: int = 8, max_lbd: int = 2):
+        self.shared_buffer = shared_buffer
+        self.producer = producer
+        self.max_length = max_length
+        self.max_lbd = max_lbd
+        self.read_position = shared_buffer.get_write_position()  # Clauses from before this solver started are skipped
+        self.known_clauses = set()
+        self.num_exported = 0
+        self.num_imported = 0
+
+
+    def should_export(self, clause: CNFClause) -> bool:
+        return len(clause) <= self.max_length or clause.lbd <= self.max_lbd
+
+
+    def export_clause(self, clause: CNFClause):
+        if not self.should_export(clause):
+            return
+        key = frozenset(clause.literals)
+        if key in self.known_clauses:
+            return
+        self.known_clauses.add(key)
+        self.shared_buffer.append(self.producer, clause.lbd, clause.literals)
+        self.num_exported += 1
+
+
+    def import_clauses(self) -> List[CNFClause]:
+        """ The peers' clauses that were exported since the last import, as learned clauses """
+        records, self.read_position = self.shared_buffer.read_from(self.read_position)
+        clauses = list()
+        for producer, lbd, literals in records:
+            key = frozenset(literals)
+            if producer == self.producer or key in self.known_clauses:
+                continue
+            self.known_clauses.add(key)
+            clause = CNFClause(literals, is_learned=True)
+            clause.lbd = lbd
+            clauses.append(clause)
+        self.num_imported += len(clauses)
+        return clauses
+
+
+def create_clause_exchanges(num_solvers: int, max_length: int = 8, max_lbd: int = 2,
+                            capacity: int = DEFAULT_BUFFER_CAPACITY) -> Tuple[SharedClauseBuffer, List[ClauseExchange]]:
+    """ A new buffer, and an exchange over it for each solver. The caller closes the buffer once the solvers are done """
+    shared_buffer = SharedClauseBuffer(capacity)
+    return shared_buffer, [ClauseExchange(shared_buffer, producer, max_length, max_lbd) for producer in range(num_solvers)]
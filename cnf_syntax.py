@@ -1,8 +1,4 @@
-import copy
-import math
-from collections import defaultdict
-
-from typing import List, Set
+from typing import Dict, Iterable, List, Optional, Set
 from propositional_logic.syntax import Formula as PropositionalFormula, is_variable
 from propositional_logic.semantics import Model
 
@@ -11,201 +7,205 @@ UNSAT = "UNSAT"
 SAT = "SAT"
 SAT_UNKNOWN = "SAT_UNKNOWN"
 
+# Learned clause minimization modes
+NO_MINIMIZATION = "NO_MINIMIZATION"
+LOCAL_MINIMIZATION = "LOCAL_MINIMIZATION"  # Self-subsumption - drop a literal if all of its reason's literals are in the clause
+RECURSIVE_MINIMIZATION = "RECURSIVE_MINIMIZATION"  # Drop a literal if it's implied by the clause's literals through any reasons
 
-class CNFClause:
+# Internally, variables are dense positive ints and literals are signed ints: v stands for v, and -v for ~v
+IdModel = Dict[int, bool]
+# The solver's own assignment - indexed by variable id, with None for unassigned variables
+Assignment = List[Optional[bool]]
+
+
+def literal_to_variable(literal: int) -> int:
+    return literal if literal > 0 else -literal
+
+
+def literal_to_assignment(literal: int) -> bool:
+    return literal > 0
 
-    def __init__(self, positive_literals: Set[str] = None, negative_literals: Set[str] = None):
-        self.positive_literals = positive_literals if positive_literals is not None else set()
-        self.negative_literals = negative_literals if negative_literals is not None else set()
 
-        self.all_literals = dict.fromkeys(self.positive_literals, True)
-        self.all_literals.update(dict.fromkeys(self.negative_literals, False))
+def assignment_to_literal(variable: int, assignment: bool) -> int:
+    return variable if assignment else -variable
 
-        for pos_var in self.positive_literals:
-            assert is_variable(pos_var)
-        for neg_var in self.negative_literals:
-            assert is_variable(neg_var)
 
-        self.is_sat = UNSAT if len(self) == 0 else SAT_UNKNOWN
-        self.inferred_assignment = None
-        self.watched_literals = set()
-        self.update_watched_literals_and_maybe_propagate(dict())
+class VariableTable:
+    """ The boundary between variable names and the dense ints used by the solver's core. Ids start at 1 """
+
+    def __init__(self, names: Iterable[str] = None):
+        self.name_to_id = dict()
+        self.id_to_name = [None]  # Id 0 can't be signed, so it's never used
+
+        if names is not None:
+            for name in names:
+                self.add_variable(name)
 
 
     def __repr__(self) -> str:
-        if len(self) == 0:
-            return ""
+        return str(self.name_to_id)
 
-        my_repr = "(" * (len(self) - 1)
-        first_pos = 0
-        first_neg = 0
 
-        pos_literals_list = list(self.positive_literals)
-        neg_literals_list = list(self.negative_literals)
+    def __len__(self):
+        return len(self.id_to_name) - 1
 
-        if len(pos_literals_list) > 0:
-            my_repr += str(pos_literals_list[0])
-            first_pos = 1
-        elif len(neg_literals_list) > 0:
-            my_repr += "~" + str(neg_literals_list[0])
-            first_neg = 1
 
-        for pos_index in range(first_pos, len(pos_literals_list)):
-            my_repr += "|" + str(pos_literals_list[pos_index]) + ")"
+    def __contains__(self, name: str) -> bool:
+        return name in self.name_to_id
 
-        for neg_index in range(first_neg, len(neg_literals_list)):
-            my_repr += "|" + "~" + str(neg_literals_list[neg_index]) + ")"
 
-        return my_repr
+    def add_variable(self, name: str) -> int:
+        variable = self.name_to_id.get(name)
+        if variable is None:
+            assert is_variable(name)
+            variable = len(self.id_to_name)
+            self.name_to_id[name] = variable
+            self.id_to_name.append(name)
+        return variable
 
 
-    def __eq__(self, other: object) -> bool:
-        return isinstance(other, CNFClause) \
-               and self.positive_literals == other.positive_literals \
-               and self.negative_literals == other.negative_literals
+    def get_id(self, name: str) -> int:
+        return self.name_to_id[name]
 
 
-    def __ne__(self, other: object) -> bool:
-        return not self == other
+    def get_name(self, variable: int) -> str:
+        return self.id_to_name[variable]
 
 
-    def __hash__(self) -> int:
-        return hash(str(self))
+    def literal_to_str(self, literal: int) -> str:
+        return self.id_to_name[literal] if literal > 0 else "~" + self.id_to_name[-literal]
 
 
-    def __len__(self):
-        return len(self.all_literals)
+    def model_to_ids(self, model: Model) -> IdModel:
+        return {self.add_variable(name): assignment for name, assignment in model.items()}
 
 
-    def to_PropositionalFormula(self) -> PropositionalFormula:
-        return PropositionalFormula.parse(str(self))
+    def model_to_names(self, model: IdModel) -> Model:
+        return {self.id_to_name[variable]: assignment for variable, assignment in model.items()}
 
 
-    def is_contain_negation_of_literal(self, variable: str, assignment: bool) -> bool:
-        return self.all_literals.get(variable, assignment) != assignment
+def literal_to_index(literal: int) -> int:
+    """ Literals are signed, so to index lists by literal we interleave them: v -> 2v, ~v -> 2v+1 """
+    return 2 * literal if literal > 0 else -2 * literal + 1
 
 
-    def get_all_variables(self) -> Set[str]:
-        return set(self.all_literals.keys())
+def literal_value(literal: int, values: Assignment):
+    """ True / False if the literal is satisfied / falsified under values, or None if its variable is unassigned """
+    assignment = values[literal if literal > 0 else -literal]
+    return None if assignment is None else assignment == (literal > 0)
 
 
-    def get_all_literals(self) -> Set[str]:
-        return {pos for pos in self.positive_literals} | {'~' + neg for neg in self.negative_literals}
+class CNFClause:
+    __slots__ = ("literals", "is_learned", "lbd", "activity", "is_deleted")
 
+    def __init__(self, literals: Iterable[int] = None, is_learned: bool = False):
+        # dict.fromkeys de-duplicates while keeping the original order of the literals.
+        # The first two literals are the watched ones, so the list is reordered by the formula that holds this clause
+        self.literals = list(dict.fromkeys(literals)) if literals is not None else list()
+        self.is_learned = is_learned
+        self.lbd = len(self.literals)  # Learned clauses get their real LBD when they're learned
+        self.activity = 0.0
+        self.is_deleted = False
 
-    def on_backjump(self, model: Model):
-        self.update_with_new_model(model)
-        self.update_watched_literals_and_maybe_propagate(model)
-        return self.inferred_assignment if self.inferred_assignment is not None else self.is_sat
 
+    def __repr__(self) -> str:
+        return self.to_str(None)
 
-    def update_with_new_model(self, model: Model):
-        for pos in self.positive_literals:  # Assuming we have small clauses, but big models
-            if model.get(pos, False):
-                self.watched_literals = set()
-                self.inferred_assignment = None
-                self.is_sat = SAT
-                return
 
-        for neg in self.negative_literals:
-            if not model.get(neg, True):
-                self.watched_literals = set()
-                self.inferred_assignment = None
-                self.is_sat = SAT
-                return
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CNFClause) and set(self.literals) == set(other.literals)
 
-        # No literal was satisfied, so SAT_UNKNOWN unless all of them are in the model, and then there's no chance for SAT
-        if self.get_all_variables().issubset(model.keys()):
-            self.is_sat = UNSAT
-        else:
-            self.is_sat = SAT_UNKNOWN
 
+    def __ne__(self, other: object) -> bool:
+        return not self == other
 
-    def sat_value_under_assignment(self, variable: str, assignment: bool):
-        if self.is_sat in (SAT, UNSAT) or variable not in self.all_literals:
-            return self.inferred_assignment if self.inferred_assignment is not None else self.is_sat
 
-        elif self.inferred_assignment is not None:  # We have only one shot to get SAT
-            return SAT if self.inferred_assignment == (variable, assignment) else UNSAT
+    def __hash__(self) -> int:
+        return hash(frozenset(self.literals))
 
-        elif self.all_literals.get(variable, not assignment) == assignment:
-            return SAT
 
-        return SAT_UNKNOWN
+    def __len__(self):
+        return len(self.literals)
 
 
-    def is_satisfied_under_assignment(self, variable: str, assignment: bool) -> bool:
-        return self.all_literals.get(variable, not assignment) == assignment
+    def copy(self) -> "CNFClause":
+        """ A new clause with the same literals, which is learned (with the same LBD) if this one is """
+        clause = CNFClause(self.literals, self.is_learned)
+        clause.lbd = self.lbd
+        return clause
 
 
-    def update_with_new_assignment(self, variable: str, assignment: bool, model: Model):
-        if self.is_sat in (SAT, UNSAT):
-            return self.is_sat  # No new assignment will change this state, so spare the check
+    def to_str(self, variable_table: VariableTable = None) -> str:
+        """ The clause as a propositional formula string. Without a variable_table, the raw ids are printed """
+        if len(self.literals) == 0:
+            return ""
 
-        if self.all_literals.get(variable, not assignment) == assignment:
-            self.is_sat = SAT
-            self.inferred_assignment = None
-            self.watched_literals = set()
-            return SAT
+        if variable_table is not None:
+            literals_str = [variable_table.literal_to_str(literal) for literal in self.literals]
+        else:
+            literals_str = [str(literal) if literal > 0 else "~" + str(-literal) for literal in self.literals]
 
-        # NOTE: If we're here, the assigned variable is either not in our clause, OR the assignment is not satisfying us
+        return "(" * (len(literals_str) - 1) + literals_str[0] + "".join("|" + literal_str + ")" for literal_str in literals_str[1:])
 
-        if self.inferred_assignment is not None and self.inferred_assignment[0] == variable:
-            self.is_sat = UNSAT  # When we have an inferred variable, the only chance we'll be SAT is if it's assigned correctly
-            self.inferred_assignment = None
-            self.watched_literals = set()
-            return UNSAT
 
-        if variable in self.watched_literals:  # We got an un-satisfying assignment to one of out watch literals
-            self.update_watched_literals_and_maybe_propagate(model)
+    def to_PropositionalFormula(self, variable_table: VariableTable) -> PropositionalFormula:
+        return PropositionalFormula.parse(self.to_str(variable_table))
 
-        assert self.is_sat == SAT_UNKNOWN  # If we got here, we MUST be SAT_UNKNOWN
-        return self.inferred_assignment if self.inferred_assignment is not None else self.is_sat
 
+    def is_tautology(self) -> bool:
+        return len(self.get_all_variables()) != len(self.literals)
 
-    def update_watched_literals_and_maybe_propagate(self, model: Model):
-        self.watched_literals = set()  # Finding 1 watch literals is as difficult as finding 2, so don't keep the old watched_literals
-        self.inferred_assignment = None
 
-        if self.is_sat in (SAT, UNSAT):
-            return
+    def is_contain_negation_of_literal(self, variable: int, assignment: bool) -> bool:
+        return assignment_to_literal(variable, not assignment) in self.literals
+
+
+    def get_all_variables(self) -> Set[int]:
+        return {literal_to_variable(literal) for literal in self.literals}
+
 
-        candidates = self.get_all_variables() - model.keys()
-        num_to_take = min(2, len(candidates))
+    def get_all_literals(self) -> Set[int]:
+        return set(self.literals)
 
-        if num_to_take >= 1:  # Update watched_literals
-            the_chosen_ones = list(candidates)[:num_to_take]
-            self.watched_literals = set(the_chosen_ones)
-            if num_to_take == 1:  # Also update inferred_assignment (i.e. propagate)
-                inferred_variable = the_chosen_ones[0]
-                self.inferred_assignment = inferred_variable, self.all_literals[inferred_variable]
+
+    def is_satisfied_under_assignment(self, variable: int, assignment: bool) -> bool:
+        return assignment_to_literal(variable, assignment) in self.literals
 
 
 class CNFFormula:
+    """ The original clauses are kept in clauses, and the clauses learned from conflicts in learned_clauses. Learned
+    clauses are scored by LBD and activity, and the worst of them are periodically deleted """
 
-    def __init__(self, clauses: List[CNFClause]):
-        self.clauses = clauses
-        self.variable_to_containing_clause = dict()
-        self.last_result = SAT_UNKNOWN
+    CLAUSE_ACTIVITY_RESCALE_LIMIT = 1e20
 
+    def __init__(self, clauses: List[CNFClause], variable_table: VariableTable = None):
+        self.clauses = clauses
+        self.learned_clauses = list()
+        self.variable_table = variable_table if variable_table is not None else VariableTable()
+        self.variable_to_containing_clause = [[]]  # Indexed by variable id, so index 0 is never used
+        self.watches = [[], []]  # Indexed by literal_to_index. Clauses watching a literal are visited only when it becomes False
+        self.conflict_clause = None  # A conflict found outside of propagate (an empty clause, or a clause added UNSAT)
+        self.out_of_order_clauses = list()  # Attached with a True watch from a later level than their False watch
+
+        self.clause_bump_amount = 1.0
+        self.clause_decay = 0.999
+        self.reduction_interval = 2000  # Conflicts between two reductions of the learned clauses. Grows after each one
+        self.reduction_interval_increment = 300
+        self.conflicts_until_reduction = self.reduction_interval
+
+        self.ensure_capacity(len(self.variable_table))  # The table may have variables that no clause contains
         for clause in self.clauses:
-            for var in clause.get_all_variables():
-                current_clauses = self.variable_to_containing_clause.get(var, set())
-                current_clauses.add(clause)
-                self.variable_to_containing_clause[var] = current_clauses
+            self.add_clause_occurrences(clause)
+            self.watch_clause(clause)
 
 
     def __repr__(self) -> str:
-        if len(self.clauses) == 0:
+        all_clauses = self.get_all_clauses()
+        if len(all_clauses) == 0:
             return ""
 
-        my_repr = "(" * (len(self.clauses) - 1)
-        my_repr += str(self.clauses[0])
-
-        for clause_index in range(1, len(self.clauses)):
-            my_repr += "&" + str(self.clauses[clause_index]) + ")"
-
-        return my_repr
+        return "(" * (len(all_clauses) - 1) + all_clauses[0].to_str(self.variable_table) \
+               + "".join("&" + clause.to_str(self.variable_table) + ")" for clause in all_clauses[1:])
 
 
     def __eq__(self, other: object) -> bool:
@@ -221,19 +221,26 @@ class CNFFormula:
 
 
     def __len__(self):
-        return len(self.clauses)
+        return len(self.clauses) + len(self.learned_clauses)
 
 
     def to_PropositionalFormula(self) -> PropositionalFormula:
         return PropositionalFormula.parse(str(self))
 
 
-    def get_all_variables(self) -> Set[str]:
-        return set(self.variable_to_containing_clause.keys())
+    def get_all_clauses(self) -> List[CNFClause]:
+        return self.clauses + self.learned_clauses
+
+
+    def get_num_variables(self) -> int:
+        return len(self.variable_table)
+
+
+    def get_all_variables(self) -> Set[int]:
+        return {variable for variable in range(1, len(self.variable_to_containing_clause)) if self.variable_to_containing_clause[variable]}
 
 
-    def count_clauses_satisfied_by_assignment(self, variable: str, assignment: bool):
-        assert is_variable(variable)
+    def count_clauses_satisfied_by_assignment(self, variable: int, assignment: bool):
         sat_counter = 0
         for clause in self.variable_to_containing_clause[variable]:
             if clause.is_satisfied_under_assignment(variable, assignment):
@@ -241,108 +248,304 @@ class CNFFormula:
         return sat_counter
 
 
-    def add_clause(self, new_clause: CNFClause):
-        self.clauses.append(new_clause)
-        for var in new_clause.get_all_variables():
-            current_clauses = self.variable_to_containing_clause.get(var, set())
-            current_clauses.add(new_clause)
-            self.variable_to_containing_clause[var] = current_clauses
+    def ensure_capacity(self, variable: int):
+        while variable >= len(self.variable_to_containing_clause):
+            self.variable_to_containing_clause.append([])
+            self.watches.append([])
+            self.watches.append([])
 
 
-    def on_backjump(self, model: Model):
-        sat_counter = 0
-        found_unsat = None
-        inferred_assignment = SAT_UNKNOWN  # If we got one inferred assignment, we'll return it. Otherwise, we'll return SAT_UNKNOWN
-
-        for clause in self.clauses:
-            result = clause.on_backjump(model)
+    def add_clause_occurrences(self, clause: CNFClause):
+        for variable in clause.get_all_variables():
+            self.ensure_capacity(variable)
+            self.variable_to_containing_clause[variable].append(clause)
 
-            if result == UNSAT:
-                found_unsat = clause  # Just a precaution, if it happens entire formula UNSAT, and we'll catch that in other places
 
-            elif result == SAT:
-                sat_counter += 1
+    def watch_clause(self, clause: CNFClause):
+        for literal in clause.literals[:2]:
+            self.ensure_capacity(literal_to_variable(literal))
+            self.watches[literal_to_index(literal)].append(clause)
 
-            elif result == SAT_UNKNOWN:
-                continue
 
-            else:  # Just a precaution, as backjumping preserves propagated assignments
-                inferred_assignment = result + (clause,)
+    def add_clause(self, new_clause: CNFClause, implication_graph: "ImplicationGraph" = None):
+        """ Adds a clause to the formula. If added in the middle of a search, implication_graph must be given, so the watched
+        literals are chosen to match the current assignment, and a unit or conflicting clause is noticed right away """
+        if new_clause.is_learned:
+            self.learned_clauses.append(new_clause)
+        else:
+            self.clauses.append(new_clause)
+        self.add_clause_occurrences(new_clause)
 
-        if found_unsat is not None:
-            self.last_result = UNSAT, found_unsat
-        elif sat_counter == len(self.clauses):
-            self.last_result = SAT
+        if implication_graph is not None:
+            self.attach_clause(new_clause, implication_graph)
         else:
-            self.last_result = inferred_assignment
+            self.watch_clause(new_clause)
+
+
+    def attach_clause(self, clause: CNFClause, implication_graph: "ImplicationGraph"):
+        """ Watches a clause in the middle of a search, and assigns it if it's unit or flags it if it's UNSAT """
+        implication_graph.ensure_capacity(self.get_num_variables())
+        values = implication_graph.value
+        literals = clause.literals
+        # Non-false literals first, and then false ones from the latest level, so backjumping never leaves two false watches
+        literals.sort(key=lambda literal: (literal_value(literal, values) is False,
+                                           -implication_graph.level[literal_to_variable(literal)]
+                                           if literal_value(literal, values) is False else 0))
+        self.watch_clause(clause)
+
+        if len(literals) == 0 or literal_value(literals[0], values) is False:
+            self.conflict_clause = clause
+        elif literal_value(literals[0], values) is None and (len(literals) == 1 or literal_value(literals[1], values) is False):
+            implication_graph.add_inference(literal_to_variable(literals[0]), literals[0] > 0, clause)
+        elif len(literals) > 1 and literal_value(literals[0], values) is True and literal_value(literals[1], values) is False \
+                and implication_graph.level[literal_to_variable(literals[0])] > implication_graph.level[literal_to_variable(literals[1])]:
+            # The only non-false literal, set after the clause became unit. A backjump between the two levels would
+            # unassign it and leave the clause unit, which no watch would notice, so on_backjump checks it
+            self.out_of_order_clauses.append(clause)
+
+
+    def on_conflict(self, analyzed_clauses: List[CNFClause]):
+        """ Bumps the activity of the learned clauses that took part in a conflict's analysis, and counts the conflict
+        towards the next reduction. Like VSIDS, the bump amount grows instead of decaying every activity """
+        for clause in analyzed_clauses:
+            if clause.is_learned:
+                clause.activity += self.clause_bump_amount
+                if clause.activity > CNFFormula.CLAUSE_ACTIVITY_RESCALE_LIMIT:
+                    for learned_clause in self.learned_clauses:
+                        learned_clause.activity /= CNFFormula.CLAUSE_ACTIVITY_RESCALE_LIMIT
+                    self.clause_bump_amount /= CNFFormula.CLAUSE_ACTIVITY_RESCALE_LIMIT
+        self.clause_bump_amount /= self.clause_decay
+        self.conflicts_until_reduction -= 1
+
+
+    def is_reduction_due(self) -> bool:
+        return self.conflicts_until_reduction <= 0
+
+
+    def reduce_learned_clauses(self, implication_graph: "ImplicationGraph", proof: "DratProofWriter" = None):
+        """ Deletes about half of the learned clauses - those with the highest LBD, and then the lowest activity. Binary
+        clauses, glue clauses (LBD <= 2) and clauses that are the reason of a current assignment are always kept. The
+        deleted clauses are then removed from the watch and occurrence lists, and logged to the proof if there is one """
+        reason = implication_graph.reason
+        candidates = list()
+        for clause in self.learned_clauses:
+            is_locked = len(clause.literals) > 0 and reason[literal_to_variable(clause.literals[0])] is clause
+            if len(clause.literals) > 2 and clause.lbd > 2 and not is_locked:
+                candidates.append(clause)
+
+        candidates.sort(key=lambda clause: (-clause.lbd, clause.activity))
+        for clause in candidates[:len(self.learned_clauses) // 2]:
+            clause.is_deleted = True
+            if proof is not None:
+                proof.delete_clause(clause.literals)
+        self.compact()
+
+        self.reduction_interval += self.reduction_interval_increment
+        self.conflicts_until_reduction = self.reduction_interval
+
+
+    def compact(self):
+        """ Removes the clauses marked is_deleted from the learned clauses, and from the watch and occurrence lists they
+        are in. Only the lists of the deleted clauses' literals are scanned """
+        dirty_watch_indices = set()
+        dirty_variables = set()
+        for clause in self.learned_clauses:
+            if clause.is_deleted:
+                dirty_watch_indices.update(literal_to_index(literal) for literal in clause.literals[:2])
+                dirty_variables.update(clause.get_all_variables())
+
+        if len(dirty_variables) == 0:
+            return
 
+        self.learned_clauses = [clause for clause in self.learned_clauses if not clause.is_deleted]
+        for watch_index in dirty_watch_indices:
+            self.watches[watch_index] = [clause for clause in self.watches[watch_index] if not clause.is_deleted]
+        for variable in dirty_variables:
+            self.variable_to_containing_clause[variable] = [clause for clause in self.variable_to_containing_clause[variable]
+                                                            if not clause.is_deleted]
+
+
+    def substitute_literals(self, representatives: List[int], implication_graph: "ImplicationGraph"):
+        """ Replaces every variable v by the literal representatives[v] (which is v itself for most variables) in all the
+        clauses, on level 0. A binary clause that becomes a tautology links two equivalent literals, so it's kept as is -
+        these clauses are what still gives the replaced variables their representatives' values. Any other tautology is
+        deleted. All the clauses are then watched anew """
+        assert implication_graph.curr_decision_level == 0
+
+        for clause in self.get_all_clauses():
+            new_literals = list(dict.fromkeys(representatives[literal] if literal > 0 else -representatives[-literal]
+                                              for literal in clause.literals))
+            if any(-literal in new_literals for literal in new_literals):
+                clause.is_deleted = len(clause.literals) != 2
+            else:
+                clause.literals = new_literals
 
-    def update_with_new_assignment(self, variable: str, assignment: bool, model: Model):
-        assert is_variable(variable)
-        are_all_sat = True
-        found_unsat = None
-        inferred_assignment = SAT_UNKNOWN  # If we got one inferred assignment, we'll return it. Otherwise, we'll return SAT_UNKNOWN
+        self.clauses = [clause for clause in self.clauses if not clause.is_deleted]
+        self.learned_clauses = [clause for clause in self.learned_clauses if not clause.is_deleted]
+        self.variable_to_containing_clause = [[] for _ in self.variable_to_containing_clause]
+        self.watches = [[] for _ in self.watches]
+        self.conflict_clause = None
+        self.out_of_order_clauses = list()
+        for clause in self.get_all_clauses():
+            self.add_clause_occurrences(clause)
+            self.attach_clause(clause, implication_graph)
 
-        for clause in self.variable_to_containing_clause[variable]:
-            result = clause.update_with_new_assignment(variable, assignment, model)
 
-            if result == UNSAT:
-                found_unsat = clause  # Maybe can return here, but won't make big difference
-                are_all_sat = False
+    def on_backjump(self, implication_graph: "ImplicationGraph"):
+        """ Watches stay valid when variables are unassigned, so there's nothing to undo but a pending conflict. The
+        exception is the out of order clauses, which are assigned here if the backjump left them unit """
+        self.conflict_clause = None
+        if len(self.out_of_order_clauses) == 0:
+            return
 
-            elif result == SAT:
+        values = implication_graph.value
+        remaining_clauses = list()
+        for clause in self.out_of_order_clauses:
+            if clause.is_deleted:
                 continue
+            first_value, second_value = literal_value(clause.literals[0], values), literal_value(clause.literals[1], values)
+            if first_value is True or second_value is True:
+                remaining_clauses.append(clause)
+            elif first_value is None or second_value is None:
+                literals = clause.literals
+                if first_value is False:
+                    literals[0], literals[1] = literals[1], literals[0]
+                if literal_value(literals[1], values) is False:
+                    implication_graph.add_inference(literal_to_variable(literals[0]), literals[0] > 0, clause)
+        self.out_of_order_clauses = remaining_clauses
+
+
+    def load_model(self, implication_graph: "ImplicationGraph"):
+        """ Initial loading - assigns the unit clauses and finds the empty ones. The assignments already on the trail are
+        propagated by the next call to propagate """
+        implication_graph.ensure_capacity(self.get_num_variables())
+        values = implication_graph.value
+        self.conflict_clause = None
 
-            elif result == SAT_UNKNOWN:
-                are_all_sat = False
-
-            else:  # Result is a inferred assignment. Continue looping to make sure not UNSAT. Note that means inferred_assignment might change
-                inferred_assignment = result + (clause,)
-                are_all_sat = False
-
-        if found_unsat is not None:
-            self.last_result = UNSAT, found_unsat
+        for clause in self.get_all_clauses():
+            if len(clause) == 0:
+                self.conflict_clause = clause
+            elif len(clause) == 1 and literal_value(clause.literals[0], values) is None:
+                implication_graph.add_inference(literal_to_variable(clause.literals[0]), clause.literals[0] > 0, clause)
+            elif len(clause) == 1 and literal_value(clause.literals[0], values) is False:
+                self.conflict_clause = clause
+
+
+    def propagate(self, implication_graph: "ImplicationGraph") -> Optional[CNFClause]:
+        """ Unit propagation. The trail suffix after implication_graph.propagation_head is a FIFO queue of literals whose
+        watches weren't visited yet. Every unit found is assigned right away and joins the queue, which is drained until
+        it's empty or until the first conflict, whose clause is returned """
+        if self.conflict_clause is not None:
+            return self.conflict_clause
+
+        trail = implication_graph.trail
+        while implication_graph.propagation_head < len(trail):
+            literal = trail[implication_graph.propagation_head]
+            implication_graph.propagation_head += 1
+            conflict_clause = self.propagate_literal(literal, implication_graph)
+            if conflict_clause is not None:
+                return conflict_clause
+
+        return None
+
+
+    def propagate_literal(self, true_literal: int, implication_graph: "ImplicationGraph") -> Optional[CNFClause]:
+        """ Visits only the clauses watching the literal that true_literal falsified """
+        if literal_to_variable(true_literal) >= len(self.variable_to_containing_clause):
+            return None
+
+        values = implication_graph.value
+        false_literal = -true_literal
+        watch_list = self.watches[literal_to_index(false_literal)]
+        conflict_clause = None
+        kept_index = 0
+        clause_index = 0
+
+        while clause_index < len(watch_list):
+            clause = watch_list[clause_index]
+            clause_index += 1
+            literals = clause.literals
+
+            if len(literals) == 1:  # Can't move the watch anywhere, so this unit clause is now UNSAT
+                watch_list[kept_index] = clause
+                kept_index += 1
+                conflict_clause = clause
+                break
+
+            if literals[0] == false_literal:  # Keep the falsified watch at index 1
+                literals[0], literals[1] = literals[1], literals[0]
+
+            other_watch_value = literal_value(literals[0], values)
+            if other_watch_value is True:  # Clause is SAT, nothing to do
+                watch_list[kept_index] = clause
+                kept_index += 1
+                continue
 
-        elif are_all_sat:  # Only if all clauses containing the last assigned var are SAT, bother checking all the rest are SAT, and if not put SAT_UNKOWN
-            for clause in self.clauses:
-                if clause.is_sat != SAT:
-                    are_all_sat = False
-            self.last_result = SAT if are_all_sat else SAT_UNKNOWN
+            for literal_index in range(2, len(literals)):
+                if literal_value(literals[literal_index], values) is not False:  # Found a replacement watch
+                    literals[1], literals[literal_index] = literals[literal_index], literals[1]
+                    self.watches[literal_to_index(literals[1])].append(clause)
+                    break
+
+            else:  # No replacement, so the clause is either unit or UNSAT, and it keeps watching the false literal
+                watch_list[kept_index] = clause
+                kept_index += 1
+                if other_watch_value is False:
+                    conflict_clause = clause
+                    break
+                implication_graph.add_inference(literal_to_variable(literals[0]), literals[0] > 0, clause)
+
+        while clause_index < len(watch_list):  # Only when stopped on a conflict - keep the clauses we didn't get to
+            watch_list[kept_index] = watch_list[clause_index]
+            kept_index += 1
+            clause_index += 1
+        del watch_list[kept_index:]
 
-        else:
-            self.last_result = inferred_assignment
+        return conflict_clause
 
 
 class ImplicationGraph:
+    """ The assignment trail - every assigned literal in assignment order, with level markers. value / level / reason are
+    indexed by variable id, so backjumping only touches the popped suffix of the trail """
 
-    def __init__(self, decided_variables: Model = None):
+    def __init__(self, num_variables: int = 0, decided_variables: IdModel = None, minimization_mode: str = RECURSIVE_MINIMIZATION):
         decided_variables = dict(decided_variables) if decided_variables is not None else dict()
+        assert minimization_mode in (NO_MINIMIZATION, LOCAL_MINIMIZATION, RECURSIVE_MINIMIZATION)
 
         self.curr_decision_level = 0
         self.conflict_clause = None
-        self.decision_variables = [decided_variables]
-        self.inferred_variables = [dict()]
-        self.total_model = dict()
-        self.total_model.update(decided_variables)
-        # Map each inferred variable to the clause that caused it, and at which level that was
-        self.causing_clauses = {variable: (None, self.curr_decision_level) for variable in decided_variables.keys()}
+        self.trail = list()
+        self.trail_limits = list()  # trail_limits[i] is where level i+1 starts on the trail
+        self.propagation_head = 0  # Literals on the trail from here on weren't propagated yet
+        self.value = [None]
+        self.level = [0]
+        self.reason = [None]  # The clause that caused each inferred variable, and None for decisions
+        self.seen = [False]  # Conflict analysis marks, always cleared when it's done
+        self.analyzed_clauses = list()  # The conflict clause and the reasons that the last conflict analysis resolved with
+        self.minimization_mode = minimization_mode
+
+        self.is_partial_model_on_level_zero = len(decided_variables) > 0
+        self.ensure_capacity(max([num_variables] + list(decided_variables.keys())))
+        for variable, assignment in decided_variables.items():  # The partial model is decided on level 0
+            self.assign(variable, assignment, None)
 
 
     def __repr__(self) -> str:
         my_repr = ""
-        for i in range(self.curr_decision_level):
+        for i in range(self.curr_decision_level + 1):
+            level_literals = self.get_level_literals(i)
             my_repr += "LEVEL " + str(i) + ": " + "\n" \
-                        + "Decided: " + str(self.decision_variables[i]) + "\n" \
-                        + "Inferred: " + str(self.inferred_variables[i]) + "\n"
+                        + "Decided: " + str([literal for literal in level_literals if self.reason[literal_to_variable(literal)] is None]) + "\n" \
+                        + "Inferred: " + str([literal for literal in level_literals if self.reason[literal_to_variable(literal)] is not None]) + "\n"
         return my_repr
 
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, ImplicationGraph) \
-               and self.decision_variables == other.decision_variables \
-               and self.inferred_variables == other.inferred_variables \
-               and self.curr_decision_level == other.curr_decision_level \
-               and self.causing_clauses == other.causing_clauses
+               and self.trail == other.trail \
+               and self.trail_limits == other.trail_limits \
+               and [self.reason[literal_to_variable(literal)] for literal in self.trail] \
+               == [other.reason[literal_to_variable(literal)] for literal in other.trail]
 
 
     def __ne__(self, other: object) -> bool:
@@ -357,142 +560,250 @@ class ImplicationGraph:
         return self.curr_decision_level
 
 
-    def add_decision(self, variable, assignment):
-        assert is_variable(variable)
-        assert variable not in self.total_model.keys()
+    @property
+    def total_model(self) -> IdModel:
+        """ The current assignment as a dict, for the boundary. The solver itself reads value """
+        return {literal_to_variable(literal): literal > 0 for literal in self.trail}
 
-        self.curr_decision_level += 1
-        self.decision_variables.append({variable: assignment})
-        self.inferred_variables.append(dict())
-        self.total_model[variable] = assignment
-        self.causing_clauses[variable] = (None, self.curr_decision_level)
 
+    def ensure_capacity(self, num_variables: int):
+        missing = num_variables + 1 - len(self.value)
+        if missing > 0:
+            self.value.extend([None] * missing)
+            self.level.extend([0] * missing)
+            self.reason.extend([None] * missing)
+            self.seen.extend([False] * missing)
 
-    def add_inference(self, variable: str, assignment: bool, causing_clause: CNFClause):
-        assert is_variable(variable)
-        assert variable not in self.total_model.keys()
 
-        self.inferred_variables[-1].update({variable: assignment})
-        self.total_model[variable] = assignment
-        self.causing_clauses[variable] = (causing_clause, self.curr_decision_level)
+    def get_level_literals(self, level: int) -> List[int]:
+        start = 0 if level == 0 else self.trail_limits[level - 1]
+        end = self.trail_limits[level] if level < len(self.trail_limits) else len(self.trail)
+        return self.trail[start:end]
 
 
-    def get_causing_clause_of_variable(self, variable: str) -> CNFClause:
-        assert is_variable(variable)
-        return self.causing_clauses[variable][0]
+    def assign(self, variable: int, assignment: bool, causing_clause: Optional[CNFClause]):
+        assert variable > 0
+        assert self.value[variable] is None
 
+        self.value[variable] = assignment
+        self.level[variable] = self.curr_decision_level
+        self.reason[variable] = causing_clause
+        self.trail.append(assignment_to_literal(variable, assignment))
 
-    def get_decision_level_of_variable(self, variable: str) -> int:
-        assert is_variable(variable)
-        return self.causing_clauses[variable][1]
 
-
-    def get_causing_variables(self, variable: str) -> Set[str]:
-        assert is_variable(variable)
-        causing_clause = self.get_causing_clause_of_variable(variable)
-        return causing_clause.get_all_variables() if causing_clause is not None else set()
+    def new_decision_level(self):
+        """ Opens a level without a decision in it, for an assumption that is already True """
+        self.curr_decision_level += 1
+        self.trail_limits.append(len(self.trail))
 
 
-    def learn_conflict_clause(self) -> CNFClause:
-        uip = self.find_uip()
-        uip_assignment = self.total_model[uip]
-        conflict_clause = self.conflict_clause
+    def add_decision(self, variable: int, assignment: bool):
+        self.new_decision_level()
+        self.assign(variable, assignment, None)
 
-        while not conflict_clause.is_contain_negation_of_literal(uip, uip_assignment):
-            conflict_clause = self.resolve(conflict_clause)
 
-        return conflict_clause
+    def add_inference(self, variable: int, assignment: bool, causing_clause: CNFClause):
+        self.assign(variable, assignment, causing_clause)
 
 
-    def find_uip(self) -> str:
-        assert self.conflict_clause is not None
-        assert self.curr_decision_level >= 1
+    def get_causing_clause_of_variable(self, variable: int) -> CNFClause:
+        return self.reason[variable]
 
-        last_decision_variable = list(self.decision_variables[-1].keys())[0]  # List of dict only for level 0. From lvl. 1 always 1 decision var per level
-        potential_uips = set(self.total_model.keys())
-        potential_uips_distances = {potential_uip: math.inf for potential_uip in potential_uips}
-        current_path = list()
 
-        def dfs_helper(current_node):  # Finds all uips we must go through and their min distances from the conflict
-            nonlocal potential_uips, potential_uips_distances
+    def get_decision_level_of_variable(self, variable: int) -> int:
+        return self.level[variable]
 
-            current_path.append(current_node)
-            if current_node == last_decision_variable:
-                potential_uips.intersection_update(set(current_path))
-                for node_index in range(len(current_path)):
-                    curr_node = current_path[node_index]
-                    curr_node_dist = node_index + 1
-                    if curr_node_dist < potential_uips_distances[curr_node]:
-                        potential_uips_distances[curr_node] = curr_node_dist
 
-            else:
-                for parent in self.get_causing_variables(current_node):
-                    if parent not in current_path:  # Avoid loop, even though we shouldn't have any - just in case
-                        dfs_helper(parent)
-                current_path.pop()
-
-        for var in self.conflict_clause.get_all_variables():  # todo: not sure of this line
-            dfs_helper(var)
-
-        # After the dfs we have all possible uips and their distances
+    def get_causing_variables(self, variable: int) -> Set[int]:
+        causing_clause = self.get_causing_clause_of_variable(variable)
+        return causing_clause.get_all_variables() if causing_clause is not None else set()
 
-        assert len(potential_uips) >= 1  # The decision variable is a UIP, so there's at least one
 
-        closest_uip = None
-        closest_uip_dist = math.inf
-        for potential_uip in potential_uips:
-            if 0 < potential_uips_distances[potential_uip] < closest_uip_dist:
-                closest_uip = potential_uip
-                closest_uip_dist = potential_uips_distances[closest_uip]
+    def learn_conflict_clause(self) -> CNFClause:
+        """ First-UIP learning: walks the trail backwards from the conflict, resolving on every seen literal of the current
+        level, until only one of them is left. The clause is then minimized according to minimization_mode. The learned
+        clause has that UIP's negation first, and the literal with the highest remaining level second """
+        assert self.conflict_clause is not None
+        assert self.curr_decision_level >= 1
 
-        assert closest_uip is not None
-        return closest_uip
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        # Level 0 literals are implied by the formula alone, unless level 0 holds a partial model, which isn't
+        drop_level_zero = not self.is_partial_model_on_level_zero
+        learned_literals = [0]  # Place holder for the UIP
+        current_level_counter = 0
+        clause = self.conflict_clause
+        uip_literal = 0
+        trail_index = len(trail) - 1
+        self.analyzed_clauses = list()
+
+        while True:
+            self.analyzed_clauses.append(clause)
+            for literal in clause.literals:
+                variable = literal if literal > 0 else -literal
+                if literal == uip_literal or seen[variable] or (level[variable] == 0 and drop_level_zero):
+                    continue
+                seen[variable] = True
+                if level[variable] == self.curr_decision_level:
+                    current_level_counter += 1
+                else:
+                    learned_literals.append(literal)
+
+            while not seen[literal_to_variable(trail[trail_index])]:  # The next current level literal to resolve on
+                trail_index -= 1
+            uip_literal = trail[trail_index]
+            trail_index -= 1
+            seen[literal_to_variable(uip_literal)] = False
+            current_level_counter -= 1
+            if current_level_counter == 0:
+                break
+            clause = reason[literal_to_variable(uip_literal)]
+
+        learned_literals[0] = -uip_literal
+        learned_literals = self.minimize_learned_literals(learned_literals, drop_level_zero)
+
+        if len(learned_literals) > 2:  # Put the highest level literal second, as it's the one to watch after backjumping
+            max_index = max(range(1, len(learned_literals)), key=lambda index: level[literal_to_variable(learned_literals[index])])
+            learned_literals[1], learned_literals[max_index] = learned_literals[max_index], learned_literals[1]
+
+        learned_clause = CNFClause(learned_literals, is_learned=True)
+        learned_clause.lbd = self.compute_lbd(learned_clause)
+        return learned_clause
+
+
+    def minimize_learned_literals(self, learned_literals: List[int], drop_level_zero: bool) -> List[int]:
+        """ Removes the literals (but the UIP) that are implied by the others. Expects the literals after the UIP to be
+        marked seen, and clears those marks """
+        seen, reason = self.seen, self.reason
+        to_clear = learned_literals[1:]  # Literals found redundant are marked seen too, and are cleared at the end
+
+        if self.minimization_mode == NO_MINIMIZATION:
+            minimized_literals = learned_literals
+
+        elif self.minimization_mode == LOCAL_MINIMIZATION:
+            minimized_literals = [learned_literals[0]]
+            for literal in learned_literals[1:]:
+                if not self.is_implied_by_seen_literals(literal, drop_level_zero):
+                    minimized_literals.append(literal)
 
+        else:
+            # A bit for each level (mod 32) of the clause. If a reason has a literal of any other level, the search can stop
+            abstract_levels = 0
+            for literal in learned_literals[1:]:
+                abstract_levels |= self.get_abstract_level(literal_to_variable(literal))
+
+            minimized_literals = [learned_literals[0]]
+            for literal in learned_literals[1:]:
+                if reason[literal_to_variable(literal)] is None \
+                        or not self.is_redundant(literal, abstract_levels, drop_level_zero, to_clear):
+                    minimized_literals.append(literal)
+
+        for literal in to_clear:
+            seen[literal_to_variable(literal)] = False
+        return minimized_literals
+
+
+    def get_abstract_level(self, variable: int) -> int:
+        return 1 << (self.level[variable] & 31)
+
+
+    def is_implied_by_seen_literals(self, literal: int, drop_level_zero: bool) -> bool:
+        variable = literal_to_variable(literal)
+        causing_clause = self.reason[variable]
+        if causing_clause is None:
+            return False
+
+        for causing_literal in causing_clause.literals:
+            causing_variable = literal_to_variable(causing_literal)
+            if causing_variable != variable and not self.seen[causing_variable] \
+                    and (self.level[causing_variable] > 0 or not drop_level_zero):
+                return False
+        return True
+
+
+    def is_redundant(self, literal: int, abstract_levels: int, drop_level_zero: bool, to_clear: List[int]) -> bool:
+        """ Checks if literal is implied by the seen literals, by an iterative DFS over the reasons. Every literal proven
+        redundant along the way stays seen, which saves repeating the search for it. If the search fails, the marks it added
+        are undone """
+        seen, level, reason = self.seen, self.level, self.reason
+        stack = [literal]
+        to_clear_size = len(to_clear)
+
+        while len(stack) > 0:
+            variable = literal_to_variable(stack.pop())
+            for causing_literal in reason[variable].literals:
+                causing_variable = causing_literal if causing_literal > 0 else -causing_literal
+                if causing_variable == variable or seen[causing_variable] or (level[causing_variable] == 0 and drop_level_zero):
+                    continue
+
+                if reason[causing_variable] is not None and self.get_abstract_level(causing_variable) & abstract_levels != 0:
+                    seen[causing_variable] = True
+                    stack.append(causing_literal)
+                    to_clear.append(causing_literal)
+                else:
+                    for added_literal in to_clear[to_clear_size:]:
+                        seen[literal_to_variable(added_literal)] = False
+                    del to_clear[to_clear_size:]
+                    return False
+
+        return True
+
+
+    def get_implying_decisions(self, literal: int) -> List[int]:
+        """ The decisions that the current value of literal follows from, found by walking the trail backwards over the
+        reasons. Level 0 assignments follow from the formula alone, so they are skipped """
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        variable = literal_to_variable(literal)
+        if level[variable] == 0:
+            return list()
+
+        decisions = list()
+        seen[variable] = True
+        for trail_index in range(len(trail) - 1, self.trail_limits[0] - 1, -1):
+            trail_variable = literal_to_variable(trail[trail_index])
+            if not seen[trail_variable]:
+                continue
+            seen[trail_variable] = False
 
-    def resolve(self, clause_to_resolve: CNFClause) -> CNFClause:
-        last_assigned_var = self.get_last_assigned_var(clause_to_resolve)
-        last_assigned_var_causing_clause = self.get_causing_clause_of_variable(last_assigned_var)
+            if reason[trail_variable] is None:
+                decisions.append(trail[trail_index])
+                continue
+            for causing_literal in reason[trail_variable].literals:
+                causing_variable = literal_to_variable(causing_literal)
+                if causing_variable != trail_variable and level[causing_variable] > 0:
+                    seen[causing_variable] = True
 
-        vars_to_resolve = (clause_to_resolve.positive_literals & last_assigned_var_causing_clause.negative_literals) | \
-                          (clause_to_resolve.negative_literals & last_assigned_var_causing_clause.positive_literals)
-        assert len(vars_to_resolve) > 0
+        return decisions
 
-        new_pos_vars = (clause_to_resolve.positive_literals | last_assigned_var_causing_clause.positive_literals) - vars_to_resolve
-        new_neg_vars = (clause_to_resolve.negative_literals | last_assigned_var_causing_clause.negative_literals) - vars_to_resolve
-        return CNFClause(new_pos_vars, new_neg_vars)
 
+    def get_backjump_level(self, learned_clause: CNFClause) -> int:
+        """ The second highest level in a learned clause, where its first literal is the only unassigned one """
+        if len(learned_clause) < 2:
+            return 0
+        return self.level[literal_to_variable(learned_clause.literals[1])]
 
-    def get_last_assigned_var(self, clause_to_resolve: CNFClause) -> str:
-        last_assigned_var = ""
-        last_assigned_var_decision_level = -1
-        for cur_var in clause_to_resolve.get_all_variables():
-            cur_decision_level = self.get_decision_level_of_variable(cur_var)
-            if (cur_decision_level > last_assigned_var_decision_level) \
-                    or (cur_decision_level == last_assigned_var_decision_level and cur_var < last_assigned_var):
-                last_assigned_var = cur_var
-                last_assigned_var_decision_level = cur_decision_level
 
-        assert last_assigned_var != ""
-        return last_assigned_var
+    def compute_lbd(self, clause: CNFClause) -> int:
+        """ Literal Block Distance - the number of different decision levels in the clause. Lower means a better clause """
+        level = self.level
+        return len({level[literal if literal > 0 else -literal] for literal in clause.literals})
 
 
-    def backjump_to_level(self, new_level):
+    def backjump_to_level(self, new_level: int) -> List[int]:
+        """ Unassigns every literal above new_level, and returns those literals, latest first """
         assert 0 <= new_level
         assert new_level < self.curr_decision_level
 
+        level_start = self.trail_limits[new_level]
+        lost_literals = self.trail[level_start:]
+        lost_literals.reverse()
+        for literal in lost_literals:
+            variable = literal_to_variable(literal)
+            self.value[variable] = None
+            self.reason[variable] = None
+
+        del self.trail[level_start:]
+        del self.trail_limits[new_level:]
+        self.propagation_head = min(self.propagation_head, len(self.trail))
         self.curr_decision_level = new_level
         self.conflict_clause = None
-        self.decision_variables = self.decision_variables[:self.curr_decision_level + 1]
-        self.inferred_variables = self.inferred_variables[:self.curr_decision_level + 1]
-
-        all_vars_before_backjump = set(self.total_model.keys())
-        self.total_model = dict()
-        for i in range(self.curr_decision_level + 1):
-            self.total_model.update(self.decision_variables[i])
-            self.total_model.update(self.inferred_variables[i])
-        all_vars_after_backjump = set(self.total_model.keys())
-
-        lost_vars = all_vars_before_backjump - all_vars_after_backjump
-        for var in lost_vars:
-            del self.causing_clauses[var]
-
+        return lost_literals
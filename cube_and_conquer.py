@@ -0,0 +1,330 @@
+from sat_solver import *
+from clause_sharing import create_clause_exchanges
+from math import ceil, log2
+from queue import Empty
+import multiprocessing
+import os
+import time
+
+
+CUBES_PER_WORKER = 4  # The initial split aims for this many cubes per worker, so the work can be balanced
+MAX_LOOKAHEAD_CANDIDATES = 40  # Only the variables with the most occurrences are looked ahead on, as each costs two propagations
+RESULT_POLL_INTERVAL = 0.1  # Seconds between checks that some worker is still alive, while waiting for results
+
+
+class LookaheadCuber:
+    """ Splits the search space into cubes - conjunctions of literals - with a lookahead: every candidate variable is
+    decided both ways and propagated, and the one whose two branches assign the most (by the product of the two counts)
+    is branched on. A candidate with a failing branch forces the other one, which joins the cube without branching, and a
+    branch that fails by propagation alone is dropped, so the cubes cover only what propagation couldn't refute.
+
+    Works on a formula and an implication graph on level 0, e.g. of a solver between searches, and leaves them there """
+
+    def __init__(self, cnf_formula: CNFFormula, implication_graph: ImplicationGraph,
+                 max_candidates: int = MAX_LOOKAHEAD_CANDIDATES):
+        assert implication_graph.curr_decision_level == 0
+        self.cnf_formula = cnf_formula
+        self.implication_graph = implication_graph
+        self.max_candidates = max_candidates
+        self.num_lookaheads = 0
+
+
+    def split(self, cube: List[int], depth: int) -> List[List[int]]:
+        """ Cubes that extend cube by up to depth branching literals (and any forced ones). An empty list means that
+        propagation refuted all of cube """
+        cubes = list()
+        if self.decide_and_propagate(0):
+            for literal in cube:
+                value = literal_value(literal, self.implication_graph.value)
+                if value is False or (value is None and not self.decide_and_propagate(literal)):
+                    break
+            else:
+                self.add_cubes(list(cube), depth, cubes)
+        self.backjump_to_level(0)
+        return cubes
+
+
+    def add_cubes(self, cube: List[int], depth: int, cubes: List[List[int]]):
+        if depth == 0:
+            cubes.append(cube)
+            return
+
+        level = self.implication_graph.curr_decision_level
+        branch_variable, forced_literals = self.choose_branch_variable()
+        if forced_literals is None:  # The lookahead refuted this cube
+            self.backjump_to_level(level)
+            return
+
+        cube = cube + forced_literals
+        if branch_variable == 0:  # Nothing left to branch on
+            cubes.append(cube)
+        else:
+            for literal in (branch_variable, -branch_variable):
+                branch_level = self.implication_graph.curr_decision_level
+                if self.decide_and_propagate(literal):
+                    self.add_cubes(cube + [literal], depth - 1, cubes)
+                self.backjump_to_level(branch_level)
+        self.backjump_to_level(level)
+
+
+    def choose_branch_variable(self) -> Tuple[int, Optional[List[int]]]:
+        """ The variable to branch on (0 if none is left) and the literals forced on the way, each decided on a level of
+        its own. The forced literals are None if some candidate failed both ways, or a forced literal led to a conflict """
+        values = self.implication_graph.value
+        occurrences = self.cnf_formula.variable_to_containing_clause
+        candidates = [variable for variable in range(1, self.cnf_formula.get_num_variables() + 1) if values[variable] is None]
+        candidates.sort(key=lambda variable: len(occurrences[variable]), reverse=True)
+
+        forced_literals = list()
+        scores = dict()
+        for variable in candidates[:self.max_candidates]:
+            if values[variable] is not None:  # Assigned by a forced literal
+                continue
+            positive_count = self.look_ahead(variable)
+            negative_count = self.look_ahead(-variable)
+            if positive_count is None and negative_count is None:
+                return 0, None
+            if positive_count is None or negative_count is None:
+                forced_literal = -variable if positive_count is None else variable
+                if not self.decide_and_propagate(forced_literal):
+                    return 0, None
+                forced_literals.append(forced_literal)
+                continue
+            scores[variable] = positive_count * negative_count + positive_count + negative_count
+
+        # Scores from before a forced literal are a bit stale, but still rank the variables it left unassigned
+        unassigned_candidates = [variable for variable in scores if values[variable] is None]
+        if len(unassigned_candidates) == 0:
+            return 0, forced_literals
+        return max(unassigned_candidates, key=scores.get), forced_literals
+
+
+    def look_ahead(self, literal: int) -> Optional[int]:
+        """ How many literals deciding literal assigns, or None if it leads to a conflict """
+        self.num_lookaheads += 1
+        level = self.implication_graph.curr_decision_level
+        trail_size = len(self.implication_graph.trail)
+        is_consistent = self.decide_and_propagate(literal)
+        num_assigned = len(self.implication_graph.trail) - trail_size
+        self.backjump_to_level(level)
+        return num_assigned if is_consistent else None
+
+
+    def decide_and_propagate(self, literal: int) -> bool:
+        """ Decides literal on a new level (or, for 0, just propagates), and returns False on a conflict """
+        if literal != 0:
+            self.implication_graph.add_decision(literal_to_variable(literal), literal > 0)
+        return self.cnf_formula.propagate(self.implication_graph) is None
+
+
+    def backjump_to_level(self, level: int):
+        if self.implication_graph.curr_decision_level > level:
+            backjump(self.cnf_formula, self.implication_graph, level, None)
+
+
+class CubeAndConquerStatistics:
+    """ What a cube and conquer run did, summed over its workers """
+
+    def __init__(self, num_workers: int = 0):
+        self.num_initial_cubes = 0
+        self.num_solved_cubes = 0
+        self.num_split_cubes = 0  # Cubes that ran out of rounds, and were split again
+        self.num_refuted_by_lookahead = 0  # Cubes that a split found UNSAT by propagation alone
+        self.num_lookaheads = 0
+        self.num_learned_clauses = 0  # The learned clauses that the workers had when they finished
+        self.search_statistics = SolverStatistics()  # Of all the workers' searches
+        self.cubes_per_worker = [0] * num_workers
+        self.cubing_time = 0.0  # Of the initial split, in seconds
+        self.solving_time = 0.0  # Wall time from the first cube to the answer, in seconds
+
+
+    def __repr__(self) -> str:
+        return "CubeAndConquerStatistics(" + ", ".join(name + "=" + str(value) for name, value in vars(self).items()
+                                                       if name != "search_statistics") + ")"
+
+
+def run_cube_worker(worker_index: int, clauses: List[List[int]], variable_table: VariableTable, max_rounds_per_cube: int,
+                    split_depth: int, clause_exchange: Optional[ClauseExchange], budget: Optional[ResourceBudget],
+                    task_queue, result_queue):
+    """ Solves cubes from task_queue as assumptions of one incremental solver, so whatever it learns on one cube helps with
+    the next. A cube that runs out of rounds is split by a lookahead over the solver's formula, learned clauses included,
+    and the new cubes are sent back to be queued - even a single one, if the lookahead extended the cube with forced
+    literals. A cube left SAT_UNKNOWN without a split means the budget, shared by all of this worker's cubes, was
+    exhausted. Stops on None """
+    solver = IncrementalSatSolver(clause_exchange=clause_exchange, statistics=SolverStatistics())
+    for variable in range(1, len(variable_table) + 1):
+        solver.variable_table.add_variable(variable_table.get_name(variable))
+    for literals in clauses:
+        solver.add_clause(CNFClause(literals))
+
+    while True:
+        cube = task_queue.get()
+        if cube is None:
+            break
+
+        assumptions = variable_table.model_to_names({literal_to_variable(literal): literal > 0 for literal in cube})
+        result = solver.solve(assumptions, max_rounds=max_rounds_per_cube, budget=budget)
+        new_cubes, is_split, num_lookaheads = list(), False, 0
+        if result == SAT_UNKNOWN and (budget is None or budget.exhausted_reason is None):
+            cuber = LookaheadCuber(solver.cnf_formula, solver.implication_graph)
+            new_cubes = cuber.split(cube, split_depth)
+            num_lookaheads = cuber.num_lookaheads
+            if len(new_cubes) == 1 and len(new_cubes[0]) == len(cube):  # Nothing to branch on or force, so it's solved to the end
+                result, new_cubes = solver.solve(assumptions, budget=budget), list()
+            else:
+                result, is_split = UNSAT if len(new_cubes) == 0 else SAT_UNKNOWN, True
+
+        # solver.is_unsat means no assumption took part in refuting the cube, so the formula itself is UNSAT
+        result_queue.put((worker_index, result, solver.get_model(), new_cubes, is_split, solver.is_unsat, num_lookaheads,
+                          len(solver.cnf_formula.learned_clauses), solver.statistics,
+                          budget.exhausted_reason if budget is not None else None))
+
+
+class CubeAndConquerSolver:
+    """ Cube and conquer: a lookahead splits the formula into cubes, and a pool of incremental CDCL workers solves them.
+    The cubes wait in one queue that every idle worker takes from, so the work is balanced dynamically; a cube that takes
+    a worker more than max_rounds_per_cube rounds is split again and its parts are queued. The formula is SAT as soon as
+    one cube is, and UNSAT once every cube is refuted. Meant for hard UNSAT formulas, where a portfolio of whole searches
+    doesn't help. With share_clauses, the workers exchange their short or low LBD learned clauses like a portfolio does.
+    A budget is handled like portfolio_decide does. statistics describes the last run """
+
+    def __init__(self, num_workers: int = None, cube_depth: int = None, max_rounds_per_cube: int = 5000, split_depth: int = 2,
+                 share_clauses: bool = True, max_shared_length: int = 8, max_shared_lbd: int = 2):
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count() or 1
+        self.cube_depth = cube_depth if cube_depth is not None else ceil(log2(self.num_workers * CUBES_PER_WORKER))
+        self.max_rounds_per_cube = max_rounds_per_cube
+        self.split_depth = split_depth
+        self.share_clauses = share_clauses
+        self.max_shared_length = max_shared_length
+        self.max_shared_lbd = max_shared_lbd
+        self.statistics = CubeAndConquerStatistics(self.num_workers)
+
+
+    def solve(self, propositional_formula: Union[PropositionalFormula, EquisatisfiableFormula], partial_model=None,
+              conflict=None, budget: ResourceBudget = None) -> Tuple[str, Model, EquisatisfiableFormula]:
+        """ Like sat_solver, with the search done by decide below """
+        if partial_model is None:
+            partial_model = dict()
+        if budget is not None:
+            budget.start()
+
+        cnf_formula = get_CNFFormula(propositional_formula, conflict, budget=budget)
+        if cnf_formula is None:
+            return SAT_UNKNOWN, partial_model, propositional_formula
+        return solve_with_preprocessing(cnf_formula, partial_model,
+                                        lambda simplified_CNFFormula: self.decide(simplified_CNFFormula, partial_model, budget),
+                                        budget=budget)
+
+
+    def decide(self, cnf_formula: CNFFormula, partial_model: Model,
+               budget: ResourceBudget = None) -> Tuple[str, Model, CNFFormula]:
+        """ Like decide, with no limit on the rounds. The partial model is part of every cube """
+        self.statistics = statistics = CubeAndConquerStatistics(self.num_workers)
+        if budget is not None:
+            budget.start()
+        variable_table = cnf_formula.variable_table
+        partial_literals = [assignment_to_literal(variable, assignment)
+                            for variable, assignment in variable_table.model_to_ids(partial_model).items()]
+
+        start_time = time.perf_counter()
+        implication_graph = ImplicationGraph(cnf_formula.get_num_variables())
+        cnf_formula.load_model(implication_graph)
+        cuber = LookaheadCuber(cnf_formula, implication_graph)
+        cubes = cuber.split(partial_literals, self.cube_depth)
+        statistics.num_lookaheads = cuber.num_lookaheads
+        statistics.num_initial_cubes = len(cubes)
+        statistics.cubing_time = time.perf_counter() - start_time
+        if len(cubes) == 0:
+            return UNSAT, partial_model, cnf_formula
+        if budget is not None and budget.is_exhausted():
+            return SAT_UNKNOWN, partial_model, cnf_formula
+
+        start_time = time.perf_counter()
+        result, model = self.conquer(cnf_formula, cubes, budget)
+        statistics.solving_time = time.perf_counter() - start_time
+        return result, model if result == SAT else partial_model, cnf_formula
+
+
+    def conquer(self, cnf_formula: CNFFormula, cubes: List[List[int]], budget: ResourceBudget = None) -> Tuple[str, Model]:
+        statistics = self.statistics
+        context = multiprocessing.get_context()
+        task_queue, result_queue = context.Queue(), context.Queue()
+        clauses = [clause.literals for clause in cnf_formula.clauses]
+        shared_buffer, clause_exchanges = None, [None] * self.num_workers
+        if self.share_clauses and self.num_workers > 1:
+            shared_buffer, clause_exchanges = create_clause_exchanges(self.num_workers, self.max_shared_length,
+                                                                      self.max_shared_lbd)
+        worker_budget = budget.get_worker_budget() if budget is not None else None
+        workers = [context.Process(target=run_cube_worker, daemon=True,
+                                   args=(worker_index, clauses, cnf_formula.variable_table, self.max_rounds_per_cube,
+                                         self.split_depth, clause_exchanges[worker_index], worker_budget, task_queue,
+                                         result_queue))
+                   for worker_index in range(self.num_workers)]
+        for cube in cubes:
+            task_queue.put(cube)
+        for worker in workers:
+            worker.start()
+
+        num_pending_cubes = len(cubes)  # Queued, or being solved
+        learned_clauses_per_worker = [0] * self.num_workers
+        search_statistics_per_worker = [SolverStatistics() for _ in range(self.num_workers)]  # The latest, as they accumulate
+        result, model = SAT_UNKNOWN, dict()
+        try:
+            while num_pending_cubes > 0:
+                try:
+                    worker_index, cube_result, cube_model, new_cubes, is_split, is_formula_unsat, num_lookaheads, \
+                        num_learned_clauses, search_statistics, exhausted_reason = result_queue.get(timeout=RESULT_POLL_INTERVAL)
+                except Empty:
+                    if budget is not None and budget.is_exhausted():
+                        break
+                    if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                        break  # The workers were killed before they could finish
+                    continue
+
+                num_pending_cubes -= 1
+                statistics.cubes_per_worker[worker_index] += 1
+                statistics.num_lookaheads += num_lookaheads
+                learned_clauses_per_worker[worker_index] = num_learned_clauses
+                search_statistics_per_worker[worker_index] = search_statistics
+                if cube_result == SAT:
+                    result, model = SAT, cube_model
+                    break
+                if is_formula_unsat:
+                    result = UNSAT
+                    break
+                if cube_result == SAT_UNKNOWN and not is_split:  # The worker's budget was exhausted, so this one is too
+                    if budget is not None and budget.exhausted_reason is None:
+                        budget.exhausted_reason = exhausted_reason
+                    break
+
+                if not is_split:
+                    statistics.num_solved_cubes += 1
+                elif len(new_cubes) == 0:
+                    statistics.num_refuted_by_lookahead += 1
+                else:
+                    statistics.num_split_cubes += 1
+                    for new_cube in new_cubes:
+                        task_queue.put(new_cube)
+                    num_pending_cubes += len(new_cubes)
+            else:
+                result = UNSAT  # Every cube was refuted
+        finally:
+            if num_pending_cubes == 0:  # The workers are idle, waiting for cubes
+                for _ in workers:
+                    task_queue.put(None)
+            else:  # Some may still be on a cube that no longer matters, or keep taking the queued ones
+                for worker in workers:
+                    if worker.is_alive():
+                        worker.terminate()
+                task_queue.cancel_join_thread()  # The cubes left in it are never read
+            for worker in workers:
+                worker.join()
+            task_queue.close()
+            result_queue.close()
+            if shared_buffer is not None:
+                shared_buffer.close()
+
+        statistics.num_learned_clauses = sum(learned_clauses_per_worker)
+        for search_statistics in search_statistics_per_worker:
+            statistics.search_statistics.add(search_statistics)
+        return result, model
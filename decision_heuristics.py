@@ -0,0 +1,236 @@
+from cnf_syntax import *
+from itertools import chain
+from random import Random
+from typing import Callable, Iterable, List, Tuple, Union
+
+
+class DecisionHeuristic:
+    """ A stateful decision heuristic. decide calls it like the plain heuristic functions (e.g. DLIS), and also notifies it
+    about conflicts, backjumps and restarts. The hooks do nothing by default """
+
+    def __call__(self, cnf_formula: CNFFormula, values: Assignment) -> Tuple[int, bool]:
+        raise NotImplementedError
+
+
+    def on_conflict(self, conflict_clause: CNFClause, learned_clause: CNFClause, implication_graph: ImplicationGraph):
+        pass
+
+
+    def on_backjump(self, lost_literals: List[int], implication_graph: ImplicationGraph):
+        """ lost_literals are the literals the backjump unassigned, latest first """
+        pass
+
+
+    def on_restart(self):
+        pass
+
+
+class VariableOrderHeap:
+    """ A binary max-heap of variables ordered by activity, which also knows where each variable is, so a variable whose
+    activity was bumped can be moved up in O(log n) """
+
+    def __init__(self, activity: List[float]):
+        self.activity = activity  # Shared with the owner, who bumps it and then calls increase
+        self.heap = list()
+        self.indices = [-1]  # Position of each variable in heap, or -1 if it's not there
+
+
+    def __len__(self):
+        return len(self.heap)
+
+
+    def __contains__(self, variable: int) -> bool:
+        return variable < len(self.indices) and self.indices[variable] >= 0
+
+
+    def insert(self, variable: int):
+        while variable >= len(self.indices):
+            self.indices.append(-1)
+        if self.indices[variable] >= 0:
+            return
+
+        self.indices[variable] = len(self.heap)
+        self.heap.append(variable)
+        self.percolate_up(len(self.heap) - 1)
+
+
+    def increase(self, variable: int):
+        if variable in self:
+            self.percolate_up(self.indices[variable])
+
+
+    def pop_max(self) -> int:
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        self.indices[top] = -1
+        if len(heap) > 0:
+            heap[0] = last
+            self.indices[last] = 0
+            self.percolate_down(0)
+        return top
+
+
+    def percolate_up(self, index: int):
+        heap, indices, activity = self.heap, self.indices, self.activity
+        variable = heap[index]
+        while index > 0:
+            parent_index = (index - 1) >> 1
+            parent = heap[parent_index]
+            if activity[parent] >= activity[variable]:
+                break
+            heap[index] = parent
+            indices[parent] = index
+            index = parent_index
+        heap[index] = variable
+        indices[variable] = index
+
+
+    def percolate_down(self, index: int):
+        heap, indices, activity = self.heap, self.indices, self.activity
+        variable = heap[index]
+        heap_size = len(heap)
+        while True:
+            child_index = 2 * index + 1
+            if child_index >= heap_size:
+                break
+            if child_index + 1 < heap_size and activity[heap[child_index + 1]] > activity[heap[child_index]]:
+                child_index += 1
+            child = heap[child_index]
+            if activity[child] <= activity[variable]:
+                break
+            heap[index] = child
+            indices[child] = index
+            index = child_index
+        heap[index] = variable
+        indices[variable] = index
+
+
+class VSIDS(DecisionHeuristic):
+    """ Exponential VSIDS (EVSIDS): every conflict bumps the activity of the variables in the learned clause by a bump
+    amount that grows by 1/decay per conflict, which is the same as decaying all the older bumps. Decisions take the most
+    active unassigned variable out of a heap; assigned variables are dropped from it lazily, and unassigned variables are
+    put back on backjump. With a seed, variables start with small random activities instead of 0, so differently seeded
+    instances make different first decisions """
+
+    RESCALE_LIMIT = 1e100
+    INITIAL_ACTIVITY_NOISE = 1e-3  # Less than any bump, so it only breaks ties between variables that were never bumped
+
+    def __init__(self, decay: float = 0.95, default_assignment: bool = False, seed: int = None):
+        assert 0 < decay < 1
+        self.decay = decay
+        self.default_assignment = default_assignment
+        self.random = Random(seed) if seed is not None else None
+        self.bump_amount = 1.0
+        self.activity = [0.0]
+        self.order_heap = VariableOrderHeap(self.activity)
+
+
+    def __call__(self, cnf_formula: CNFFormula, values: Assignment) -> Tuple[int, bool]:
+        self.ensure_capacity(cnf_formula.get_num_variables())
+
+        while len(self.order_heap) > 0:
+            variable = self.order_heap.pop_max()
+            if values[variable] is None:
+                return variable, self.default_assignment
+
+        return 0, self.default_assignment  # Nothing is unassigned
+
+
+    def ensure_capacity(self, num_variables: int):
+        for variable in range(len(self.activity), num_variables + 1):
+            self.activity.append(self.random.random() * VSIDS.INITIAL_ACTIVITY_NOISE if self.random is not None else 0.0)
+            self.order_heap.insert(variable)
+
+
+    def on_conflict(self, conflict_clause: CNFClause, learned_clause: CNFClause, implication_graph: ImplicationGraph):
+        self.bump_variables(learned_clause.get_all_variables())
+        self.bump_amount /= self.decay
+
+
+    def on_backjump(self, lost_literals: List[int], implication_graph: ImplicationGraph):
+        for literal in lost_literals:
+            self.ensure_capacity(literal_to_variable(literal))  # Variables may be added to the formula between searches
+            self.order_heap.insert(literal_to_variable(literal))
+
+
+    def bump_variables(self, variables: Iterable[int]):
+        activity = self.activity
+        for variable in variables:
+            self.ensure_capacity(variable)
+            activity[variable] += self.bump_amount
+            if activity[variable] > VSIDS.RESCALE_LIMIT:
+                self.rescale()
+            self.order_heap.increase(variable)
+
+
+    def rescale(self):
+        """ Scaling all activities together keeps their order, so the heap stays valid """
+        for variable in range(len(self.activity)):
+            self.activity[variable] /= VSIDS.RESCALE_LIMIT
+        self.bump_amount /= VSIDS.RESCALE_LIMIT
+
+
+class PhaseSaving(DecisionHeuristic):
+    """ Wraps another heuristic (a function like DLIS, or a DecisionHeuristic) that picks the variable, and assigns it the
+    value it had when it was last unassigned, so a backjump doesn't throw away the partial assignment it undid. Variables
+    that were never assigned get the wrapped heuristic's value.
+
+    With use_target_phase, variables first get the value they had in the target assignment - the largest assignment the
+    search reached before backjumping, since the last restart """
+
+    def __init__(self, decision_heuristic: Union[DecisionHeuristic, Callable] = None, use_target_phase: bool = False):
+        self.decision_heuristic = decision_heuristic if decision_heuristic is not None else VSIDS()
+        self.is_stateful_heuristic = isinstance(self.decision_heuristic, DecisionHeuristic)
+        self.use_target_phase = use_target_phase
+        self.saved_phases = [None]
+        self.target_phases = [None]
+        self.target_size = 0
+
+
+    def __call__(self, cnf_formula: CNFFormula, values: Assignment) -> Tuple[int, bool]:
+        variable, assignment = self.decision_heuristic(cnf_formula, values)
+        self.ensure_capacity(variable)
+
+        if self.use_target_phase and self.target_phases[variable] is not None:
+            return variable, self.target_phases[variable]
+        elif self.saved_phases[variable] is not None:
+            return variable, self.saved_phases[variable]
+        return variable, assignment
+
+
+    def ensure_capacity(self, variable: int):
+        missing = variable + 1 - len(self.saved_phases)
+        if missing > 0:
+            self.saved_phases.extend([None] * missing)
+            self.target_phases.extend([None] * missing)
+
+
+    def on_conflict(self, conflict_clause: CNFClause, learned_clause: CNFClause, implication_graph: ImplicationGraph):
+        if self.is_stateful_heuristic:
+            self.decision_heuristic.on_conflict(conflict_clause, learned_clause, implication_graph)
+
+
+    def on_backjump(self, lost_literals: List[int], implication_graph: ImplicationGraph):
+        if len(lost_literals) > 0:
+            self.ensure_capacity(max(literal_to_variable(literal) for literal in lost_literals))
+        saved_phases = self.saved_phases
+        for literal in lost_literals:
+            saved_phases[literal if literal > 0 else -literal] = literal > 0
+
+        size_before_backjump = len(implication_graph.trail) + len(lost_literals)
+        if self.use_target_phase and size_before_backjump > self.target_size:  # Rare, so copying the whole trail is fine
+            self.target_size = size_before_backjump
+            target_phases = self.target_phases
+            for literal in chain(implication_graph.trail, lost_literals):
+                self.ensure_capacity(literal_to_variable(literal))
+                target_phases[literal_to_variable(literal)] = literal > 0
+
+        if self.is_stateful_heuristic:
+            self.decision_heuristic.on_backjump(lost_literals, implication_graph)
+
+
+    def on_restart(self):
+        self.target_size = 0  # The target phases are kept, but any assignment reached after the restart replaces them
+        if self.is_stateful_heuristic:
+            self.decision_heuristic.on_restart()
@@ -0,0 +1,309 @@
+"""
+Checks a binary DRAT proof of unsatisfiability against a formula. Run from the repository root:
+---- python drat_checker.py formula.cnf proof.drat [--core core.cnf]
+"""
+from cnf_syntax import CNFFormula, CNFClause
+from utils.dimacs import read_dimacs, write_dimacs
+from utils.drat import read_drat
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+import argparse
+import sys
+
+
+class DratChecker:
+    """ A backward DRAT checker. The proof is first replayed forwards up to its empty clause, without checking anything.
+    Then it's walked backwards, undoing every line, and only the lemmas that are marked core - the empty clause, and then
+    whatever the checks of core lemmas used - are checked: each must be RUP (assigning its negation and propagating
+    leads to a conflict) or RAT on its first literal, against the clauses that existed when it was added. So lemmas that
+    the refutation doesn't need are never checked, and what's left marked is a trimmed proof and an UNSAT core.
+
+    Propagation is core-first: the core clauses are propagated to a fixpoint before any other clause gets a turn, so the
+    conflicts tend to be found through clauses that are already core, and fewer new clauses become core """
+
+    def __init__(self, clauses: Iterable[Iterable[int]]):
+        self.clauses = list()  # All the clauses and lemmas, by id. The formula's come first
+        self.pivots = list()  # The first literal of each, as propagation reorders the literals of the watched ones
+        self.is_active = list()
+        self.is_core = list()
+        for literals in clauses:
+            self.new_clause(literals)
+        self.num_formula_clauses = len(self.clauses)
+        self.steps = list()  # (is_deletion, clause id) for each proof line, up to the empty clause
+        self.active_ids_by_key = dict()  # For deletions, which name a clause by its literals
+        self.core_watches = dict()  # Literal to the ids of the core clauses watching it
+        self.other_watches = dict()
+        self.active_units = list()
+        self.active_empty_clauses = list()
+        self.true_literals = set()
+        self.trail = list()
+        self.reasons = dict()  # Variable to the id of the clause that propagated it
+        self.num_lemmas = 0
+        self.num_checked_lemmas = 0
+        self.failed_lemma = None
+        for clause_id in range(self.num_formula_clauses):
+            self.activate(clause_id)
+
+
+    def new_clause(self, literals: Iterable[int]) -> int:
+        self.clauses.append(list(dict.fromkeys(literals)))
+        self.pivots.append(self.clauses[-1][0] if len(self.clauses[-1]) > 0 else 0)
+        self.is_active.append(False)
+        self.is_core.append(False)
+        return len(self.clauses) - 1
+
+
+    def activate(self, clause_id: int):
+        literals = self.clauses[clause_id]
+        self.is_active[clause_id] = True
+        self.active_ids_by_key.setdefault(frozenset(literals), list()).append(clause_id)
+        if len(literals) == 0:
+            self.active_empty_clauses.append(clause_id)
+        elif len(literals) == 1:
+            self.active_units.append(clause_id)
+        else:
+            watches = self.core_watches if self.is_core[clause_id] else self.other_watches
+            watches.setdefault(literals[0], list()).append(clause_id)
+            watches.setdefault(literals[1], list()).append(clause_id)
+
+
+    def deactivate(self, clause_id: int):
+        literals = self.clauses[clause_id]
+        self.is_active[clause_id] = False
+        self.active_ids_by_key[frozenset(literals)].remove(clause_id)
+        if len(literals) == 0:
+            self.active_empty_clauses.remove(clause_id)
+        elif len(literals) == 1:
+            self.active_units.remove(clause_id)
+        else:
+            watches = self.core_watches if self.is_core[clause_id] else self.other_watches
+            watches[literals[0]].remove(clause_id)
+            watches[literals[1]].remove(clause_id)
+
+
+    def mark_core(self, clause_id: int):
+        if self.is_core[clause_id]:
+            return
+        literals = self.clauses[clause_id]
+        if self.is_active[clause_id] and len(literals) >= 2:
+            self.deactivate(clause_id)
+            self.is_core[clause_id] = True
+            self.activate(clause_id)
+        else:
+            self.is_core[clause_id] = True
+
+
+    def read_proof(self, proof_lines: Iterable[Tuple[bool, List[int]]]) -> bool:
+        """ Replays the proof forwards, up to its first empty clause. Deleting a clause that doesn't exist is ignored, as
+        drat-trim does. Returns whether an empty clause was found """
+        for is_deletion, literals in proof_lines:
+            if is_deletion:
+                active_ids = self.active_ids_by_key.get(frozenset(literals))
+                if active_ids:
+                    clause_id = active_ids[-1]
+                    self.deactivate(clause_id)
+                    self.steps.append((True, clause_id))
+                continue
+
+            clause_id = self.new_clause(literals)
+            self.activate(clause_id)
+            self.steps.append((False, clause_id))
+            self.num_lemmas += 1
+            if len(literals) == 0:
+                self.mark_core(clause_id)
+                return True
+        return False
+
+
+    def check(self, proof_lines: Iterable[Tuple[bool, List[int]]]) -> bool:
+        """ Whether the proof refutes the formula. On failure, failed_lemma is the lemma that's neither RUP nor RAT """
+        if not self.read_proof(proof_lines):
+            return False
+
+        for is_deletion, clause_id in reversed(self.steps):
+            if is_deletion:
+                self.activate(clause_id)
+                continue
+            self.deactivate(clause_id)
+            if self.is_core[clause_id]:
+                self.num_checked_lemmas += 1
+                if not self.is_rup(self.clauses[clause_id]) and not self.is_rat(clause_id):
+                    self.failed_lemma = self.clauses[clause_id]
+                    return False
+        return True
+
+
+    def is_rup(self, literals: List[int]) -> bool:
+        """ Assigns the negation of literals and propagates. On a conflict, the clauses that led to it are marked core """
+        conflict_clause_id = None
+        for literal in literals:
+            if literal in self.true_literals:  # A tautology
+                self.undo()
+                return True
+            if -literal not in self.true_literals:
+                self.assign(-literal, None)
+
+        for is_core_pass in (True, False):  # The core units first
+            for clause_id in self.active_units:
+                if self.is_core[clause_id] == is_core_pass and conflict_clause_id is None:
+                    unit = self.clauses[clause_id][0]
+                    if -unit in self.true_literals:
+                        conflict_clause_id = clause_id
+                    elif unit not in self.true_literals:
+                        self.assign(unit, clause_id)
+        if conflict_clause_id is None and len(self.active_empty_clauses) > 0:
+            conflict_clause_id = self.active_empty_clauses[0]
+        if conflict_clause_id is None:
+            conflict_clause_id = self.propagate()
+
+        if conflict_clause_id is not None:
+            self.mark_conflict_core(conflict_clause_id)
+        self.undo()
+        return conflict_clause_id is not None
+
+
+    def is_rat(self, lemma_id: int) -> bool:
+        """ RAT on the lemma's first literal: every resolvent with a clause that contains its negation is RUP """
+        literals, pivot = self.clauses[lemma_id], self.pivots[lemma_id]
+        if len(literals) == 0:
+            return False
+        candidates = [clause_id for clause_id, clause in enumerate(self.clauses)
+                      if self.is_active[clause_id] and -pivot in clause]
+        for clause_id in candidates:
+            resolvent = literals + [literal for literal in self.clauses[clause_id] if literal != -pivot]
+            if not self.is_rup(resolvent):
+                return False
+        for clause_id in candidates:
+            self.mark_core(clause_id)
+        return True
+
+
+    def assign(self, literal: int, reason: Optional[int]):
+        self.true_literals.add(literal)
+        self.trail.append(literal)
+        if reason is not None:
+            self.reasons[abs(literal)] = reason
+
+
+    def undo(self):
+        self.true_literals.clear()
+        self.trail.clear()
+        self.reasons.clear()
+
+
+    def propagate(self) -> Optional[int]:
+        """ Unit propagation over the trail, core clauses first: a literal's other clauses are visited only once no core
+        clause has anything left to propagate. Returns the id of a conflicting clause, or None """
+        trail = self.trail
+        core_head, other_head = 0, 0
+        while True:
+            while core_head < len(trail):
+                conflict_clause_id = self.propagate_literal(self.core_watches, trail[core_head])
+                core_head += 1
+                if conflict_clause_id is not None:
+                    return conflict_clause_id
+            if other_head == len(trail):
+                return None
+            conflict_clause_id = self.propagate_literal(self.other_watches, trail[other_head])
+            other_head += 1
+            if conflict_clause_id is not None:
+                return conflict_clause_id
+
+
+    def propagate_literal(self, watches: Dict[int, List[int]], true_literal: int) -> Optional[int]:
+        """ Two watched literals, like CNFFormula.propagate_literal: each clause watches its first two literals """
+        false_literal = -true_literal
+        watch_list = watches.get(false_literal)
+        if not watch_list:
+            return None
+        true_literals, clauses = self.true_literals, self.clauses
+        kept_index = 0
+        clause_index = 0
+        conflict_clause_id = None
+
+        while clause_index < len(watch_list):
+            clause_id = watch_list[clause_index]
+            clause_index += 1
+            literals = clauses[clause_id]
+            if literals[0] == false_literal:
+                literals[0], literals[1] = literals[1], literals[0]
+            if literals[0] in true_literals:
+                watch_list[kept_index] = clause_id
+                kept_index += 1
+                continue
+
+            for literal_index in range(2, len(literals)):
+                if -literals[literal_index] not in true_literals:  # Found a replacement watch
+                    literals[1], literals[literal_index] = literals[literal_index], literals[1]
+                    watches.setdefault(literals[1], list()).append(clause_id)
+                    break
+            else:
+                watch_list[kept_index] = clause_id
+                kept_index += 1
+                if -literals[0] in true_literals:
+                    conflict_clause_id = clause_id
+                    break
+                self.assign(literals[0], clause_id)
+
+        while clause_index < len(watch_list):
+            watch_list[kept_index] = watch_list[clause_index]
+            kept_index += 1
+            clause_index += 1
+        del watch_list[kept_index:]
+        return conflict_clause_id
+
+
+    def mark_conflict_core(self, conflict_clause_id: int):
+        """ Marks the conflicting clause core, and the reasons of the literals it was falsified by, transitively """
+        self.mark_core(conflict_clause_id)
+        seen = {abs(literal) for literal in self.clauses[conflict_clause_id]}
+        for literal in reversed(self.trail):
+            variable = abs(literal)
+            if variable in seen and variable in self.reasons:
+                reason = self.reasons[variable]
+                self.mark_core(reason)
+                seen.update(abs(reason_literal) for reason_literal in self.clauses[reason])
+
+
+    def get_core_clauses(self) -> List[List[int]]:
+        """ After a successful check, the formula's clauses that the refutation used - an UNSAT core """
+        return [self.clauses[clause_id] for clause_id in range(self.num_formula_clauses) if self.is_core[clause_id]]
+
+
+    def get_core_lemmas(self) -> List[List[int]]:
+        """ After a successful check, the lemmas that the refutation used, in the proof's order - a trimmed proof """
+        return [self.clauses[clause_id] for is_deletion, clause_id in self.steps if not is_deletion and self.is_core[clause_id]]
+
+
+def check_drat(cnf_formula: CNFFormula, proof: Union[str, BinaryIO]) -> bool:
+    """ Whether the binary DRAT proof (a path, or a binary stream) refutes cnf_formula's original clauses """
+    return DratChecker(clause.literals for clause in cnf_formula.clauses).check(read_drat(proof))
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Checks a binary DRAT proof of a DIMACS CNF formula's unsatisfiability")
+    parser.add_argument("formula", help="the DIMACS CNF formula")
+    parser.add_argument("proof", help="the binary DRAT proof")
+    parser.add_argument("--core", help="write the UNSAT core the proof used here, as DIMACS CNF")
+    options = parser.parse_args(arguments)
+
+    cnf_formula = read_dimacs(options.formula)
+    checker = DratChecker(clause.literals for clause in cnf_formula.clauses)
+    if not checker.check(read_drat(options.proof)):
+        print("s NOT VERIFIED")
+        if checker.failed_lemma is not None:
+            print("c The lemma " + " ".join(map(str, checker.failed_lemma)) + " is neither RUP nor RAT")
+        else:
+            print("c The proof has no empty clause")
+        return 1
+
+    core_clauses = checker.get_core_clauses()
+    print("c " + str(checker.num_checked_lemmas) + " of " + str(checker.num_lemmas) + " lemmas checked, "
+          + str(len(core_clauses)) + " of " + str(checker.num_formula_clauses) + " clauses in the core")
+    if options.core is not None:
+        write_dimacs(CNFFormula([CNFClause(literals) for literals in core_clauses], cnf_formula.variable_table), options.core)
+    print("s VERIFIED")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,7 +33,9 @@ def lp_solver(objective: Formula, constraints: Formula):
     :return: UNSAT - if no feasible solution exist, SAT - if there is one
     """
     skeleton, sub_map = constraints.propositional_skeleton()
-    state, partial_assignment, TOMER_new_formula = sat_solver(skeleton)
+    incremental_solver = IncrementalSatSolver(skeleton)  # Keeps what it learned between the conflicts added below
+    state = incremental_solver.solve()
+    partial_assignment, TOMER_new_formula = incremental_solver.get_model(), skeleton
 
     while state != UNSAT:
 
@@ -70,14 +72,15 @@ def lp_solver(objective: Formula, constraints: Formula):
                     if len(partial_assignment.keys()) == len(skeleton.variables()):
                         return SAT, partial_assignment, TOMER_new_formula
                     else:
-                        state, partial_assignment, TOMER_new_formula = \
-                            sat_solver(skeleton, partial_model=partial_assignment)
+                        state = incremental_solver.solve(assumptions=partial_assignment)
+                        partial_assignment = incremental_solver.get_model()
                         break
 
         if not is_sat:
-            conflict = get_conflict(assignment)
-            state, partial_assignment, TOMER_new_formula = \
-                sat_solver(skeleton, partial_model=partial_assignment, conflict=conflict)
+            conflict = get_conflict(partial_assignment)
+            incremental_solver.add_formula(conflict)
+            state = incremental_solver.solve()
+            partial_assignment = incremental_solver.get_model()
 
     return state, partial_assignment, TOMER_new_formula
 
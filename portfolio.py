@@ -0,0 +1,155 @@
+from sat_solver import *
+from clause_sharing import create_clause_exchanges
+from itertools import cycle
+from queue import Empty
+import multiprocessing
+import os
+
+
+RESULT_POLL_INTERVAL = 0.1  # Seconds between checks that some worker is still alive, while waiting for results
+
+
+class PortfolioConfiguration:
+    """ How one portfolio worker runs decide. The heuristic and the restart policy are sent to the worker as they are,
+    before it starts, so each worker gets its own copy of their state """
+
+    def __init__(self, decision_heuristic=DLIS, restart_policy: RestartPolicy = None, inprocessing: bool = False):
+        self.decision_heuristic = decision_heuristic
+        self.restart_policy = restart_policy
+        self.inprocessing = inprocessing
+
+
+    def __repr__(self) -> str:
+        return "PortfolioConfiguration(" + type(self.decision_heuristic).__name__ + ", " \
+               + type(self.restart_policy).__name__ + ", inprocessing=" + str(self.inprocessing) + ")"
+
+
+def get_default_configurations(num_workers: int) -> List[PortfolioConfiguration]:
+    """ Cycles through combinations of restart policy, phase and inprocessing, with a different VSIDS seed for each
+    worker, so no two workers search in the same order """
+    variants = cycle([(LubyRestarts, False, False, False), (GlucoseRestarts, True, False, False),
+                      (LubyRestarts, False, True, True), (GlucoseRestarts, True, True, False),
+                      (LubyRestarts, True, False, True), (GlucoseRestarts, False, True, True)])
+    configurations = list()
+    for seed, (restart_policy_class, default_assignment, use_target_phase, inprocessing) in zip(range(num_workers), variants):
+        decision_heuristic = PhaseSaving(VSIDS(default_assignment=default_assignment, seed=seed if seed > 0 else None),
+                                         use_target_phase=use_target_phase)
+        configurations.append(PortfolioConfiguration(decision_heuristic, restart_policy_class(), inprocessing))
+    return configurations
+
+
+def run_portfolio_worker(worker_index: int, clauses: List[List[int]], variable_table: VariableTable, partial_model: Model,
+                         max_rounds: int, configuration: PortfolioConfiguration, clause_exchange: Optional[ClauseExchange],
+                         budget: Optional[ResourceBudget], result_queue):
+    """ Solves its own copy of the formula, and reports the result with the learned clauses, and why its budget was
+    exhausted if it was. A worker that fails still reports, so the portfolio doesn't wait for it """
+    cnf_formula = CNFFormula([CNFClause(literals) for literals in clauses], variable_table)
+    statistics = SolverStatistics()
+    try:
+        result, model, cnf_formula = decide(cnf_formula, partial_model, max_rounds=max_rounds,
+                                            decision_heuristic=configuration.decision_heuristic,
+                                            restart_policy=configuration.restart_policy,
+                                            inprocessing=configuration.inprocessing, clause_exchange=clause_exchange,
+                                            statistics=statistics, budget=budget)
+    except BaseException:
+        result_queue.put((worker_index, SAT_UNKNOWN, partial_model, [], statistics, None))
+        raise
+    exhausted_reason = budget.exhausted_reason if budget is not None else None
+    result_queue.put((worker_index, result, model, [clause.literals for clause in cnf_formula.learned_clauses], statistics,
+                      exhausted_reason))
+
+
+def portfolio_decide(cnf_formula: CNFFormula, partial_model: Model, max_rounds: int = CONTINUE_UNTIL_MODEL_FULL,
+                     configurations: List[PortfolioConfiguration] = None, num_workers: int = None, share_clauses: bool = True,
+                     max_shared_length: int = 8, max_shared_lbd: int = 2, statistics: SolverStatistics = None,
+                     budget: ResourceBudget = None) -> Tuple[str, Model, CNFFormula]:
+    """ Runs decide with every configuration at once, each in its own process, over copies of cnf_formula. The first
+    worker to find SAT or UNSAT wins, and the others are terminated. The winner's learned clauses are added to cnf_formula,
+    which is returned like decide returns it. If no worker finds an answer, the result is the first worker's SAT_UNKNOWN.
+    By default there is one configuration per CPU.
+    With share_clauses, the workers exchange their learned clauses of up to max_shared_length literals or of LBD up to
+    max_shared_lbd through shared memory, so a clause learned by one of them spares the others from learning it.
+    statistics, if given, is added the statistics of the worker whose result is returned.
+    With a budget, every worker gets what's left of it (see ResourceBudget.get_worker_budget), and the workers are stopped
+    once the budget's time runs out, its memory is exceeded or its token is cancelled, with SAT_UNKNOWN """
+    if configurations is None:
+        configurations = get_default_configurations(num_workers if num_workers is not None else os.cpu_count() or 1)
+    assert len(configurations) > 0
+    statistics = start_budget(budget, statistics)
+    worker_budget = budget.get_worker_budget() if budget is not None else None
+
+    context = multiprocessing.get_context()
+    result_queue = context.Queue()
+    clauses = [clause.literals for clause in cnf_formula.clauses]
+    shared_buffer, clause_exchanges = None, [None] * len(configurations)
+    if share_clauses and len(configurations) > 1:
+        shared_buffer, clause_exchanges = create_clause_exchanges(len(configurations), max_shared_length, max_shared_lbd)
+    workers = [context.Process(target=run_portfolio_worker, daemon=True,
+                               args=(worker_index, clauses, cnf_formula.variable_table, partial_model, max_rounds,
+                                     configuration, clause_exchanges[worker_index], worker_budget, result_queue))
+               for worker_index, configuration in enumerate(configurations)]
+    for worker in workers:
+        worker.start()
+
+    results = dict()
+    winner = None
+    try:
+        while len(results) < len(workers):
+            try:
+                worker_index, result, model, learned_clauses, worker_statistics, exhausted_reason = \
+                    result_queue.get(timeout=RESULT_POLL_INTERVAL)
+            except Empty:
+                if budget is not None and budget.is_exhausted():
+                    break
+                if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                    break  # Some worker was killed before it could report
+                continue
+            results[worker_index] = result, model, learned_clauses, worker_statistics, exhausted_reason
+            if result != SAT_UNKNOWN:
+                winner = worker_index
+                break
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+        result_queue.close()
+        if shared_buffer is not None:
+            shared_buffer.close()
+
+    if winner is None:
+        if len(results) == 0:
+            return SAT_UNKNOWN, partial_model, cnf_formula
+        winner = min(results)
+    result, model, learned_clauses, worker_statistics, exhausted_reason = results[winner]
+    if budget is not None and budget.exhausted_reason is None:
+        budget.exhausted_reason = exhausted_reason  # Set if no worker got an answer within what was left of the budget
+    if statistics is not None:
+        statistics.add(worker_statistics)
+    for literals in learned_clauses:
+        cnf_formula.add_clause(CNFClause(literals, is_learned=True))
+    return result, model, cnf_formula
+
+
+def portfolio_sat_solver(propositional_formula: Union[PropositionalFormula, EquisatisfiableFormula], partial_model=None,
+                         conflict=None, max_rounds=CONTINUE_UNTIL_MODEL_FULL, configurations: List[PortfolioConfiguration] = None,
+                         num_workers: int = None, share_clauses: bool = True, statistics: SolverStatistics = None,
+                         budget: ResourceBudget = None) -> Tuple[str, Model, EquisatisfiableFormula]:
+    """ sat_solver, with the search done by portfolio_decide. The formula is transformed and simplified once, before the
+    workers start """
+    if partial_model is None:
+        partial_model = dict()
+    statistics = start_budget(budget, statistics)
+
+    cnf_formula = get_CNFFormula(propositional_formula, conflict, statistics, budget)
+    if cnf_formula is None:
+        return SAT_UNKNOWN, partial_model, propositional_formula
+    return solve_with_preprocessing(cnf_formula, partial_model,
+                                    lambda simplified_CNFFormula: portfolio_decide(simplified_CNFFormula, partial_model,
+                                                                                   max_rounds=max_rounds,
+                                                                                   configurations=configurations,
+                                                                                   num_workers=num_workers,
+                                                                                   share_clauses=share_clauses,
+                                                                                   statistics=statistics, budget=budget),
+                                    statistics, budget)
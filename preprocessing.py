@@ -0,0 +1,255 @@
+from cnf_syntax import *
+from resource_budget import ResourceBudget
+from collections import deque
+from heapq import heapify, heappush, heappop
+from typing import Iterable, List, Optional, Set, Tuple
+
+
+class CNFPreprocessor:
+    """ Simplifies a CNFFormula before the search, keeping it equisatisfiable:
+    - Backward subsumption - a clause deletes every clause that contains it.
+    - Strengthening (self-subsuming resolution) - if C = (l|A) and D = (~l|B) where A is in B, ~l is removed from D.
+    - Bounded variable elimination - a variable is replaced by the resolvents of its clauses, if there are no more of them
+      than the clauses they replace.
+    Clauses are reached only through occurrence lists indexed by literal_to_index. The clauses removed with an eliminated
+    variable are kept, so extend_model can give the variable a value that satisfies them. Frozen variables are never
+    eliminated, e.g. the variables of a partial model. Learned clauses aren't simplified, and are kept as learned clauses
+    of the simplified formula unless they have an eliminated variable.
+    With a budget, the simplification stops once the budget is exhausted, and there's no simplified formula """
+
+    def __init__(self, cnf_formula: CNFFormula, frozen_variables: Iterable[int] = (), max_occurrences: int = 10,
+                 max_resolvent_length: int = 20, max_growth: int = 0, budget: ResourceBudget = None):
+        self.variable_table = cnf_formula.variable_table
+        self.num_variables = cnf_formula.get_num_variables()
+        self.max_occurrences = max_occurrences  # A variable is eliminated only if it has one polarity at most this often
+        self.max_resolvent_length = max_resolvent_length
+        self.max_growth = max_growth  # How many more resolvents than removed clauses an elimination may add
+        self.budget = budget
+
+        self.clauses: List[Optional[Set[int]]] = list()  # Indexed by clause index, with None for removed clauses
+        self.signatures: List[int] = list()  # A bit per variable (mod 64) of each clause, to rule out subsets quickly
+        self.occurrences = [[] for _ in range(2 * self.num_variables + 2)]  # Clause indices, removed ones dropped lazily
+        self.is_frozen = [False] * (self.num_variables + 1)
+        self.is_eliminated = [False] * (self.num_variables + 1)
+        self.elimination_stack: List[Tuple[int, List[List[int]]]] = list()  # Eliminated variables and their clauses, in order
+        self.subsumption_queue = deque()  # Clauses that were added or strengthened, and weren't used to subsume yet
+        self.touched_variables = set()  # Variables whose clauses changed since the last elimination attempt
+        self.is_unsat = False
+
+        for variable in frozen_variables:
+            self.is_frozen[variable] = True
+        for clause in cnf_formula.clauses:
+            if self.is_budget_exhausted():
+                break
+            self.add_clause(clause.literals)
+        self.learned_clauses = cnf_formula.learned_clauses
+
+
+    def add_clause(self, literals: Iterable[int]):
+        clause = set(literals)
+        if any(-literal in clause for literal in clause):  # A tautology holds in every model, and would be in both
+            return                                          # occurrence lists of its variable
+        clause_index = len(self.clauses)
+        self.clauses.append(clause)
+        self.signatures.append(self.get_signature(clause))
+        for literal in clause:
+            self.occurrences[literal_to_index(literal)].append(clause_index)
+        self.subsumption_queue.append(clause_index)
+        if len(clause) == 0:
+            self.is_unsat = True
+
+
+    def remove_clause(self, clause_index: int):
+        self.touched_variables.update(literal_to_variable(literal) for literal in self.clauses[clause_index])
+        self.clauses[clause_index] = None
+
+
+    @staticmethod
+    def get_signature(clause: Set[int]) -> int:
+        signature = 0
+        for literal in clause:
+            signature |= 1 << (literal_to_variable(literal) & 63)
+        return signature
+
+
+    def get_occurrences(self, literal: int) -> List[int]:
+        occurrence_index = literal_to_index(literal)
+        occurrences = [clause_index for clause_index in self.occurrences[occurrence_index] if self.clauses[clause_index] is not None]
+        self.occurrences[occurrence_index] = occurrences
+        return occurrences
+
+
+    def simplify(self) -> Optional[CNFFormula]:
+        """ Subsumes and strengthens until nothing changes, and then eliminates variables, cheapest first, subsuming with
+        the resolvents of each elimination. Returns the simplified formula, over the same variable table, or None if the
+        budget was exhausted before the formula was found UNSAT """
+        self.run_subsumption()
+        if not self.is_unsat and not self.is_budget_exhausted():
+            self.eliminate_variables()
+
+        if self.is_unsat:
+            return CNFFormula([CNFClause()], self.variable_table)
+        if self.budget is not None and self.budget.is_exhausted():
+            return None
+        simplified_CNFFormula = CNFFormula([CNFClause(clause) for clause in self.clauses if clause is not None], self.variable_table)
+        for clause in self.learned_clauses:  # Implied by the simplified formula, if no eliminated variable was resolved away
+            if not any(self.is_eliminated[literal_to_variable(literal)] for literal in clause.literals):
+                simplified_CNFFormula.add_clause(clause.copy())
+        return simplified_CNFFormula
+
+
+    def eliminate_variables(self):
+        elimination_heap = [(self.get_elimination_cost(variable), variable) for variable in range(1, self.num_variables + 1)
+                            if not self.is_frozen[variable]]
+        heapify(elimination_heap)
+        self.touched_variables.clear()
+
+        while len(elimination_heap) > 0 and not self.is_unsat and not self.is_budget_exhausted():
+            cost, variable = heappop(elimination_heap)
+            if self.is_eliminated[variable]:
+                continue
+            current_cost = self.get_elimination_cost(variable)
+            if current_cost > cost:  # Its clauses changed since it was pushed, so it's not the cheapest anymore
+                heappush(elimination_heap, (current_cost, variable))
+                continue
+
+            if self.eliminate_variable(variable):
+                self.run_subsumption()
+                for touched_variable in self.touched_variables:
+                    if not self.is_frozen[touched_variable] and not self.is_eliminated[touched_variable]:
+                        heappush(elimination_heap, (self.get_elimination_cost(touched_variable), touched_variable))
+            self.touched_variables.clear()
+
+
+    def run_subsumption(self):
+        while len(self.subsumption_queue) > 0 and not self.is_unsat and not self.is_budget_exhausted():
+            self.subsume_with_clause(self.subsumption_queue.popleft())
+
+
+    def is_budget_exhausted(self) -> bool:
+        return self.budget is not None and self.budget.is_exhausted_in_step()
+
+
+    def subsume_with_clause(self, clause_index: int):
+        """ Every clause that clause subsumes or strengthens has all of its variables. So it's enough to check the clauses of
+        one of them - the one with the fewest occurrences """
+        clause = self.clauses[clause_index]
+        if clause is None or len(clause) == 0:
+            return
+
+        best_literal = min(clause, key=lambda literal: len(self.occurrences[literal_to_index(literal)])
+                                                       + len(self.occurrences[literal_to_index(-literal)]))
+        signature = self.signatures[clause_index]
+
+        for literal in (best_literal, -best_literal):
+            for other_index in list(self.get_occurrences(literal)):
+                other = self.clauses[other_index]
+                if other_index == clause_index or other is None or len(other) < len(clause) \
+                        or signature & ~self.signatures[other_index] != 0:
+                    continue
+
+                removable_literal = self.get_removable_literal(clause, other)
+                if removable_literal == 0:
+                    self.remove_clause(other_index)
+                elif removable_literal is not None:
+                    self.strengthen_clause(other_index, removable_literal)
+                    if self.is_unsat:
+                        return
+
+
+    @staticmethod
+    def get_removable_literal(clause: Set[int], other: Set[int]) -> Optional[int]:
+        """ 0 if clause subsumes other. A literal of other if all of clause is in other but for that literal's negation,
+        which means the literal can be removed from other. None otherwise """
+        removable_literal = 0
+        for literal in clause:
+            if literal in other:
+                continue
+            if removable_literal == 0 and -literal in other:
+                removable_literal = -literal
+                continue
+            return None
+        return removable_literal
+
+
+    def strengthen_clause(self, clause_index: int, literal: int):
+        clause = self.clauses[clause_index]
+        clause.discard(literal)
+        self.occurrences[literal_to_index(literal)].remove(clause_index)
+        self.signatures[clause_index] = self.get_signature(clause)
+        self.touched_variables.add(literal_to_variable(literal))
+        self.subsumption_queue.append(clause_index)
+        if len(clause) == 0:
+            self.is_unsat = True
+
+
+    def get_elimination_cost(self, variable: int) -> int:
+        return len(self.get_occurrences(variable)) * len(self.get_occurrences(-variable))
+
+
+    def eliminate_variable(self, variable: int) -> bool:
+        """ Replaces the clauses of variable by their non tautological resolvents, unless there are too many of them or one
+        of them is too long """
+        positive_occurrences = self.get_occurrences(variable)
+        negative_occurrences = self.get_occurrences(-variable)
+        num_occurrences = len(positive_occurrences) + len(negative_occurrences)
+        if num_occurrences == 0 or min(len(positive_occurrences), len(negative_occurrences)) > self.max_occurrences:
+            return False
+
+        resolvents = list()
+        for positive_index in positive_occurrences:
+            for negative_index in negative_occurrences:
+                resolvent = self.resolve(self.clauses[positive_index], self.clauses[negative_index], variable)
+                if resolvent is None:
+                    continue
+                if len(resolvents) >= num_occurrences + self.max_growth or len(resolvent) > self.max_resolvent_length:
+                    return False
+                resolvents.append(resolvent)
+
+        removed_indices = list(dict.fromkeys(positive_occurrences + negative_occurrences))  # Each clause removed once
+        removed_clauses = [list(self.clauses[clause_index]) for clause_index in removed_indices]
+        self.elimination_stack.append((variable, removed_clauses))
+        self.is_eliminated[variable] = True
+        for clause_index in removed_indices:
+            self.remove_clause(clause_index)
+        for resolvent in resolvents:
+            self.add_clause(resolvent)
+        return True
+
+
+    @staticmethod
+    def resolve(positive_clause: Set[int], negative_clause: Set[int], variable: int) -> Optional[Set[int]]:
+        """ The resolvent on variable, or None if it's a tautology """
+        for literal in positive_clause:
+            if literal != variable and -literal in negative_clause:
+                return None
+        resolvent = positive_clause | negative_clause
+        resolvent.discard(variable)
+        resolvent.discard(-variable)
+        return resolvent
+
+
+    def get_eliminated_clauses(self) -> List[CNFClause]:
+        """ The clauses removed with the eliminated variables. With them, the simplified formula is equivalent to the
+        original one again, as the resolvents that replaced them are implied by them """
+        return [CNFClause(clause) for _, removed_clauses in self.elimination_stack for clause in removed_clauses]
+
+
+    def extend_model(self, model: IdModel) -> IdModel:
+        """ Turns a model of the simplified formula into a model of the original one. Variables that the model doesn't
+        assign (the simplified formula may not have them at all) get False, and then the eliminated variables, latest
+        first, get a value that satisfies the clauses removed with them """
+        model = dict(model)
+        for variable in range(1, self.num_variables + 1):
+            if variable not in model and not self.is_eliminated[variable]:
+                model[variable] = False
+
+        for variable, removed_clauses in reversed(self.elimination_stack):
+            model[variable] = False
+            for clause in removed_clauses:
+                if variable in clause and not any(model.get(literal_to_variable(literal)) == (literal > 0)
+                                                  for literal in clause if literal != variable):
+                    model[variable] = True
+                    break
+
+        return model
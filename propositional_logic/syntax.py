@@ -8,6 +8,8 @@
 from __future__ import annotations
 from typing import Mapping, Optional, Set, Tuple, Union
 
+from weakref import WeakValueDictionary
+
 from utils.logic_utils import frozen
 
 def is_variable(s: str) -> bool:
@@ -59,6 +61,10 @@ def is_binary(s: str) -> bool:
 class Formula:
     """An immutable propositional formula in tree representation.
 
+    Formulae are hash-consed: constructing a formula that equals an existing
+    one returns that same object, so equality is identity, and the hash is
+    computed once, from the root and the operands' hashes.
+
     Attributes:
         root (`str`): the constant, atomic proposition, or operator at the root
             of the formula tree.
@@ -71,9 +77,13 @@ class Formula:
     first: Optional[Formula]
     second: Optional[Formula]
 
-    def __init__(self, root: str, first: Optional[Formula] = None,
-                 second: Optional[Formula] = None) -> None:
-        """Initializes a `Formula` from its root and root operands.
+    # The unique table - maps the root and operands of every live formula to it
+    __unique_table: WeakValueDictionary = WeakValueDictionary()
+
+    def __new__(cls, root: str, first: Optional[Formula] = None,
+                second: Optional[Formula] = None) -> Formula:
+        """Returns the unique formula with the given root and root operands,
+        creating it if there is no such formula yet.
 
         Parameters:
             root: the root for the formula tree.
@@ -82,16 +92,53 @@ class Formula:
             second: the second operand to the root, if the root is a binary
                 operator.
         """
+        key = (root, first, second)
+        formula = Formula.__unique_table.get(key)
+        if formula is not None:
+            return formula
+
+        formula = super().__new__(cls)
         if is_variable(root) or is_constant(root):
             assert first is None and second is None
-            self.root = root
+            object.__setattr__(formula, 'root', root)
         elif is_unary(root):
             assert type(first) is Formula and second is None
-            self.root, self.first = root, first
+            object.__setattr__(formula, 'root', root)
+            object.__setattr__(formula, 'first', first)
         else:
             assert is_binary(root) and type(first) is Formula and \
                    type(second) is Formula
-            self.root, self.first, self.second = root, first, second
+            object.__setattr__(formula, 'root', root)
+            object.__setattr__(formula, 'first', first)
+            object.__setattr__(formula, 'second', second)
+        object.__setattr__(formula, '_hash', hash(key))
+        object.__setattr__(formula, '_repr', None)
+        Formula.__unique_table[key] = formula
+        return formula
+
+    def __init__(self, root: str, first: Optional[Formula] = None,
+                 second: Optional[Formula] = None) -> None:
+        """Initializes a `Formula` from its root and root operands. The
+        formula was already built by `__new__`, which may have returned an
+        existing formula, so there is nothing left to do.
+
+        Parameters:
+            root: the root for the formula tree.
+            first: the first operand to the root, if the root is a unary or
+                binary operator.
+            second: the second operand to the root, if the root is a binary
+                operator.
+        """
+        pass
+
+    def __reduce__(self) -> Tuple:
+        """Pickles a formula by its root and operands, so that unpickling it
+        goes through the unique table."""
+        if is_unary(self.root):
+            return Formula, (self.root, self.first)
+        elif is_binary(self.root):
+            return Formula, (self.root, self.first, self.second)
+        return Formula, (self.root,)
 
     def __eq__(self, other: object) -> bool:
         """Compares the current formula with the given one.
@@ -103,7 +150,7 @@ class Formula:
             ``True`` if the given object is a `Formula` object that equals the
             current formula, ``False`` otherwise.
         """
-        return isinstance(other, Formula) and str(self) == str(other)
+        return self is other
 
     def __ne__(self, other: object) -> bool:
         """Compares the current formula with the given one.
@@ -115,25 +162,38 @@ class Formula:
             ``True`` if the given object is not a `Formula` object or does not
             does not equal the current formula, ``False`` otherwise.
         """
-        return not self == other
+        return self is not other
 
     def __hash__(self) -> int:
-        return hash(str(self))
+        return self._hash
 
     def __repr__(self) -> str:
-        """Computes the string representation of the current formula.
+        """Computes the string representation of the current formula. It is
+        built iteratively, so deep formulae are fine, and cached.
 
         Returns:
             The standard string representation of the current formula.
         """
         # Task 1.1
-        root = self.root
-        if is_constant(root) or is_variable(root):
-            return root
-        elif is_unary(root):
-            return root + repr(self.first)
-        elif is_binary(root):
-            return "(" + repr(self.first) + root + repr(self.second) + ")"
+        if self._repr is None:
+            parts = []
+            stack = [self]
+            while len(stack) > 0:
+                item = stack.pop()
+                if type(item) is str:
+                    parts.append(item)
+                elif item._repr is not None:
+                    parts.append(item._repr)
+                elif is_constant(item.root) or is_variable(item.root):
+                    parts.append(item.root)
+                elif is_unary(item.root):
+                    parts.append(item.root)
+                    stack.append(item.first)
+                else:
+                    stack.extend((')', item.second, item.root, item.first))
+                    parts.append('(')
+            object.__setattr__(self, '_repr', ''.join(parts))
+        return self._repr
 
     def variables(self) -> Set[str]:
         """Finds all atomic propositional_logic (variables) in the current formula.
@@ -191,39 +251,80 @@ class Formula:
             the error message is a string with some human-readable content.
         """
         # Task 1.4
+        formula, end = Formula.__parse_prefix_at(s, 0)
+        if formula is None:
+            if len(s) == 0:
+                return None, "Can't parse Formula from empty string."
+            return None, "Can't parse Formula from any prefix of:" + s
+        return formula, s[end:]
 
-        if len(s) == 0:
-            return None, "Can't parse Formula from empty string."
-        if is_constant(s[0]) or (is_variable(s[0]) and (len(s) == 1 or not s[1].isalnum())):
-            return Formula(s[0]), s[1:] if len(s) > 1 else ''
-        elif is_variable(s[0]):
-            i = 1
-            while i < len(s) and s[i].isalnum():
-                i += 1
-            return Formula(s[:i]), s[i:] if len(s) > 1 else ''
-        elif is_unary(s[0]):
-            f, r = Formula.parse_prefix(s[1:])
-            if f is None:
-                return f, "Can't parse Formula from any prefix of:" + s
-            return Formula('~', f), r
-        elif s[0] == '(':
-            f1, r1 = Formula.parse_prefix(s[1:])
-            if f1 is None or len(r1) == 0 or not (is_binary(r1[0]) or is_binary(r1[:2]) or is_binary(r1[:3])):
-                return None, "Can't parse Formula from any prefix of:" + s
-            if is_binary(r1[0]):
-                op = r1[0]
-            elif is_binary(r1[:2]):
-                op = r1[:2]
-            else:
-                op = r1[:3]
-            f2, r2 = Formula.parse_prefix(r1[len(op):])
-            if f2 is None or len(r2) == 0 or r2[0] != ')':
-                return None, "Can't parse Formula from any prefix of:" + s
-            return Formula(op, f1, f2), r2[1:] if len(r2) > 0 else ''
-        return None, "Can't parse Formula from any prefix of:" + s
-
+    @staticmethod
+    def __parse_prefix_at(s: str, start: int) -> Tuple[Union[Formula, None], int]:
+        """Parses the longest formula that starts at index `start` of the
+        given string, in a single pass over it with an explicit stack instead
+        of recursion, and without slicing the string but for variable names.
 
+        Parameters:
+            s: string to parse.
+            start: index in the string to start parsing at.
 
+        Returns:
+            A pair of the parsed formula and the index right after it, or of
+            ``None`` and ``-1`` if no prefix of the string from `start` is a
+            valid formula.
+        """
+        # Each entry is '~' for a pending negation, '(' for a binary formula
+        # whose first operand is being parsed, or the pair of the first operand
+        # and the operator of a binary formula whose second operand is being
+        # parsed
+        stack = []
+        index = start
+        length = len(s)
+        while True:
+            if index >= length:
+                return None, -1
+            char = s[index]
+            if is_constant(char):
+                formula = Formula(char)
+                index += 1
+            elif is_variable(char):
+                end = index + 1
+                while end < length and s[end].isalnum():
+                    end += 1
+                formula = Formula(s[index:end])
+                index = end
+            elif is_unary(char) or char == '(':
+                stack.append(char)
+                index += 1
+                continue
+            else:
+                return None, -1
+
+            # Completes every pending formula that the parsed one completes
+            while len(stack) > 0:
+                top = stack[-1]
+                if top == '~':
+                    stack.pop()
+                    formula = Formula('~', formula)
+                elif top == '(':
+                    for operator_length in (1, 2, 3):
+                        operator = s[index:index + operator_length]
+                        if is_binary(operator):
+                            break
+                    else:
+                        return None, -1
+                    stack[-1] = (formula, operator)
+                    index += operator_length
+                    break
+                else:
+                    if index >= length or s[index] != ')':
+                        return None, -1
+                    stack.pop()
+                    first, operator = top
+                    formula = Formula(operator, first, formula)
+                    index += 1
+            else:
+                return formula, index
 
     @staticmethod
     def is_formula(s: str) -> bool:
@@ -238,8 +339,8 @@ class Formula:
         """
         # Task 1.5
 
-        f, r = Formula.parse_prefix(s)
-        return f is not None and r == ''
+        formula, end = Formula.__parse_prefix_at(s, 0)
+        return formula is not None and end == len(s)
         
     @staticmethod
     def parse(s: str) -> Formula:
@@ -251,9 +352,10 @@ class Formula:
         Returns:
             A formula whose standard string representation is the given string.
         """
-        assert Formula.is_formula(s)
         # Task 1.6
-        return Formula.parse_prefix(s)[0]
+        formula, end = Formula.__parse_prefix_at(s, 0)
+        assert formula is not None and end == len(s)
+        return formula
 
 # Optional tasks for Chapter 1
 
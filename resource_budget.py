@@ -0,0 +1,154 @@
+from solver_statistics import SolverStatistics
+from typing import Optional
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError:  # Not on Windows, where memory budgets aren't supported
+    resource = None
+
+
+BUDGET_CHECK_INTERVAL = 64  # Steps between checks of the memory. The counters, the clock and the token are checked every step
+
+# Why a budget was exhausted
+TIME_EXHAUSTED = "time"
+CONFLICTS_EXHAUSTED = "conflicts"
+PROPAGATIONS_EXHAUSTED = "propagations"
+MEMORY_EXHAUSTED = "memory"
+CANCELLED = "cancelled"
+
+
+def get_memory_mb() -> float:
+    """ The current resident memory of this process. Where that can't be read (it's read from /proc, so only on Linux), the
+    peak resident memory so far """
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_memory / (1024 * 1024) if sys.platform == "darwin" else peak_memory / 1024  # Bytes on macOS, KB elsewhere
+
+
+class CancellationToken:
+    """ Stops a solve from another thread, e.g. the one that handles a request whose deadline passed. The solver notices
+    on its next check of the budget, and returns SAT_UNKNOWN """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+    def cancel(self):
+        self.event.set()
+
+
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+
+class ResourceBudget:
+    """ Limits on a solve: seconds of wall-clock time, conflicts, propagations, and megabytes that the resident memory (of
+    the whole process) may grow by. None means no limit. A solver that exhausts its budget, or whose cancellation_token
+    was cancelled, stops and returns SAT_UNKNOWN, and exhausted_reason says why. The Tseitin transformation and the
+    preprocessing check the budget too, so a solve can stop before its search even starts.
+
+    The limits count from start, which the first solver call that gets the budget calls, so a budget passed to several
+    calls (like smt_solver's SAT calls) limits all of them together. The conflicts and propagations are those counted in
+    statistics - the caller's SolverStatistics, or a new one - which is left with what the solver did until it stopped """
+
+    def __init__(self, max_time: float = None, max_conflicts: int = None, max_propagations: int = None,
+                 max_memory_mb: float = None, cancellation_token: CancellationToken = None):
+        assert max_memory_mb is None or resource is not None, "Memory budgets aren't supported on this platform"
+        self.max_time = max_time
+        self.max_conflicts = max_conflicts
+        self.max_propagations = max_propagations
+        self.max_memory_mb = max_memory_mb
+        self.cancellation_token = cancellation_token
+        self.statistics = None
+        self.deadline = None
+        self.max_total_conflicts = None  # The limits in terms of statistics' totals, which may not have started at 0
+        self.max_total_propagations = None
+        self.start_memory_mb = None  # The memory limit is on the growth from here
+        self.num_steps = 0
+        self.exhausted_reason = None
+
+
+    @property
+    def is_started(self) -> bool:
+        return self.statistics is not None
+
+
+    def start(self, statistics: SolverStatistics = None):
+        """ Starts counting. Does nothing if already started, so calls that share a budget should share its statistics """
+        if self.is_started:
+            assert statistics is None or statistics is self.statistics, "A started budget counts in its own statistics"
+            return
+        self.statistics = statistics if statistics is not None else SolverStatistics()
+        if self.max_time is not None:
+            self.deadline = time.perf_counter() + self.max_time
+        if self.max_conflicts is not None:
+            self.max_total_conflicts = self.statistics.conflicts + self.max_conflicts
+        if self.max_propagations is not None:
+            self.max_total_propagations = self.statistics.propagations + self.max_propagations
+        if self.max_memory_mb is not None:
+            self.start_memory_mb = get_memory_mb()
+
+
+    def is_exhausted(self) -> bool:
+        """ Checks every limit. Once exhausted, a budget stays exhausted """
+        if self.exhausted_reason is None:
+            self.exhausted_reason = self.get_exhausted_counter() or self.get_exhausted_resource()
+        return self.exhausted_reason is not None
+
+
+    def is_exhausted_in_step(self) -> bool:
+        """ is_exhausted, cheap enough for every step of a loop, like a round of the search or a clause of the Tseitin
+        transformation: the memory is checked only every BUDGET_CHECK_INTERVAL steps """
+        if self.exhausted_reason is None:
+            self.num_steps += 1
+            self.exhausted_reason = self.get_exhausted_counter() or self.get_exhausted_resource(
+                is_memory_checked=self.num_steps % BUDGET_CHECK_INTERVAL == 0)
+        return self.exhausted_reason is not None
+
+
+    def get_exhausted_counter(self) -> Optional[str]:
+        if self.max_total_conflicts is not None and self.statistics.conflicts >= self.max_total_conflicts:
+            return CONFLICTS_EXHAUSTED
+        if self.max_total_propagations is not None and self.statistics.propagations >= self.max_total_propagations:
+            return PROPAGATIONS_EXHAUSTED
+        return None
+
+
+    def get_exhausted_resource(self, is_memory_checked: bool = True) -> Optional[str]:
+        if self.cancellation_token is not None and self.cancellation_token.is_cancelled():
+            return CANCELLED
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return TIME_EXHAUSTED
+        if is_memory_checked and self.max_memory_mb is not None and get_memory_mb() - self.start_memory_mb >= self.max_memory_mb:
+            return MEMORY_EXHAUSTED
+        return None
+
+
+    def get_worker_budget(self) -> "ResourceBudget":
+        """ A new budget with what's left of this one, for a parallel worker. Every worker gets all of it, so the workers
+        together may do more conflicts and propagations than this budget allows, and each may grow its own memory by
+        max_memory_mb. It has no token, as the workers are processes - their parent checks this budget's token, and
+        stops them """
+        assert self.is_started
+        worker_budget = ResourceBudget(max_memory_mb=self.max_memory_mb)
+        if self.deadline is not None:
+            worker_budget.max_time = max(self.deadline - time.perf_counter(), 0.0)
+        if self.max_total_conflicts is not None:
+            worker_budget.max_conflicts = max(self.max_total_conflicts - self.statistics.conflicts, 0)
+        if self.max_total_propagations is not None:
+            worker_budget.max_propagations = max(self.max_total_propagations - self.statistics.propagations, 0)
+        return worker_budget
+
+
+def start_budget(budget: Optional[ResourceBudget], statistics: Optional[SolverStatistics]) -> Optional[SolverStatistics]:
+    """ Starts the budget if there is one, and returns the statistics that the solver should count in - the budget's, as
+    its limits are on them """
+    if budget is None:
+        return statistics
+    budget.start(statistics)
+    return budget.statistics
@@ -0,0 +1,113 @@
+from collections import deque
+
+
+class RestartPolicy:
+    """ Decides when decide should restart, i.e. backjump to level 0 while keeping the learned clauses and the heuristic's
+    state. decide reports every conflict, and asks should_restart after handling it. The base policy never restarts """
+
+    def on_conflict(self, learned_clause_lbd: int, trail_size: int):
+        pass
+
+
+    def should_restart(self) -> bool:
+        return False
+
+
+    def on_restart(self):
+        pass
+
+
+def luby(base: float, index: int) -> float:
+    """ The index-th (from 0) element of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ... with powers of base """
+    size, sequence = 1, 0
+    while size < index + 1:
+        sequence += 1
+        size = 2 * size + 1
+
+    while size - 1 != index:
+        size = (size - 1) >> 1
+        sequence -= 1
+        index = index % size
+
+    return base ** sequence
+
+
+class LubyRestarts(RestartPolicy):
+    """ Restarts after unit_conflicts * luby(base, i) conflicts, for the i-th restart """
+
+    def __init__(self, unit_conflicts: int = 100, base: float = 2):
+        self.unit_conflicts = unit_conflicts
+        self.base = base
+        self.num_restarts = 0
+        self.conflicts_since_restart = 0
+
+
+    def on_conflict(self, learned_clause_lbd: int, trail_size: int):
+        self.conflicts_since_restart += 1
+
+
+    def should_restart(self) -> bool:
+        return self.conflicts_since_restart >= self.unit_conflicts * luby(self.base, self.num_restarts)
+
+
+    def on_restart(self):
+        self.num_restarts += 1
+        self.conflicts_since_restart = 0
+
+
+class GlucoseRestarts(RestartPolicy):
+    """ Glucose style dynamic restarts: restart when the LBD of the recently learned clauses is high compared to the
+    average of the whole search, i.e. the search stopped learning good clauses. A restart is postponed when the trail is
+    much larger than usual, as the solver might be close to a model """
+
+    def __init__(self, lbd_window_size: int = 50, margin: float = 0.8, trail_window_size: int = 5000,
+                 blocking_margin: float = 1.4, min_conflicts_to_block: int = 10000):
+        self.margin = margin
+        self.blocking_margin = blocking_margin
+        self.min_conflicts_to_block = min_conflicts_to_block
+        self.recent_lbds = deque(maxlen=lbd_window_size)
+        self.recent_lbds_sum = 0
+        self.recent_trail_sizes = deque(maxlen=trail_window_size)
+        self.recent_trail_sizes_sum = 0
+        self.num_conflicts = 0
+        self.total_lbds_sum = 0
+
+
+    def on_conflict(self, learned_clause_lbd: int, trail_size: int):
+        self.num_conflicts += 1
+        self.total_lbds_sum += learned_clause_lbd
+
+        if len(self.recent_lbds) == self.recent_lbds.maxlen:
+            self.recent_lbds_sum -= self.recent_lbds[0]
+        self.recent_lbds.append(learned_clause_lbd)
+        self.recent_lbds_sum += learned_clause_lbd
+
+        if len(self.recent_trail_sizes) == self.recent_trail_sizes.maxlen:
+            self.recent_trail_sizes_sum -= self.recent_trail_sizes[0]
+            is_trail_window_full = True
+        else:
+            is_trail_window_full = False
+        self.recent_trail_sizes.append(trail_size)
+        self.recent_trail_sizes_sum += trail_size
+
+        if self.num_conflicts > self.min_conflicts_to_block and is_trail_window_full \
+                and len(self.recent_lbds) == self.recent_lbds.maxlen \
+                and trail_size > self.blocking_margin * self.recent_trail_sizes_sum / len(self.recent_trail_sizes):
+            self.clear_recent_lbds()  # Blocks the restart
+
+
+    def should_restart(self) -> bool:
+        if len(self.recent_lbds) < self.recent_lbds.maxlen:
+            return False
+        recent_average = self.recent_lbds_sum / len(self.recent_lbds)
+        total_average = self.total_lbds_sum / self.num_conflicts
+        return recent_average * self.margin > total_average
+
+
+    def on_restart(self):
+        self.clear_recent_lbds()
+
+
+    def clear_recent_lbds(self):
+        self.recent_lbds.clear()
+        self.recent_lbds_sum = 0
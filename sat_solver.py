@@ -1,20 +1,28 @@
 from cnf_syntax import *
 from cnf_syntax import UNSAT, SAT, SAT_UNKNOWN
+from clause_sharing import ClauseExchange
+from decision_heuristics import *
+from preprocessing import *
+from restart_policies import *
+from solver_statistics import *
+from resource_budget import *
+from utils.drat import DratProofWriter
 from utils.logic_utils import fresh_variable_name_generator, __prefix_with_index_sequence_generator
 from utils.normal_forms import *
 from propositional_logic.syntax import Formula as PropositionalFormula
-from typing import Dict, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+import time
 
 
 CONTINUE_UNTIL_MODEL_FULL = -1
 
 
-def DLIS(cnf_formula: CNFFormula, model: Model) -> Tuple[str, bool]:
+def DLIS(cnf_formula: CNFFormula, values: Assignment) -> Tuple[int, bool]:
     possible_assignments = (True, False)
-    candidates = cnf_formula.get_all_variables() - set(model.keys())  # Starting with all unassigned variables
+    candidates = [variable for variable in range(1, cnf_formula.get_num_variables() + 1) if values[variable] is None]
 
-    best_candidate = ""
-    best_candidate_assignment = ""
+    best_candidate = 0
+    best_candidate_assignment = None
     best_candidate_score = -1
 
     for cur_candidate in candidates:
@@ -28,63 +36,382 @@ def DLIS(cnf_formula: CNFFormula, model: Model) -> Tuple[str, bool]:
     return best_candidate, best_candidate_assignment
 
 
-def sat_solver(propositional_formula: PropositionalFormula, partial_model=None, conflict=None, max_rounds=5) \
-        -> Tuple[str, Model, PropositionalFormula]:
+class EquisatisfiableFormula:
+    """ The formula that sat_solver returns along with its result - the clauses it solved, learned ones included, and the
+    clauses that its preprocessing eliminated, which makes it equivalent to the CNF of the input formula. It stays in CNF,
+    is converted to a PropositionalFormula only on demand, and can be passed back to sat_solver as is. Attributes of
+    PropositionalFormula (root, first, ...) are looked up on the converted formula, so callers can treat it as one """
+
+    def __init__(self, cnf_formula: CNFFormula, eliminated_clauses: List[CNFClause] = ()):
+        self.cnf_formula = cnf_formula
+        self.eliminated_clauses = list(eliminated_clauses)
+        self.__variables = None
+        self.__propositional_formula = None
+
+
+    def __repr__(self) -> str:
+        return str(CNFFormula(self.get_all_clauses(), self.cnf_formula.variable_table))
+
+
+    def __getattr__(self, name: str):
+        # Only names that a PropositionalFormula has are converted for. Private and special names raise right away, as
+        # copy and pickle look them up on an instance whose __init__ hasn't run
+        if name.startswith('_') or not (name in PropositionalFormula.__annotations__ or hasattr(PropositionalFormula, name)):
+            raise AttributeError("'" + type(self).__name__ + "' object has no attribute '" + name + "'")
+        return getattr(self.to_PropositionalFormula(), name)
+
+
+    def get_all_clauses(self) -> List[CNFClause]:
+        return self.cnf_formula.get_all_clauses() + self.eliminated_clauses
+
+
+    def variables(self) -> Set[str]:
+        if self.__variables is None:
+            variable_table = self.cnf_formula.variable_table
+            self.__variables = {variable_table.get_name(literal_to_variable(literal))
+                                for clause in self.get_all_clauses() for literal in clause.literals}
+        return self.__variables
+
+
+    def to_PropositionalFormula(self) -> PropositionalFormula:
+        if self.__propositional_formula is None:
+            all_clauses = self.get_all_clauses()
+            self.__propositional_formula = PropositionalFormula.parse(repr(self)) if len(all_clauses) > 0 else PropositionalFormula('T')
+        return self.__propositional_formula
+
+
+    def to_CNFFormula(self) -> CNFFormula:
+        """ A new CNFFormula of copies of the clauses, over the same variable table. The learned ones stay learned, so the
+        search can still delete them """
+        cnf_formula = CNFFormula([clause.copy() for clause in self.cnf_formula.clauses + self.eliminated_clauses],
+                                 self.cnf_formula.variable_table)
+        for clause in self.cnf_formula.learned_clauses:
+            cnf_formula.add_clause(clause.copy())
+        return cnf_formula
+
+
+def sat_solver(propositional_formula: Union[PropositionalFormula, EquisatisfiableFormula], partial_model=None, conflict=None,
+               max_rounds=5, decision_heuristic=DLIS, restart_policy: RestartPolicy = None, statistics: SolverStatistics = None,
+               callbacks: SolverCallbacks = None, budget: ResourceBudget = None) -> Tuple[str, Model, EquisatisfiableFormula]:
+    """ propositional_formula may also be the formula returned by a previous call, which skips the Tseitin transformation
+    and keeps what that call learned. statistics, callbacks and budget are as in decide, and statistics also get the time
+    of the Tseitin transformation and of the preprocessing, which the budget's time includes """
     if partial_model is None:
         partial_model = dict()
-
-    cnf_formula = preprocess(propositional_formula)
-    if len(cnf_formula.clauses) == 0:
-        return SAT, partial_model, propositional_formula
-    for clause in cnf_formula.clauses:
-        if len(clause) == 0:
-            return UNSAT, partial_model, propositional_formula
+    statistics = start_budget(budget, statistics)
+
+    cnf_formula = get_CNFFormula(propositional_formula, conflict, statistics, budget)
+    if cnf_formula is None:
+        return SAT_UNKNOWN, partial_model, propositional_formula
+    return solve_with_preprocessing(cnf_formula, partial_model,
+                                    lambda simplified_CNFFormula: decide(simplified_CNFFormula, partial_model, max_rounds=max_rounds,
+                                                                         decision_heuristic=decision_heuristic,
+                                                                         restart_policy=restart_policy, statistics=statistics,
+                                                                         callbacks=callbacks, budget=budget),
+                                    statistics, budget)
+
+
+def get_CNFFormula(propositional_formula: Union[PropositionalFormula, EquisatisfiableFormula], conflict=None,
+                   statistics: SolverStatistics = None, budget: ResourceBudget = None) -> Optional[CNFFormula]:
+    """ None if the budget was exhausted before the Tseitin transformation was done. The caller then returns
+    SAT_UNKNOWN along with propositional_formula itself, as there's no CNF of it to return """
+    with PhaseTimer(statistics, "tseitin_time"):
+        if isinstance(propositional_formula, EquisatisfiableFormula):
+            cnf_formula = propositional_formula.to_CNFFormula()
+        else:
+            cnf_formula = preprocess(propositional_formula, budget=budget)
+            if budget is not None and budget.is_exhausted():
+                return None
 
     if conflict is not None:
-        assert test_is_cnf(conflict)
-        conflict_CNFFormula = propositional_formula_to_CNFFormula(conflict)
+        assert is_cnf(conflict)
+        conflict_CNFFormula = propositional_formula_to_CNFFormula(conflict, cnf_formula.variable_table)
         for conflict_CNFClause in conflict_CNFFormula.clauses:
             cnf_formula.add_clause(conflict_CNFClause)
-
-    result, model, equisatisfiable_CNFFormula = decide(cnf_formula, partial_model, max_rounds=max_rounds)
-    equisatisfiable_PropositionalFormula = equisatisfiable_CNFFormula.to_PropositionalFormula()
-    return result, model, equisatisfiable_PropositionalFormula
-
-
-def decide(cnf_formula: CNFFormula, partial_model: Model, max_rounds: int = 5, decision_heuristic=DLIS) -> Tuple[str, Model, CNFFormula]:
-    implication_graph = ImplicationGraph(partial_model)
-    cnf_formula.on_backjump(implication_graph.total_model)  # Initial loading
+    return cnf_formula
+
+
+def solve_with_preprocessing(cnf_formula: CNFFormula, partial_model: Model,
+                             solve: Callable[[CNFFormula], Tuple[str, Model, CNFFormula]],
+                             statistics: SolverStatistics = None,
+                             budget: ResourceBudget = None) -> Tuple[str, Model, EquisatisfiableFormula]:
+    """ Simplifies cnf_formula, and solves what's left with solve (e.g. decide), unless the simplification already did.
+    A model of the simplified formula is extended back to cnf_formula's variables. If the budget runs out while
+    simplifying, the result is SAT_UNKNOWN and solve isn't called """
+    statistics = start_budget(budget, statistics)
+    variable_table = cnf_formula.variable_table
+    with PhaseTimer(statistics, "preprocess_time"):
+        # The partial model's variables are frozen, as decide assigns them before looking at the clauses
+        preprocessor = CNFPreprocessor(cnf_formula, frozen_variables=variable_table.model_to_ids(partial_model).keys(),
+                                       budget=budget)
+        simplified_CNFFormula = preprocessor.simplify()
+    if simplified_CNFFormula is None:  # The budget was exhausted
+        return SAT_UNKNOWN, partial_model, EquisatisfiableFormula(cnf_formula)
+    if len(simplified_CNFFormula.clauses) == 0:
+        model = variable_table.model_to_names(preprocessor.extend_model(variable_table.model_to_ids(partial_model)))
+        return SAT, model, EquisatisfiableFormula(cnf_formula)
+    for clause in simplified_CNFFormula.clauses:
+        if len(clause) == 0:
+            return UNSAT, partial_model, EquisatisfiableFormula(cnf_formula)
+
+    result, model, equisatisfiable_CNFFormula = solve(simplified_CNFFormula)
+    if result == SAT:
+        model = variable_table.model_to_names(preprocessor.extend_model(variable_table.model_to_ids(model)))
+    return result, model, EquisatisfiableFormula(equisatisfiable_CNFFormula, preprocessor.get_eliminated_clauses())
+
+
+def decide(cnf_formula: CNFFormula, partial_model: Model, max_rounds: int = 5, decision_heuristic=DLIS,
+           restart_policy: RestartPolicy = None, inprocessing: bool = False,
+           clause_exchange: ClauseExchange = None, statistics: SolverStatistics = None,
+           callbacks: SolverCallbacks = None, budget: ResourceBudget = None,
+           proof: DratProofWriter = None) -> Tuple[str, Model, CNFFormula]:
+    """ decision_heuristic is either a plain function like DLIS, or a DecisionHeuristic (e.g. VSIDS(), PhaseSaving(DLIS))
+    that is also notified about conflicts, backjumps and restarts. restart_policy (e.g. LubyRestarts(), GlucoseRestarts()) decides when to go back to level 0,
+    keeping the learned clauses and the heuristic's state. By default decide never restarts.
+    With inprocessing, failed literals and equivalent literals are looked for on level 0 before the search, and then on
+    the 1st, 2nd, 4th, 8th, ... restart.
+    With a clause_exchange, good learned clauses are exported to the solvers that share it, and theirs are imported on
+    level 0 before the search and on every restart.
+    statistics, if given, is added what the search did, and callbacks are called on its conflicts, learned clauses and
+    restarts.
+    With a budget, the search stops with SAT_UNKNOWN once the budget is exhausted, like when max_rounds run out.
+    With a proof, every learned clause and every deleted one is logged to it, and an UNSAT result ends it with the empty
+    clause, which makes it a DRAT refutation of cnf_formula's clauses as they were passed in (and of the partial model's
+    literals, as unit clauses). Inprocessing and imported clauses aren't logged, so they can't be used with a proof """
+    assert proof is None or (not inprocessing and clause_exchange is None)
+    if restart_policy is None:
+        restart_policy = RestartPolicy()
+    variable_table = cnf_formula.variable_table
+    partial_id_model = variable_table.model_to_ids(partial_model)
+    implication_graph = ImplicationGraph(cnf_formula.get_num_variables(), partial_id_model)
+    cnf_formula.load_model(implication_graph)  # Initial loading
+    statistics = start_budget(budget, statistics)
+
+    with PhaseTimer(statistics, "search_time"):
+        sat_value, _ = search(cnf_formula, implication_graph, max_rounds, decision_heuristic, restart_policy,
+                              inprocessing=inprocessing, clause_exchange=clause_exchange, statistics=statistics,
+                              callbacks=callbacks, budget=budget, proof=proof)
+    return sat_value, variable_table.model_to_names(implication_graph.total_model), cnf_formula
+
+
+def search(cnf_formula: CNFFormula, implication_graph: ImplicationGraph, max_rounds: int, decision_heuristic,
+           restart_policy: RestartPolicy, assumptions: List[int] = (), inprocessing: bool = False,
+           clause_exchange: ClauseExchange = None, statistics: SolverStatistics = None,
+           callbacks: SolverCallbacks = None, budget: ResourceBudget = None,
+           proof: DratProofWriter = None) -> Tuple[str, int]:
+    """ The CDCL loop. The assumptions are decided first, one per level, so they are undone by backjumps like any other
+    decision. Returns the result, and the assumption that was found False when deciding it, or 0 if none was.
+    A budget must have been started on statistics """
+    is_stateful_heuristic = isinstance(decision_heuristic, DecisionHeuristic)
+    on_conflict = callbacks.on_conflict if callbacks is not None else None
+    on_learn = callbacks.on_learn if callbacks is not None else None
+    on_restart = callbacks.on_restart if callbacks is not None else None
+    trail_size, phase_start_time = 0, 0.0
+    num_restarts = 0
+    next_inprocessing_restart = 1
+    if inprocessing and implication_graph.curr_decision_level == 0:
+        inprocess(cnf_formula, implication_graph)  # If it finds the formula UNSAT, the first BCP reports the conflict
+    if clause_exchange is not None and implication_graph.curr_decision_level == 0:
+        import_shared_clauses(cnf_formula, implication_graph, clause_exchange)
 
     curr_round = 0
     while curr_round < max_rounds or max_rounds == CONTINUE_UNTIL_MODEL_FULL:
         curr_round += 1
+        if budget is not None and budget.is_exhausted_in_step():
+            return SAT_UNKNOWN, 0
+        if statistics is not None:
+            trail_size, phase_start_time = len(implication_graph.trail), time.perf_counter()
         sat_value, implication_graph = BCP(cnf_formula, implication_graph)
+        if statistics is not None:
+            statistics.bcp_time += time.perf_counter() - phase_start_time
+            statistics.propagations += len(implication_graph.trail) - trail_size
 
         if sat_value == UNSAT:
+            if statistics is not None:
+                statistics.conflicts += 1
+            if on_conflict is not None:
+                on_conflict(implication_graph.conflict_clause)
             if implication_graph.curr_decision_level == 0:
+                if proof is not None:
+                    proof.add_clause(())
                 break
             else:
+                original_conflict_clause = implication_graph.conflict_clause
+                if statistics is not None:
+                    phase_start_time = time.perf_counter()
                 backjump_level, conflict_clause = analyze_conflict(implication_graph)
-                cnf_formula.add_clause(conflict_clause)
-                implication_graph.backjump_to_level(backjump_level)
-                cnf_formula.on_backjump(implication_graph.total_model)
+                if statistics is not None:
+                    statistics.analyze_time += time.perf_counter() - phase_start_time
+                    statistics.on_learn(len(conflict_clause))
+                    statistics.on_backjump(implication_graph.curr_decision_level - backjump_level)
+                if on_learn is not None:
+                    on_learn(conflict_clause)
+                if proof is not None:
+                    proof.add_clause(conflict_clause.literals)
+                restart_policy.on_conflict(conflict_clause.lbd, len(implication_graph.trail))
+                cnf_formula.on_conflict(implication_graph.analyzed_clauses)
+                if is_stateful_heuristic:
+                    decision_heuristic.on_conflict(original_conflict_clause, conflict_clause, implication_graph)
+                backjump(cnf_formula, implication_graph, backjump_level, decision_heuristic)
+                cnf_formula.add_clause(conflict_clause, implication_graph)  # Watches it so it propagates right after the backjump
+                if clause_exchange is not None:
+                    clause_exchange.export_clause(conflict_clause)
+
+                if cnf_formula.is_reduction_due():
+                    cnf_formula.reduce_learned_clauses(implication_graph, proof)
+
+                if restart_policy.should_restart():
+                    if implication_graph.curr_decision_level > 0:
+                        backjump(cnf_formula, implication_graph, 0, decision_heuristic)
+                    restart_policy.on_restart()
+                    if is_stateful_heuristic:
+                        decision_heuristic.on_restart()
+                    if statistics is not None:
+                        statistics.restarts += 1
+                    if on_restart is not None:
+                        on_restart()
+
+                    num_restarts += 1
+                    if inprocessing and num_restarts == next_inprocessing_restart:  # Ever more rarely, as it's costly
+                        next_inprocessing_restart *= 2
+                        inprocess(cnf_formula, implication_graph)
+                    if clause_exchange is not None:
+                        import_shared_clauses(cnf_formula, implication_graph, clause_exchange)
                 continue
 
-        elif sat_value == SAT:
-            if max_rounds != CONTINUE_UNTIL_MODEL_FULL or cnf_formula.get_all_variables().issubset(implication_graph.total_model.keys()):
-                break
+        elif sat_value == SAT and implication_graph.curr_decision_level >= len(assumptions):
+            break  # All variables are assigned, no clause is UNSAT, and every assumption was checked
+
+        if implication_graph.curr_decision_level < len(assumptions):
+            assumption = assumptions[implication_graph.curr_decision_level]
+            assumption_value = literal_value(assumption, implication_graph.value)
+            if assumption_value is False:
+                return UNSAT, assumption
+            elif assumption_value is True:  # Still gets its own level, so level i+1 always belongs to assumptions[i]
+                implication_graph.new_decision_level()
+            else:
+                implication_graph.add_decision(literal_to_variable(assumption), assumption > 0)
+                if statistics is not None:
+                    statistics.decisions += 1
+        else:
+            chosen_variable, chosen_assignment = decision_heuristic(cnf_formula, implication_graph.value)
+            implication_graph.add_decision(chosen_variable, chosen_assignment)  # Propagated by the next BCP
+            if statistics is not None:
+                statistics.decisions += 1
+    else:
+        return SAT_UNKNOWN, 0  # The rounds ran out, maybe right after a conflict that was already handled
+
+    return sat_value, 0
+
+
+def backjump(cnf_formula: CNFFormula, implication_graph: ImplicationGraph, level: int, decision_heuristic):
+    lost_literals = implication_graph.backjump_to_level(level)
+    cnf_formula.on_backjump(implication_graph)
+    if isinstance(decision_heuristic, DecisionHeuristic):
+        decision_heuristic.on_backjump(lost_literals, implication_graph)
+
+
+def import_shared_clauses(cnf_formula: CNFFormula, implication_graph: ImplicationGraph, clause_exchange: ClauseExchange):
+    """ On level 0, so an imported clause that is unit or UNSAT there is handled like a learned one """
+    assert implication_graph.curr_decision_level == 0
+    for clause in clause_exchange.import_clauses():
+        cnf_formula.add_clause(clause, implication_graph)
+
+
+class IncrementalSatSolver:
+    """ A solver that keeps its formula, learned clauses and heuristic state between calls to solve, so a DPLL(T) loop can
+    add theory lemmas with add_clause / add_formula and re-solve without starting over. solve takes assumptions - a
+    partial model that holds for this call only. When they can't hold, get_failed_assumptions returns the part of them
+    that the formula contradicts.
+
+    Between calls the solver stays on level 0, where the clauses are added """
+
+    def __init__(self, propositional_formula: PropositionalFormula = None, decision_heuristic=None,
+                 restart_policy: RestartPolicy = None, inprocessing: bool = False, clause_exchange: ClauseExchange = None,
+                 statistics: SolverStatistics = None, callbacks: SolverCallbacks = None):
+        self.cnf_formula = CNFFormula(list())
+        self.implication_graph = ImplicationGraph()
+        self.decision_heuristic = decision_heuristic if decision_heuristic is not None else PhaseSaving(VSIDS())
+        self.restart_policy = restart_policy if restart_policy is not None else LubyRestarts()
+        self.inprocessing = inprocessing  # See decide
+        self.clause_exchange = clause_exchange  # See decide
+        self.statistics = statistics  # See decide. Sums up all the calls to solve
+        self.callbacks = callbacks
+        self.is_unsat = False  # The formula itself is UNSAT, under any assumptions
+        self.model = dict()
+        self.failed_assumptions = dict()
+
+        if propositional_formula is not None:
+            self.add_formula(propositional_formula)
+
+
+    @property
+    def variable_table(self) -> VariableTable:
+        return self.cnf_formula.variable_table
+
+
+    def add_formula(self, propositional_formula: PropositionalFormula):
+        """ Conjoins a formula to the solver's formula, through a Tseitin transformation if it's not in CNF """
+        with PhaseTimer(self.statistics, "tseitin_time"):
+            cnf_formula = preprocess(propositional_formula, self.variable_table)
+        for clause in cnf_formula.clauses:
+            self.add_clause(clause)
+
+
+    def add_clause(self, clause: CNFClause):
+        """ clause is over the ids of variable_table """
+        self.cnf_formula.add_clause(clause, self.implication_graph)
+
+
+    def solve(self, assumptions: Model = None, max_rounds: int = CONTINUE_UNTIL_MODEL_FULL,
+              budget: ResourceBudget = None) -> str:
+        """ Returns SAT, UNSAT, or SAT_UNKNOWN if max_rounds ran out or the budget was exhausted (see decide). On SAT the
+        model is kept for get_model, and on SAT_UNKNOWN the partial model the search stopped with """
+        self.model = dict()
+        self.failed_assumptions = dict()
+        if self.is_unsat:
+            return UNSAT
+
+        assumption_literals = [assignment_to_literal(variable, assignment)
+                               for variable, assignment in self.variable_table.model_to_ids(assumptions or dict()).items()]
+        self.implication_graph.ensure_capacity(self.cnf_formula.get_num_variables())
+        self.cnf_formula.ensure_capacity(self.cnf_formula.get_num_variables())
+
+        statistics = start_budget(budget, self.statistics)
+        with PhaseTimer(statistics, "search_time"):
+            sat_value, failed_assumption = search(self.cnf_formula, self.implication_graph, max_rounds, self.decision_heuristic,
+                                                  self.restart_policy, assumption_literals, self.inprocessing,
+                                                  self.clause_exchange, statistics, self.callbacks, budget)
+
+        if sat_value != UNSAT:
+            self.model = self.variable_table.model_to_names(self.implication_graph.total_model)
+        elif failed_assumption != 0:
+            failed_literals = self.implication_graph.get_implying_decisions(-failed_assumption) + [failed_assumption]
+            self.failed_assumptions = self.variable_table.model_to_names({literal_to_variable(literal): literal > 0
+                                                                          for literal in failed_literals})
+        elif sat_value == UNSAT:
+            self.is_unsat = True
+
+        if self.implication_graph.curr_decision_level > 0:
+            backjump(self.cnf_formula, self.implication_graph, 0, self.decision_heuristic)
+        return sat_value
 
-        chosen_variable, chosen_assignment = decision_heuristic(cnf_formula, implication_graph.total_model)
-        implication_graph.add_decision(chosen_variable, chosen_assignment)
-        cnf_formula.update_with_new_assignment(chosen_variable, chosen_assignment, implication_graph.total_model)
 
-    return sat_value, implication_graph.total_model, cnf_formula
+    def get_model(self) -> Model:
+        return self.model
+
+
+    def get_failed_assumptions(self) -> Model:
+        """ After solve returned UNSAT under assumptions, the assumptions that the formula contradicts. Empty if the formula
+        is UNSAT by itself """
+        return self.failed_assumptions
 
 
 # region Pre-processing
 
-def preprocess(propositional_formula: PropositionalFormula) -> CNFFormula:
-    cnf_formula = tseitin_transformation(propositional_formula)
+def preprocess(propositional_formula: PropositionalFormula, variable_table: VariableTable = None,
+               budget: ResourceBudget = None) -> CNFFormula:
+    cnf_formula = tseitin_transformation(propositional_formula, variable_table, budget)
 
     new_clauses = list()
 
@@ -93,85 +420,328 @@ def preprocess(propositional_formula: PropositionalFormula) -> CNFFormula:
             continue
         new_clauses.append(clause)
 
-    return CNFFormula(new_clauses)
+    return CNFFormula(new_clauses, cnf_formula.variable_table)
 
 
 def is_trivial_clause(cnf_clause: CNFClause) -> bool:
-    intersection = cnf_clause.positive_literals & cnf_clause.negative_literals
-    return len(intersection) != 0
+    return cnf_clause.is_tautology()
 
 
 # region Tseitin transformation
 
-def tseitin_transformation(propositional_formula: PropositionalFormula) -> CNFFormula:
-    if test_is_cnf(propositional_formula):
-        return propositional_formula_to_CNFFormula(propositional_formula)
-    nnf_formula = to_nnf(propositional_formula)  # Simplifying assumption - no cases like: ~~~~~~~~~p<->q
-    representations = give_representation_to_sub_formulae(nnf_formula)
-
-    p_g = representations[nnf_formula]
-    first_clause = CNFClause(positive_literals={p_g.root})
-    clauses = [first_clause]
-
-    for sub_formula, rep in representations.items():
-        if is_literal(sub_formula):
+POSITIVE = 1  # Sub formula polarities, as bits - a sub formula can appear both positively and negatively
+NEGATIVE = 2
+BOTH_POLARITIES = POSITIVE | NEGATIVE
+
+# For each binary operator, the clauses of t -> (a op b), and of (a op b) -> t
+POSITIVE_DEFINITIONS = {
+    '&': lambda t, a, b: [[-t, a], [-t, b]],
+    '|': lambda t, a, b: [[-t, a, b]],
+    '->': lambda t, a, b: [[-t, -a, b]],
+    '<->': lambda t, a, b: [[-t, -a, b], [-t, a, -b]],
+    '+': lambda t, a, b: [[-t, a, b], [-t, -a, -b]],
+    '-&': lambda t, a, b: [[-t, -a, -b]],
+    '-|': lambda t, a, b: [[-t, -a], [-t, -b]],
+}
+NEGATIVE_DEFINITIONS = {
+    '&': lambda t, a, b: [[t, -a, -b]],
+    '|': lambda t, a, b: [[t, -a], [t, -b]],
+    '->': lambda t, a, b: [[t, a], [t, -b]],
+    '<->': lambda t, a, b: [[t, a, b], [t, -a, -b]],
+    '+': lambda t, a, b: [[t, a, -b], [t, -a, b]],
+    '-&': lambda t, a, b: [[t, a], [t, b]],
+    '-|': lambda t, a, b: [[t, a, b]],
+}
+
+
+def flip_polarity(polarity: int) -> int:
+    return ((polarity & POSITIVE) << 1) | ((polarity & NEGATIVE) >> 1)
+
+
+def get_operands_polarities(root: str, polarity: int) -> Tuple[int, int]:
+    if root in ('&', '|'):
+        return polarity, polarity
+    elif root == '->':
+        return flip_polarity(polarity), polarity
+    elif root in ('-&', '-|'):
+        return flip_polarity(polarity), flip_polarity(polarity)
+    return BOTH_POLARITIES, BOTH_POLARITIES  # '<->' and '+' need both directions of their operands
+
+
+def tseitin_transformation(propositional_formula: PropositionalFormula, variable_table: VariableTable = None,
+                           budget: ResourceBudget = None) -> CNFFormula:
+    """ Plaisted-Greenbaum encoding: every binary sub formula gets a new variable t, but only the direction of t <-> (a op b)
+    that the sub formula's polarity needs - t -> (a op b) if it appears positively, (a op b) -> t if negatively. Negations
+    just negate their operand's literal. Identical sub formulae are encoded once, and the clauses are emitted straight
+    into the CNFFormula. The result is equisatisfiable, and its models satisfy the formula.
+    With a budget, it stops once the budget is exhausted, and then the result is missing clauses - the caller has to
+    check the budget before using it """
+    if variable_table is None:
+        variable_table = VariableTable()
+    if is_cnf(propositional_formula):
+        return propositional_formula_to_CNFFormula(propositional_formula, variable_table, budget)
+
+    sub_formulae = get_sub_formulae_in_post_order(propositional_formula)
+    for sub_formula in sub_formulae:
+        if is_variable(sub_formula.root):
+            variable_table.add_variable(sub_formula.root)
+    rep_names = (name for name in __prefix_with_index_sequence_generator('t') if name not in variable_table)
+
+    polarities = {propositional_formula: POSITIVE}
+    for sub_formula in reversed(sub_formulae):  # Every sub formula comes before its operands
+        if budget is not None and budget.is_exhausted_in_step():
+            return CNFFormula(list(), variable_table)
+        polarity = polarities[sub_formula]
+        if is_unary(sub_formula.root):
+            polarities[sub_formula.first] = polarities.get(sub_formula.first, 0) | flip_polarity(polarity)
+        elif is_binary(sub_formula.root):
+            first_polarity, second_polarity = get_operands_polarities(sub_formula.root, polarity)
+            polarities[sub_formula.first] = polarities.get(sub_formula.first, 0) | first_polarity
+            polarities[sub_formula.second] = polarities.get(sub_formula.second, 0) | second_polarity
+
+    literals = dict()
+    clauses = list()
+    for sub_formula in sub_formulae:  # Every sub formula comes after its operands
+        if budget is not None and budget.is_exhausted_in_step():
+            return CNFFormula(list(), variable_table)
+        root = sub_formula.root
+        if is_variable(root):
+            literals[sub_formula] = variable_table.get_id(root)
+        elif is_unary(root):
+            literals[sub_formula] = -literals[sub_formula.first]
+        elif is_constant(root):
+            rep = variable_table.add_variable(next(rep_names))
+            clauses.append(CNFClause([rep if root == 'T' else -rep]))
+            literals[sub_formula] = rep
+        else:
+            rep = variable_table.add_variable(next(rep_names))
+            first_literal, second_literal = literals[sub_formula.first], literals[sub_formula.second]
+            definitions = list()
+            if polarities[sub_formula] & POSITIVE:
+                definitions += POSITIVE_DEFINITIONS[root](rep, first_literal, second_literal)
+            if polarities[sub_formula] & NEGATIVE:
+                definitions += NEGATIVE_DEFINITIONS[root](rep, first_literal, second_literal)
+            clauses += [CNFClause(definition) for definition in definitions]
+            literals[sub_formula] = rep
+
+    clauses.append(CNFClause([literals[propositional_formula]]))
+    return CNFFormula(clauses, variable_table)
+
+
+def get_sub_formulae_in_post_order(propositional_formula: PropositionalFormula) -> List[PropositionalFormula]:
+    """ Each distinct sub formula once, after all of its operands. Iterative, so deep formulae are fine """
+    post_order = list()
+    visited = set()
+    stack = [(propositional_formula, False)]
+
+    while len(stack) > 0:
+        sub_formula, is_operands_done = stack.pop()
+        if is_operands_done:
+            post_order.append(sub_formula)
+            continue
+        if sub_formula in visited:
             continue
+        visited.add(sub_formula)
+        stack.append((sub_formula, True))
+        if is_binary(sub_formula.root):
+            stack.append((sub_formula.second, False))
+        if is_unary(sub_formula.root) or is_binary(sub_formula.root):
+            stack.append((sub_formula.first, False))
 
-        first_repped = representations[sub_formula.first]
-        second_repped = representations[sub_formula.second]
-        sub_formula_repped = PropositionalFormula(sub_formula.root, first_repped, second_repped)
-        binding_formula = PropositionalFormula('<->', rep, sub_formula_repped)
-        binding_formula_in_cnf_form = to_cnf(binding_formula)
-        binding_CNFFormula = propositional_formula_to_CNFFormula(binding_formula_in_cnf_form)
-        clauses += binding_CNFFormula.clauses
+    return post_order
 
-    return CNFFormula(clauses)
+# endregion
+
+# endregion
 
 
-def give_representation_to_sub_formulae(propositional_formula: PropositionalFormula) -> Dict[PropositionalFormula, PropositionalFormula]:
-    all_sub_formulae = find_closure(propositional_formula)
-    rep_generator = __prefix_with_index_sequence_generator('t')
-    representation = dict()
+# region In-processing
+
+def inprocess(cnf_formula: CNFFormula, implication_graph: ImplicationGraph) -> bool:
+    """ Simplifies the clauses on level 0, between searches or on a restart: probes for failed literals, and substitutes
+    equivalent literals. Returns False if the formula was found UNSAT, in which case the conflict is left in
+    cnf_formula.conflict_clause for the next BCP """
+    assert implication_graph.curr_decision_level == 0
+    if not propagate_on_level_zero(cnf_formula, implication_graph):
+        return False
+    if not probe_literals(cnf_formula, implication_graph):
+        return False
+    return substitute_equivalent_literals(cnf_formula, implication_graph)
+
+
+def propagate_on_level_zero(cnf_formula: CNFFormula, implication_graph: ImplicationGraph) -> bool:
+    conflict_clause = cnf_formula.propagate(implication_graph)
+    if conflict_clause is not None:
+        cnf_formula.conflict_clause = conflict_clause
+        return False
+    return True
+
+
+def get_binary_implications(cnf_formula: CNFFormula, implication_graph: ImplicationGraph) -> List[List[int]]:
+    """ The binary implication graph of the clauses that are binary on level 0: (a|b) gives the edges ~a -> b and ~b -> a.
+    Indexed by literal_to_index """
+    values = implication_graph.value
+    implications = [[] for _ in range(2 * cnf_formula.get_num_variables() + 2)]
+    for clause in cnf_formula.get_all_clauses():
+        if len(clause.literals) == 2 and values[literal_to_variable(clause.literals[0])] is None \
+                and values[literal_to_variable(clause.literals[1])] is None:
+            first_literal, second_literal = clause.literals
+            implications[literal_to_index(-first_literal)].append(second_literal)
+            implications[literal_to_index(-second_literal)].append(first_literal)
+    return implications
+
+
+def probe_literals(cnf_formula: CNFFormula, implication_graph: ImplicationGraph) -> bool:
+    """ Failed literal probing: decides a literal on level 1 and propagates it. If that fails, the conflict is learned as
+    usual, and asserts the literal's negation on level 0. If both a literal and its negation imply some literal, it's a
+    unit. Only the roots of the binary implication graph are probed, as anything a root implies is found by probing it """
+    implications = get_binary_implications(cnf_formula, implication_graph)
+    has_incoming_implications = [False] * len(implications)
+    for implied_literals in implications:
+        for literal in implied_literals:
+            has_incoming_implications[literal_to_index(literal)] = True
+
+    values = implication_graph.value
+    for variable in range(1, cnf_formula.get_num_variables() + 1):
+        for root in (variable, -variable):
+            if values[variable] is not None or has_incoming_implications[literal_to_index(root)] \
+                    or len(implications[literal_to_index(root)]) == 0:
+                continue
 
-    for sub_formula in all_sub_formulae:
-        representation[sub_formula] = sub_formula if is_literal(sub_formula) else PropositionalFormula(next(rep_generator))
+            implied_by_root = probe_literal(cnf_formula, implication_graph, root)
+            if implied_by_root is None or values[variable] is not None:  # A failed literal, or a new unit that assigned it
+                if not propagate_on_level_zero(cnf_formula, implication_graph):
+                    return False
+                continue
 
-    return representation
+            # Units found by lifting aren't implied by the formula alone if level 0 holds a partial model, so they're skipped
+            if implication_graph.is_partial_model_on_level_zero:
+                continue
+            implied_by_negation = probe_literal(cnf_formula, implication_graph, -root)
+            if implied_by_negation is not None:
+                for literal in implied_by_root & implied_by_negation:
+                    cnf_formula.add_clause(CNFClause([literal], is_learned=True), implication_graph)
+            if not propagate_on_level_zero(cnf_formula, implication_graph):
+                return False
+
+    return True
+
+
+def probe_literal(cnf_formula: CNFFormula, implication_graph: ImplicationGraph, literal: int) -> Optional[Set[int]]:
+    """ Returns the literals that literal implies, or None if it failed - then the learned clause is already added """
+    implication_graph.add_decision(literal_to_variable(literal), literal > 0)
+    conflict_clause = cnf_formula.propagate(implication_graph)
+
+    if conflict_clause is None:
+        implied_literals = set(implication_graph.get_level_literals(1))
+        backjump(cnf_formula, implication_graph, 0, None)
+        return implied_literals
+
+    implication_graph.conflict_clause = conflict_clause
+    _, learned_clause = analyze_conflict(implication_graph)
+    backjump(cnf_formula, implication_graph, 0, None)
+    cnf_formula.add_clause(learned_clause, implication_graph)
+    return None
+
+
+def find_equivalent_literals(implications: List[List[int]], implication_graph: ImplicationGraph) -> Optional[List[int]]:
+    """ Tarjan's algorithm (iterative) over the binary implication graph. The literals of a strongly connected component
+    are all equivalent, and are represented by the one with the smallest variable. Returns the representative literal of
+    each variable, or None if a literal is equivalent to its negation """
+    num_variables = len(implications) // 2 - 1
+    representatives = list(range(num_variables + 1))
+    discovery_indices = [-1] * len(implications)
+    low_links = [0] * len(implications)
+    is_on_stack = [False] * len(implications)
+    component_stack = list()
+    next_discovery_index = 0
+
+    for start_variable in range(1, num_variables + 1):
+        for start_literal in (start_variable, -start_variable):
+            if discovery_indices[literal_to_index(start_literal)] >= 0 \
+                    or implication_graph.value[start_variable] is not None:
+                continue
 
-# endregion
+            dfs_stack = [(start_literal, 0)]  # Each literal with the index of its next edge to visit
+            while len(dfs_stack) > 0:
+                literal, edge_index = dfs_stack.pop()
+                literal_index = literal_to_index(literal)
+                if edge_index == 0:
+                    discovery_indices[literal_index] = low_links[literal_index] = next_discovery_index
+                    next_discovery_index += 1
+                    component_stack.append(literal)
+                    is_on_stack[literal_index] = True
+
+                implied_literals = implications[literal_index]
+                while edge_index < len(implied_literals):
+                    implied_index = literal_to_index(implied_literals[edge_index])
+                    if discovery_indices[implied_index] < 0:
+                        break
+                    if is_on_stack[implied_index]:
+                        low_links[literal_index] = min(low_links[literal_index], discovery_indices[implied_index])
+                    edge_index += 1
+
+                if edge_index < len(implied_literals):  # Visit the implied literal first, and then come back
+                    dfs_stack.append((literal, edge_index + 1))
+                    dfs_stack.append((implied_literals[edge_index], 0))
+                    continue
+
+                if len(dfs_stack) > 0:
+                    parent_index = literal_to_index(dfs_stack[-1][0])
+                    low_links[parent_index] = min(low_links[parent_index], low_links[literal_index])
+
+                if low_links[literal_index] == discovery_indices[literal_index]:
+                    component = list()
+                    while True:
+                        component_literal = component_stack.pop()
+                        is_on_stack[literal_to_index(component_literal)] = False
+                        component.append(component_literal)
+                        if component_literal == literal:
+                            break
+                    component_literals = set(component)
+                    if any(-component_literal in component_literals for component_literal in component):
+                        return None
+                    representative = min(component, key=literal_to_variable)
+                    for component_literal in component:
+                        if component_literal > 0:
+                            representatives[component_literal] = representative
+                        else:
+                            representatives[-component_literal] = -representative
+
+    return representatives
+
+
+def substitute_equivalent_literals(cnf_formula: CNFFormula, implication_graph: ImplicationGraph) -> bool:
+    implications = get_binary_implications(cnf_formula, implication_graph)
+    representatives = find_equivalent_literals(implications, implication_graph)
+    if representatives is None:
+        cnf_formula.add_clause(CNFClause(is_learned=True), implication_graph)  # The empty clause
+        return False
+    if all(representatives[variable] == variable for variable in range(1, len(representatives))):
+        return True
+
+    cnf_formula.substitute_literals(representatives, implication_graph)
+    return propagate_on_level_zero(cnf_formula, implication_graph)
 
 # endregion
 
 
 def BCP(cnf_formula: CNFFormula, implication_graph: ImplicationGraph):
-    result = cnf_formula.last_result
-
-    if result in [SAT, SAT_UNKNOWN]:
-        return result, implication_graph
+    conflict_clause = cnf_formula.propagate(implication_graph)
 
-    elif result[0] == UNSAT:
-        implication_graph.conflict_clause = result[1]
+    if conflict_clause is not None:
+        implication_graph.conflict_clause = conflict_clause
         return UNSAT, implication_graph
 
-    else:  # We got an inferred assignment
-        variable, assignment, causing_clause = result
-        implication_graph.add_inference(variable, assignment, causing_clause)
-        cnf_formula.update_with_new_assignment(variable, assignment, implication_graph.total_model)
-        return BCP(cnf_formula, implication_graph)  # Return result of BCP on the model that includes the inference
+    elif len(implication_graph.trail) >= cnf_formula.get_num_variables():
+        return SAT, implication_graph
+
+    return SAT_UNKNOWN, implication_graph
 
 
 def analyze_conflict(implication_graph: ImplicationGraph) -> Tuple[int, CNFClause]:
     conflict_clause = implication_graph.learn_conflict_clause()
-
-    decision_levels_of_clause_vars = {implication_graph.get_decision_level_of_variable(variable) for variable in conflict_clause.get_all_variables()}
-
-    # Need to return the second highest decision level that appears in the conflict clause, or level 0, if it only has 1 decision level
-    if len(decision_levels_of_clause_vars) < 2:
-        return 0, conflict_clause
-
-    decision_levels_of_clause_vars_sorted = sorted(list(decision_levels_of_clause_vars))
-    backjump_level = decision_levels_of_clause_vars_sorted[-2]
+    backjump_level = implication_graph.get_backjump_level(conflict_clause)
 
     implication_graph.conflict_clause = None
     return backjump_level, conflict_clause
-
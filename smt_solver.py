@@ -1,47 +1,87 @@
 from sat_solver import *
+from portfolio import portfolio_sat_solver
 from first_order_logic.syntax import Formula as FO_Formula
 from first_order_logic.syntax import *
 from propositional_logic.syntax import Formula as PropositionalFormula
 from disjoint_set_tree import *
 
 
-def smt_solver(formula: FO_Formula) -> Tuple[str, Model]:
+def smt_solver(formula: FO_Formula, num_workers: int = 1, max_rounds: int = 5, statistics: SolverStatistics = None,
+               callbacks: SolverCallbacks = None, budget: ResourceBudget = None) -> Tuple[str, Model]:
+    """ The skeleton stays in one incremental solver, so every congruence conflict is added to it as a lemma, and the
+    next solve keeps everything learned so far. The skeleton is solved max_rounds at a time - when the partial model is
+    consistent with the theory, the equalities and inequalities it implies (see t_propagate) are added as lemmas too, so
+    the solver propagates them from then on. With more than one worker, each skeleton is solved by a portfolio
+    instead, which gets the formula it returned last time along with the new lemma. statistics and callbacks are as in
+    decide, for the SAT solving of the skeleton (callbacks only for the incremental solver). A budget limits all the SAT
+    calls together, and is also checked after every congruence check - once it's exhausted the result is SAT_UNKNOWN """
+    statistics = start_budget(budget, statistics)
     skeleton, substitution_map = formula.propositional_skeleton()
-    state, model_over_updated_skeleton, updated_skeleton = sat_solver(skeleton)
-    model_over_skeleton = {var: assignment for var, assignment in model_over_updated_skeleton.items() if var in skeleton.variables()}
+    if num_workers > 1:
+        return portfolio_smt_solver(formula, skeleton, substitution_map, num_workers, statistics, budget)
 
-    while state != UNSAT:
+    skeleton_variables = skeleton.variables()
+    formula_to_skeleton = {atom: skeleton_var for skeleton_var, atom in substitution_map.items()}
+    incremental_solver = IncrementalSatSolver(skeleton, statistics=statistics, callbacks=callbacks)
+    model_over_skeleton = dict()
+    added_lemmas = set()
 
+    state = incremental_solver.solve(max_rounds=max_rounds, budget=budget)
+    while state != UNSAT:
+        model_over_skeleton = {var: assignment for var, assignment in incremental_solver.get_model().items() if var in skeleton_variables}
         model_over_formula = model_over_skeleton_to_model_over_formula(model_over_skeleton, substitution_map)
         congruence_closure_unviolated = check_congruence_closure(model_over_formula, formula)
 
         if state == SAT and congruence_closure_unviolated:
-            if updated_skeleton.variables().issubset(model_over_skeleton.keys()):
-                return state, model_over_formula
-            else:  # Try to fill the rest of the model, skip the theory for simplifying the process
-                state, model_over_updated_skeleton, updated_skeleton = \
-                    sat_solver(updated_skeleton, partial_model=model_over_skeleton, max_rounds=CONTINUE_UNTIL_MODEL_FULL)
-                model_over_skeleton = {var: assignment for var, assignment in model_over_updated_skeleton.items() if var in skeleton.variables()}
-
-        elif not congruence_closure_unviolated:
-            conflict = get_conflict(model_over_skeleton)
-            state, model_over_updated_skeleton, updated_skeleton = \
-                sat_solver(updated_skeleton, partial_model=model_over_updated_skeleton, conflict=conflict)
-            model_over_skeleton = {var: assignment for var, assignment in model_over_updated_skeleton.items() if var in skeleton.variables()}
-
-        else:
-            model_over_formula = t_propagate(model_over_formula, formula)
-            model_over_skeleton = dict(model_over_skeleton)
-            for k, v in substitution_map.items():
-                if v in model_over_formula.keys() and model_over_formula[v]:
-                    model_over_skeleton[k] = True
+            return SAT, model_over_formula
+        if budget is not None and budget.is_exhausted():
+            return SAT_UNKNOWN, model_over_skeleton
+
+        if not congruence_closure_unviolated:
+            incremental_solver.add_formula(get_conflict(model_over_skeleton))
+            state = incremental_solver.solve(max_rounds=max_rounds, budget=budget)
+            continue
+
+        # The lemma (~premises|atom) holds in the theory. An implied equality follows from the equalities alone
+        equalities_over_skeleton = {var: True for var, assignment in model_over_skeleton.items() if assignment}
+        num_added_lemmas = len(added_lemmas)
+        for atom, assignment in t_propagate(dict(model_over_formula), formula).items():
+            if atom in model_over_formula:
+                continue
+            premises = equalities_over_skeleton if assignment else model_over_skeleton
+            lemma = {**premises, formula_to_skeleton[atom]: not assignment}  # Refuted by the lemma, as in get_conflict
+            if frozenset(lemma.items()) not in added_lemmas:  # The last decision may not have been propagated yet
+                added_lemmas.add(frozenset(lemma.items()))
+                incremental_solver.add_formula(get_conflict(lemma))
+
+        # With nothing new to propagate, the rest of the skeleton is solved to the end, like the theory isn't there
+        state = incremental_solver.solve(max_rounds=max_rounds if len(added_lemmas) > num_added_lemmas
+                                         else CONTINUE_UNTIL_MODEL_FULL, budget=budget)
+
+    return state, model_over_skeleton  # UNSAT
+
+
+def portfolio_smt_solver(formula: FO_Formula, skeleton: PropositionalFormula, substitution_map, num_workers: int,
+                         statistics: SolverStatistics = None, budget: ResourceBudget = None) -> Tuple[str, Model]:
+    skeleton_variables = skeleton.variables()
+    state, model, equisatisfiable_formula = portfolio_sat_solver(skeleton, num_workers=num_workers, statistics=statistics,
+                                                                 budget=budget)
+    model_over_skeleton = dict()
+
+    while state == SAT:
+        model_over_skeleton = {var: assignment for var, assignment in model.items() if var in skeleton_variables}
+        model_over_formula = model_over_skeleton_to_model_over_formula(model_over_skeleton, substitution_map)
 
-            state, model_over_updated_skeleton, updated_skeleton = \
-                sat_solver(updated_skeleton, partial_model=model_over_skeleton)
-            model_over_skeleton = {var: assignment for var, assignment in model_over_updated_skeleton.items() if var in skeleton.variables()}
+        if check_congruence_closure(model_over_formula, formula):
+            return SAT, model_over_formula
+        if budget is not None and budget.is_exhausted():
+            return SAT_UNKNOWN, model_over_skeleton
 
-    return UNSAT, model_over_skeleton
+        state, model, equisatisfiable_formula = portfolio_sat_solver(equisatisfiable_formula, conflict=get_conflict(model_over_skeleton),
+                                                                     num_workers=num_workers, statistics=statistics,
+                                                                     budget=budget)
 
+    return state, model_over_skeleton  # UNSAT, or SAT_UNKNOWN if no worker got to an answer
 
 
 def model_over_skeleton_to_model_over_formula(partial_assignment, sub_map):
@@ -65,9 +105,12 @@ def check_congruence_closure(assignment, formula):
 
 
 def t_propagate(assignment, formula):
+    """ Adds to assignment the equalities of formula that it leaves unassigned, and that the theory implies - True if
+    congruence closure joins their sides, False if one side is equal to a term that an inequality separates from the
+    other side """
     subterms = sort_by_length(get_subterms(formula))
     disjoint_set = make_set(subterms)
-    unassigned_equalities = get_equalities_in_formula(formula)
+    unassigned_equalities = get_equalities_in_formula(formula) - assignment.keys()
     equalities = get_equalities(assignment)
     inequalities = get_inequalities(assignment)
     for equality in equalities:
@@ -80,17 +123,8 @@ def t_propagate(assignment, formula):
         else:
             for inequality in inequalities:
                 left_term, right_term = get_nodes(inequality, disjoint_set)
-                if left == left_term or left == right_term:
-                    common_term, uncommon_term = left, right
-                elif right == left_term or right == right_term:
-                    common_term, uncommon_term = right, left
-                else:
-                    continue
-                if common_term == left_term:
-                    suspect_term = right_term
-                else:
-                    suspect_term = left_term
-                if find(uncommon_term) == find(suspect_term):
+                if find(left) == find(left_term) and find(right) == find(right_term) \
+                        or find(left) == find(right_term) and find(right) == find(left_term):
                     assignment[equality] = False
                     break
     return assignment
@@ -104,11 +138,12 @@ def get_equalities_in_formula(formula):
         if is_binary(formula.root):
             equalities = equalities | get_equalities_in_formula(formula.second)
         return equalities
+    return set()
 
 
 def get_conflict(assignment):
-    formula = '('
     num_vars = len(assignment.keys())
+    formula = '(' if num_vars > 1 else ''  # A single literal isn't wrapped
     i = 1
     for a, v in assignment.items():
         if v:
@@ -239,9 +274,3 @@ def get_primitives_in_term(term):
 #     model2 = {Formula.parse('f(f(f(a)))=a'): True, Formula.parse('f(f(f(f(f(a)))))=a'): True, Formula.parse('f(a)=a'): False}
 #     print(check_congruence_closure(model2, formula2))
 #
-#
-# def test3():
-#     formula3 = Formula.parse('(g(a)=c&((~f(g(a))=f(c)|g(a)=d)&~c=d))')
-#     model3 = {Formula.parse('g(a)=c'): True, Formula.parse('c=d'): False}
-#     t_propagate(model3, formula3)
-#
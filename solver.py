@@ -1,8 +1,22 @@
 from cnf_syntax import UNSAT, SAT, SAT_UNKNOWN
 from propositional_logic.semantics import is_contradiction, evaluate, is_satisfiable
 from first_order_logic.syntax import Formula as FO_Formula
-from sat_solver import sat_solver, CONTINUE_UNTIL_MODEL_FULL
-from smt_solver import smt_solver
+from sat_solver import sat_solver, decide, solve_with_preprocessing, backjump, IncrementalSatSolver, CONTINUE_UNTIL_MODEL_FULL
+from preprocessing import CNFPreprocessor
+from cnf_syntax import ImplicationGraph
+from smt_solver import smt_solver, t_propagate
+from portfolio import portfolio_sat_solver
+from cube_and_conquer import CubeAndConquerSolver
+from solver_statistics import SolverStatistics, SolverCallbacks
+from resource_budget import ResourceBudget, CancellationToken, CONFLICTS_EXHAUSTED, CANCELLED, TIME_EXHAUSTED
+from drat_checker import check_drat
+from utils.drat import DratProofWriter
+from utils.dimacs import read_dimacs, write_dimacs
+from benchmarks.generators import random_k_sat
+import copy
+import io
+import pickle
+import time
 from utils.formula_utils import *
 
 
@@ -49,6 +63,231 @@ def test_sat_solver():
         test_sat_solver_on_single_formula(formula, correct_state)
 
 
+def test_large_cnf_formula():
+    print("\nVerify that a long formula in CNF is read without recursing over it.")
+    cnf_formula = random_k_sat(300, ratio=4.0)
+    budget = ResourceBudget(max_conflicts=10)
+    state, _, equisatisfiable_formula = sat_solver(cnf_formula.to_PropositionalFormula(), budget=budget,
+                                                   max_rounds=CONTINUE_UNTIL_MODEL_FULL)
+    assert state == SAT_UNKNOWN and len(equisatisfiable_formula.cnf_formula.variable_table) == 300
+    assert sat_solver(PropositionalFormula.parse('(p|F)'), max_rounds=CONTINUE_UNTIL_MODEL_FULL)[1]['p']
+    print("Correct - " + str(len(cnf_formula.clauses)) + " clauses read.")
+
+
+def test_preprocessing():
+    print("\nVerify the CNF preprocessor - subsumption, strengthening and bounded variable elimination.")
+    variable_table = VariableTable(['p', 'q', 'r', 's'])
+    clauses = [[1, 2], [1, 2, 3], [-1, 2, 4], [-2, 3, 4], [2, -2, 3]]
+    cnf_formula = CNFFormula([CNFClause(clause) for clause in clauses], variable_table)
+    simplified_CNFFormula = CNFPreprocessor(cnf_formula, frozen_variables=range(1, 5)).simplify()
+    # (p|q) subsumes (p|q|r), and strengthens (~p|q|s) to (q|s), which strengthens (~q|r|s) to (r|s)
+    assert simplified_CNFFormula.clauses == [CNFClause([1, 2]), CNFClause([2, 4]), CNFClause([3, 4])]
+    print("Correct - with every variable frozen, simplified to " + str(simplified_CNFFormula))
+
+    preprocessor = CNFPreprocessor(cnf_formula, frozen_variables=[1])
+    simplified_CNFFormula = preprocessor.simplify()
+    assert len(simplified_CNFFormula.clauses) == 0 and not preprocessor.is_eliminated[1] and preprocessor.is_eliminated[2]
+    for assignment in (False, True):  # Any value of the frozen p extends to a model of the original clauses
+        model = preprocessor.extend_model({1: assignment})
+        assert model[1] == assignment
+        assert all(any(model[abs(literal)] == (literal > 0) for literal in clause) for clause in clauses)
+    print("Correct - q and r were eliminated, and the models of p were extended to them.")
+
+    variable_table = VariableTable(['x' + str(variable) for variable in range(1, 8)])
+    cnf_formula = CNFFormula([CNFClause(clause) for clause in [[4, -5, 7, 4], [2, -2], [6, 7, 3, 1], [-5, 4]]], variable_table)
+    preprocessor = CNFPreprocessor(cnf_formula)
+    assert len(preprocessor.clauses) == 3 and preprocessor.simplify() is not None
+    print("Correct - the tautology (x2|~x2) was dropped.")
+
+
+def test_dimacs():
+    print("\nVerify reading and writing DIMACS CNF files.")
+    dimacs_str = "c A comment\np cnf 3 3\n1 -2\n 3 0\nc Another comment\n-1 2 0 2 -3 0\n%\n0\n"
+    clauses = [CNFClause([1, -2, 3]), CNFClause([-1, 2]), CNFClause([2, -3])]
+    cnf_formula = read_dimacs(io.StringIO(dimacs_str))
+    assert cnf_formula.clauses == clauses and len(cnf_formula.variable_table) == 3
+    print("Correct - read " + str(cnf_formula))
+
+    variable_table = VariableTable(['p'])
+    shifted_CNFFormula = read_dimacs(io.StringIO(dimacs_str), variable_table)
+    assert shifted_CNFFormula.clauses == [CNFClause([2, -3, 4]), CNFClause([-2, 3]), CNFClause([3, -4])]
+    assert variable_table.model_to_ids({'x1': True}) == {2: True}
+    print("Correct - read into a table that already has p: " + str(shifted_CNFFormula))
+
+    cnf_formula.add_clause(CNFClause([-1, -3], is_learned=True))
+    for include_learned_clauses, written_clauses in ((False, clauses), (True, clauses + [CNFClause([-1, -3])])):
+        dimacs_stream = io.StringIO()
+        write_dimacs(cnf_formula, dimacs_stream, include_learned_clauses)
+        dimacs_stream.seek(0)
+        assert read_dimacs(dimacs_stream).clauses == written_clauses
+    print("Correct - written and read back, with and without the learned clauses.")
+
+    tautological_CNFFormula = read_dimacs(io.StringIO("p cnf 2 2\n1 -1 0\n2 0\n"))
+    state, model, _ = solve_with_preprocessing(tautological_CNFFormula, dict(), lambda simplified_CNFFormula: decide(
+        simplified_CNFFormula, dict(), max_rounds=CONTINUE_UNTIL_MODEL_FULL))
+    assert state == SAT and model['x2']
+    print("Correct - the tautology (x1|~x1) was kept, and is satisfiable with " + str(model))
+
+
+def test_incremental_sat_solver():
+    print("\nVerify the incremental sat solver by adding clauses and solving under assumptions.")
+    incremental_solver = IncrementalSatSolver(PropositionalFormula.parse('((p|q)&(~p|r))'))
+    assert incremental_solver.solve() == SAT
+
+    assert incremental_solver.solve(assumptions={'p': True, 'r': False}) == UNSAT
+    assert incremental_solver.get_failed_assumptions() == {'p': True, 'r': False}
+    print("Correct - p and ~r contradict the formula.")
+
+    incremental_solver.add_formula(PropositionalFormula.parse('(~q|r)'))
+    assert incremental_solver.solve(assumptions={'r': False}) == UNSAT
+    assert incremental_solver.solve() == SAT and incremental_solver.get_model()['r']
+    print("Correct - after adding (~q|r), r must be True: " + str(incremental_solver.get_model()))
+
+    incremental_solver.add_formula(PropositionalFormula.parse('~r'))
+    assert incremental_solver.solve() == UNSAT
+    assert incremental_solver.get_failed_assumptions() == dict()
+    print("Correct - after adding ~r, the formula has no satisfiable assignment.")
+
+
+def test_attach_clause():
+    print("\nVerify that a clause added in the middle of a search still propagates after a backjump.")
+    cnf_formula = CNFFormula([CNFClause([1, 2, 3]), CNFClause([-4, 5])])
+    implication_graph = ImplicationGraph(5, dict())
+    cnf_formula.load_model(implication_graph)
+    for variable, assignment in ((2, False), (3, False), (4, False), (1, True)):
+        implication_graph.add_decision(variable, assignment)
+    assert cnf_formula.propagate(implication_graph) is None
+
+    clause = CNFClause([1, 2], is_learned=True)  # Unit since level 1, but its True literal is from level 4
+    cnf_formula.add_clause(clause, implication_graph)
+    backjump(cnf_formula, implication_graph, 2, None)
+    assert implication_graph.value[1] is True and implication_graph.level[1] == 2 and implication_graph.reason[1] is clause
+    print("Correct - 1 was implied on level 2.")
+
+
+def test_portfolio_sat_solver():
+    print("\nVerify the portfolio sat solver with several workers.")
+    sat_formula = PropositionalFormula.parse('(((p|q)&(~p|r))&((~q|r)&(s<->~r)))')
+    state, model, equisatisfiable_formula = portfolio_sat_solver(sat_formula, num_workers=3)
+    assert state == SAT and evaluate(sat_formula, {var: model[var] for var in sat_formula.variables()})
+    print("Correct - The formula " + str(sat_formula) + " is satisfiable with the assignment: " + str(model))
+
+    state, model, _ = portfolio_sat_solver(equisatisfiable_formula, conflict=PropositionalFormula.parse('~r'), num_workers=3)
+    assert state == UNSAT
+    print("Correct - after adding ~r, the formula has no satisfiable assignment.")
+
+
+def test_solver_statistics():
+    print("\nVerify the statistics and callbacks of the sat solver.")
+    learned_clauses = list()
+    statistics = SolverStatistics()
+    callbacks = SolverCallbacks(on_learn=lambda clause: learned_clauses.append(clause))
+    state, _, _ = sat_solver(parse_CNFFormula(get_pigeonhole_CNF_str(4, 3)).to_PropositionalFormula(), max_rounds=CONTINUE_UNTIL_MODEL_FULL,
+                             statistics=statistics, callbacks=callbacks)
+    assert state == UNSAT
+    assert statistics.conflicts > 0 and statistics.decisions > 0 and statistics.propagations > 0
+    assert statistics.learned_clauses == len(learned_clauses) > 0
+    assert statistics.search_time > 0
+    print("Correct - " + str(statistics))
+
+
+def test_resource_budget():
+    print("\nVerify that the sat solver stops when its budget is exhausted.")
+    pigeonhole_formula = parse_CNFFormula(get_pigeonhole_CNF_str(8, 7)).to_PropositionalFormula()
+    budget = ResourceBudget(max_conflicts=10)
+    state, _, _ = sat_solver(pigeonhole_formula, max_rounds=CONTINUE_UNTIL_MODEL_FULL, budget=budget)
+    assert state == SAT_UNKNOWN and budget.exhausted_reason == CONFLICTS_EXHAUSTED and budget.statistics.conflicts == 10
+    print("Correct - stopped after " + str(budget.statistics.conflicts) + " conflicts.")
+
+    cancellation_token = CancellationToken()
+    cancellation_token.cancel()
+    budget = ResourceBudget(cancellation_token=cancellation_token)
+    state, _, _ = sat_solver(pigeonhole_formula, max_rounds=CONTINUE_UNTIL_MODEL_FULL, budget=budget)
+    assert state == SAT_UNKNOWN and budget.exhausted_reason == CANCELLED
+    print("Correct - stopped when cancelled.")
+
+    cnf_formula = random_k_sat(20000)
+    budget = ResourceBudget(max_time=0.05)
+    start_time = time.perf_counter()
+    state, _, _ = solve_with_preprocessing(cnf_formula, dict(), lambda simplified_CNFFormula: decide(
+        simplified_CNFFormula, dict(), max_rounds=CONTINUE_UNTIL_MODEL_FULL, budget=budget), budget=budget)
+    solve_time = time.perf_counter() - start_time
+    assert state == SAT_UNKNOWN and budget.exhausted_reason == TIME_EXHAUSTED and solve_time < 2
+    print("Correct - stopped while preprocessing " + str(len(cnf_formula.clauses)) + " clauses, after "
+          + str(round(solve_time, 2)) + " seconds.")
+
+
+def test_equisatisfiable_formula():
+    print("\nVerify the formula returned by the sat solver - its learned clauses stay learned, and it can be copied.")
+    pigeonhole_formula = parse_CNFFormula(get_pigeonhole_CNF_str(6, 5)).to_PropositionalFormula()
+    state, _, equisatisfiable_formula = sat_solver(pigeonhole_formula, max_rounds=CONTINUE_UNTIL_MODEL_FULL,
+                                                   budget=ResourceBudget(max_conflicts=50))
+    assert state == SAT_UNKNOWN
+    cnf_formula = equisatisfiable_formula.to_CNFFormula()
+    assert len(cnf_formula.learned_clauses) == len(equisatisfiable_formula.cnf_formula.learned_clauses) > 0
+    assert all(clause.is_learned for clause in cnf_formula.learned_clauses)
+    assert not any(clause.is_learned for clause in cnf_formula.clauses)
+    state, _, _ = sat_solver(equisatisfiable_formula, max_rounds=CONTINUE_UNTIL_MODEL_FULL)
+    assert state == UNSAT
+    print("Correct - " + str(len(cnf_formula.learned_clauses)) + " learned clauses kept.")
+
+    for copied_formula in (copy.copy(equisatisfiable_formula), copy.deepcopy(equisatisfiable_formula),
+                           pickle.loads(pickle.dumps(equisatisfiable_formula))):
+        assert copied_formula.variables() == equisatisfiable_formula.variables()
+    try:
+        equisatisfiable_formula.rooot
+        assert False
+    except AttributeError:
+        assert equisatisfiable_formula._EquisatisfiableFormula__propositional_formula is None  # Not converted for a typo
+    assert equisatisfiable_formula.root == '&'
+    print("Correct - copied and pickled without converting it.")
+
+
+def test_drat_proof():
+    print("\nVerify the DRAT proof of an UNSAT result with the checker.")
+    cnf_formula = parse_CNFFormula(get_pigeonhole_CNF_str(5, 4))
+    proof_stream = io.BytesIO()
+    with DratProofWriter(proof_stream) as proof:
+        state, _, _ = decide(cnf_formula, dict(), max_rounds=CONTINUE_UNTIL_MODEL_FULL, proof=proof)
+    assert state == UNSAT
+    proof_stream.seek(0)
+    assert check_drat(cnf_formula, proof_stream)
+    print("Correct - the proof of " + str(proof.num_additions) + " lemmas was verified.")
+
+    proof_stream.seek(0)
+    assert not check_drat(CNFFormula(cnf_formula.clauses[1:], cnf_formula.variable_table), proof_stream)
+    print("Correct - the proof doesn't refute the formula without its first clause.")
+
+
+def get_pigeonhole_CNF_str(num_pigeons: int, num_holes: int) -> str:
+    """ pigeon i is in hole j if pij. Every pigeon is in some hole, and no two pigeons share a hole """
+    clauses = ["|".join("p" + str(pigeon) + str(hole) for hole in range(num_holes)) for pigeon in range(num_pigeons)]
+    clauses += ["~p" + str(pigeon) + str(hole) + "|~p" + str(other_pigeon) + str(hole)
+                for hole in range(num_holes) for pigeon in range(num_pigeons) for other_pigeon in range(pigeon + 1, num_pigeons)]
+    return "&".join(clauses)
+
+
+def test_cube_and_conquer():
+    print("\nVerify cube and conquer on pigeonhole formulae.")
+    cube_and_conquer_solver = CubeAndConquerSolver(num_workers=2, max_rounds_per_cube=10)
+    state, model, _ = cube_and_conquer_solver.decide(parse_CNFFormula(get_pigeonhole_CNF_str(5, 4)), dict())
+    assert state == UNSAT
+    print("Correct - 5 pigeons don't fit in 4 holes. " + str(cube_and_conquer_solver.statistics))
+
+    state, model, _ = cube_and_conquer_solver.decide(parse_CNFFormula(get_pigeonhole_CNF_str(4, 4)), dict())
+    assert state == SAT and all(any(model["p" + str(pigeon) + str(hole)] for hole in range(4)) for pigeon in range(4))
+    print("Correct - 4 pigeons fit in 4 holes: " + str(model))
+
+    # A satisfiable random part makes for many cubes, while the pigeonhole part refutes the formula in the first ones
+    cnf_formula = parse_CNFFormula("(" + str(random_k_sat(60, ratio=3.0)) + "&" + get_pigeonhole_CNF_str(5, 4) + ")")
+    cube_and_conquer_solver = CubeAndConquerSolver(num_workers=2, cube_depth=9)
+    state, _, _ = cube_and_conquer_solver.decide(cnf_formula, dict())
+    statistics = cube_and_conquer_solver.statistics
+    assert state == UNSAT and sum(statistics.cubes_per_worker) < statistics.num_initial_cubes
+    print("Correct - UNSAT after " + str(sum(statistics.cubes_per_worker)) + " of " + str(statistics.num_initial_cubes)
+          + " cubes.")
+
+
 def test_smt_solver():
     print("\nVerify smt_solver by running it on Tuf formulae.")
     fo_formula1 = FO_Formula.parse('((f(a,c)=b|f(a,g(b))=b)&~c=g(b))')
@@ -59,22 +298,41 @@ def test_smt_solver():
     sat_fo_formulae = [fo_formula1, fo_formula2]
     unsat_fo_formulae = [fo_formula3, fo_formula4, fo_formula5]
 
+    print("Checking the theory propagation of " + str(fo_formula4))
+    propagated_model = t_propagate({FO_Formula.parse('g(a)=c'): True, FO_Formula.parse('c=d'): False}, fo_formula4)
+    assert propagated_model[FO_Formula.parse('f(g(a))=f(c)')] and not propagated_model[FO_Formula.parse('g(a)=d')]
+    assert smt_solver(fo_formula4, max_rounds=1)[0] == UNSAT
+    print("Correct - g(a)=c implies f(g(a))=f(c), and with ~c=d it implies ~g(a)=d.\n\n")
+
     for formula in sat_fo_formulae:
         print("Checking Tuf-satisfiability of formula " + str(formula))
         state, model = smt_solver(formula)
         assert state == SAT
+        assert smt_solver(formula, num_workers=2)[0] == SAT
         print("The formula " + str(formula) + ", is Tuf-satisfiable.\n\n")
 
     for formula in unsat_fo_formulae:
         print("Checking T-satisfiability of formula " + str(formula))
         state, model = smt_solver(formula)
         assert state == UNSAT
+        assert smt_solver(formula, num_workers=2)[0] == UNSAT
         print("The formula " + str(formula) + ", is not Tuf-satisfiable.\n\n")
 
 
 def main(test_sat=True, test_smt=True):
     if test_sat:
         test_sat_solver()
+        test_large_cnf_formula()
+        test_preprocessing()
+        test_dimacs()
+        test_incremental_sat_solver()
+        test_attach_clause()
+        test_portfolio_sat_solver()
+        test_solver_statistics()
+        test_resource_budget()
+        test_equisatisfiable_formula()
+        test_drat_proof()
+        test_cube_and_conquer()
 
     print("\n\n")
 
@@ -0,0 +1,106 @@
+from typing import Callable, Dict, Optional
+import time
+
+
+class SolverStatistics:
+    """ What the solver did, for tuning and monitoring. Passed to sat_solver / decide / IncrementalSatSolver, which add to
+    it as they go, so it sums up every call it was passed to. Times are in seconds """
+
+    def __init__(self):
+        self.decisions = 0
+        self.propagations = 0  # Assignments made by unit propagation
+        self.conflicts = 0
+        self.restarts = 0
+        self.learned_clauses = 0
+        self.learned_literals = 0
+        self.max_learned_clause_size = 0
+        self.backjumps = 0
+        self.backjump_levels = 0  # Summed over all backjumps, each counted as the number of levels it undid
+        self.max_backjump_distance = 0
+        self.tseitin_time = 0.0
+        self.preprocess_time = 0.0
+        self.bcp_time = 0.0
+        self.analyze_time = 0.0
+        self.search_time = 0.0  # All of search, including BCP and conflict analysis
+
+
+    def __repr__(self) -> str:
+        return "SolverStatistics(" + ", ".join(name + "=" + str(value) for name, value in self.to_dict().items()) + ")"
+
+
+    @property
+    def average_learned_clause_size(self) -> float:
+        return self.learned_literals / self.learned_clauses if self.learned_clauses > 0 else 0.0
+
+
+    @property
+    def average_backjump_distance(self) -> float:
+        return self.backjump_levels / self.backjumps if self.backjumps > 0 else 0.0
+
+
+    @property
+    def propagations_per_second(self) -> float:
+        return self.propagations / self.search_time if self.search_time > 0 else 0.0
+
+
+    def to_dict(self) -> Dict[str, float]:
+        """ The counters, times and averages, e.g. for a metrics pipeline """
+        statistics = dict(vars(self))
+        statistics.update(average_learned_clause_size=self.average_learned_clause_size,
+                          average_backjump_distance=self.average_backjump_distance,
+                          propagations_per_second=self.propagations_per_second)
+        return statistics
+
+
+    def on_learn(self, learned_clause_size: int):
+        self.learned_clauses += 1
+        self.learned_literals += learned_clause_size
+        self.max_learned_clause_size = max(self.max_learned_clause_size, learned_clause_size)
+
+
+    def on_backjump(self, distance: int):
+        self.backjumps += 1
+        self.backjump_levels += distance
+        self.max_backjump_distance = max(self.max_backjump_distance, distance)
+
+
+    def add(self, other: "SolverStatistics"):
+        """ Adds the statistics of another run, e.g. of a parallel worker. Maxima are combined as maxima """
+        for name, value in vars(other).items():
+            if name.startswith("max_"):
+                setattr(self, name, max(getattr(self, name), value))
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+
+class SolverCallbacks:
+    """ Functions that the search calls on its events. An event without a callback costs only a check for None.
+    on_conflict gets the clause that became UNSAT, on_learn the clause learned from it (with its lbd), and on_restart
+    nothing """
+
+    def __init__(self, on_conflict: Optional[Callable] = None, on_learn: Optional[Callable] = None,
+                 on_restart: Optional[Callable] = None):
+        self.on_conflict = on_conflict
+        self.on_learn = on_learn
+        self.on_restart = on_restart
+
+
+class PhaseTimer:
+    """ Adds the time spent in a with block to one of the statistics' times. Does nothing without statistics """
+
+    def __init__(self, statistics: Optional[SolverStatistics], time_name: str):
+        self.statistics = statistics
+        self.time_name = time_name
+        self.start_time = 0.0
+
+
+    def __enter__(self):
+        if self.statistics is not None:
+            self.start_time = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.statistics is not None:
+            setattr(self.statistics, self.time_name,
+                    getattr(self.statistics, self.time_name) + time.perf_counter() - self.start_time)
@@ -0,0 +1,106 @@
+import gzip
+
+from typing import IO, List, Union
+from cnf_syntax import CNFFormula, CNFClause, VariableTable
+
+
+DIMACS_VARIABLE_PREFIX = 'x'  # DIMACS variable n is named x<n>
+FILE_BUFFER_SIZE = 1 << 16
+
+
+def open_dimacs(path: str, mode: str) -> IO:
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode, buffering=FILE_BUFFER_SIZE)
+
+
+def add_dimacs_variables(variable_table: VariableTable, num_variables: int):
+    for dimacs_variable in range(len(variable_table) + 1, num_variables + 1):
+        variable_table.add_variable(DIMACS_VARIABLE_PREFIX + str(dimacs_variable))
+
+
+def read_dimacs(source: Union[str, IO], variable_table: VariableTable = None) -> CNFFormula:
+    """
+    Builds a CNFFormula straight from a DIMACS CNF file, in one buffered pass over its lines, without building any
+    propositional formula or string for it.
+    :param source: a path (possibly .gz), or an open text stream.
+    :param variable_table: the table to add the variables to, named x1, x2, ... If not given, a new table is created, and
+    the ids of the variables are the DIMACS numbers themselves.
+    :return: the CNFFormula of the file's clauses.
+    """
+    if isinstance(source, str):
+        with open_dimacs(source, 'r') as dimacs_file:
+            return read_dimacs(dimacs_file, variable_table)
+
+    if variable_table is None:
+        variable_table = VariableTable()
+    # A new table is filled as x1, x2, ... so ids are the DIMACS numbers. Otherwise DIMACS numbers are mapped to new ids
+    is_identity = len(variable_table) == 0
+    dimacs_to_id = [0]
+
+    clauses = list()
+    current_literals = list()
+
+    for line in source:
+        first_char = line[:1]
+        if first_char == 'c' or first_char == '\n' or first_char == '':
+            continue
+        if first_char == 'p':
+            header = line.split()
+            assert len(header) == 4 and header[1] == 'cnf', "Bad DIMACS header: " + line
+            if is_identity:
+                add_dimacs_variables(variable_table, int(header[2]))
+            continue
+        if first_char == '%':  # Some benchmark sets end with a '%' line
+            break
+
+        for literal in map(int, line.split()):
+            if literal == 0:
+                clauses.append(CNFClause(current_literals))
+                current_literals = list()
+                continue
+
+            dimacs_variable = literal if literal > 0 else -literal
+            if is_identity:
+                if dimacs_variable > len(variable_table):  # The header was missing, or had too few variables
+                    add_dimacs_variables(variable_table, dimacs_variable)
+                current_literals.append(literal)
+                continue
+
+            while dimacs_variable >= len(dimacs_to_id):
+                dimacs_to_id.append(0)
+            variable = dimacs_to_id[dimacs_variable]
+            if variable == 0:
+                variable = variable_table.add_variable(DIMACS_VARIABLE_PREFIX + str(dimacs_variable))
+                dimacs_to_id[dimacs_variable] = variable
+            current_literals.append(variable if literal > 0 else -variable)
+
+    if len(current_literals) > 0:  # The last clause may lack its terminating 0
+        clauses.append(CNFClause(current_literals))
+
+    return CNFFormula(clauses, variable_table)
+
+
+def write_dimacs(cnf_formula: CNFFormula, target: Union[str, IO], include_learned_clauses: bool = True):
+    """
+    Streams a CNFFormula out in DIMACS CNF format, clause by clause, so no representation of the whole formula is built.
+    Variable ids are used as the DIMACS numbers.
+    :param cnf_formula: the formula to write.
+    :param target: a path (possibly .gz), or an open text stream.
+    :param include_learned_clauses: whether to write the learned clauses after the original ones.
+    """
+    if isinstance(target, str):
+        with open_dimacs(target, 'w') as dimacs_file:
+            write_dimacs(cnf_formula, dimacs_file, include_learned_clauses)
+        return
+
+    clause_lists: List[List[CNFClause]] = [cnf_formula.clauses]
+    if include_learned_clauses:
+        clause_lists.append(cnf_formula.learned_clauses)
+
+    num_clauses = sum(len(clause_list) for clause_list in clause_lists)
+    target.write("p cnf " + str(cnf_formula.get_num_variables()) + " " + str(num_clauses) + "\n")
+
+    for clause_list in clause_lists:  # The stream is buffered, so writing clause by clause is cheap
+        for clause in clause_list:
+            target.write(" ".join(map(str, clause.literals)) + " 0\n" if len(clause.literals) > 0 else "0\n")
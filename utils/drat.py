@@ -0,0 +1,109 @@
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Union
+
+
+PROOF_BUFFER_SIZE = 1 << 16  # Bytes kept in memory before they're written out
+ADDITION, DELETION = ord('a'), ord('d')
+
+
+def encode_literal(literal: int) -> bytes:
+    """ Binary DRAT: 2 * variable, plus 1 if negated, as a little endian base 128 varint """
+    number = 2 * literal if literal > 0 else -2 * literal + 1
+    encoded = bytearray()
+    while number > 127:
+        encoded.append(number & 127 | 128)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded)
+
+
+class DratProofWriter:
+    """ Streams a binary DRAT proof: every clause added (a lemma) or deleted, as the search goes. Each line is encoded
+    into a buffer, with the literals' encodings cached, and the buffer is written out only when it's full, so logging a
+    clause costs about a dict lookup per literal. Close it (or use it in a with block) to write what's left """
+
+    def __init__(self, target: Union[str, BinaryIO], buffer_size: int = PROOF_BUFFER_SIZE):
+        """
+        :param target: a path, or a stream open for binary writing, which the caller closes.
+        :param buffer_size: the bytes to gather before writing them out.
+        """
+        self.is_owner = isinstance(target, str)
+        self.proof_file = open(target, 'wb') if self.is_owner else target
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.encoded_literals = dict()
+        self.num_additions = 0
+        self.num_deletions = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def write_line(self, line_type: int, literals: Iterable[int]):
+        buffer, encoded_literals = self.buffer, self.encoded_literals
+        buffer.append(line_type)
+        for literal in literals:
+            encoded_literal = encoded_literals.get(literal)
+            if encoded_literal is None:
+                encoded_literal = encoded_literals[literal] = encode_literal(literal)
+            buffer += encoded_literal
+        buffer.append(0)
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+
+    def add_clause(self, literals: Iterable[int]):
+        """ A lemma. For a RAT lemma, the pivot must be the first literal """
+        self.write_line(ADDITION, literals)
+        self.num_additions += 1
+
+
+    def delete_clause(self, literals: Iterable[int]):
+        self.write_line(DELETION, literals)
+        self.num_deletions += 1
+
+
+    def flush(self):
+        self.proof_file.write(self.buffer)
+        self.buffer = bytearray()
+
+
+    def close(self):
+        self.flush()
+        if self.is_owner:
+            self.proof_file.close()
+        else:
+            self.proof_file.flush()
+
+
+def read_drat(source: Union[str, BinaryIO]) -> Iterator[Tuple[bool, List[int]]]:
+    """ The lines of a binary DRAT proof, as (is_deletion, literals) """
+    if isinstance(source, str):
+        with open(source, 'rb') as proof_file:
+            yield from read_drat(proof_file)
+        return
+
+    data = source.read()
+    index = 0
+    while index < len(data):
+        line_type = data[index]
+        assert line_type == ADDITION or line_type == DELETION, "Bad binary DRAT line at byte " + str(index)
+        index += 1
+        literals = list()
+        while True:
+            number, shift = 0, 0
+            while True:
+                byte = data[index]
+                index += 1
+                number |= (byte & 127) << shift
+                shift += 7
+                if byte < 128:
+                    break
+            if number == 0:
+                break
+            literals.append(number >> 1 if number & 1 == 0 else -(number >> 1))
+        yield line_type == DELETION, literals
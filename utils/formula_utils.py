@@ -1,4 +1,5 @@
-from cnf_syntax import CNFFormula, CNFClause
+from cnf_syntax import CNFFormula, CNFClause, VariableTable
+from resource_budget import ResourceBudget
 from propositional_logic.syntax import Formula as PropositionalFormula
 from propositional_logic.syntax import *
 
@@ -32,13 +33,65 @@ def is_literal(propositional_formula: PropositionalFormula):
     return is_constant_or_variable(propositional_formula) or (is_unary(propositional_formula.root) and is_constant_or_variable(propositional_formula.first))
 
 
-def propositional_formula_to_CNFFormula(propositional_formula: PropositionalFormula) -> CNFFormula:
-    formula_str = str(propositional_formula)
-    return parse_CNFFormula(formula_str)
+def is_cnf(propositional_formula: PropositionalFormula) -> bool:
+    """ Whether a formula is a conjunction of clauses, each a disjunction of variables and negated variables - what
+    propositional_formula_to_CNFFormula reads. Iterative, so long chains of '&' and '|' are fine """
+    stack = [(propositional_formula, True)]  # Sub formulae, and whether they may still be a conjunction
+    while len(stack) > 0:
+        sub_formula, is_conjunction_allowed = stack.pop()
+        root = sub_formula.root
+        if root == '|' or (root == '&' and is_conjunction_allowed):
+            stack.append((sub_formula.first, root == '&'))
+            stack.append((sub_formula.second, root == '&'))
+        elif is_unary(root):
+            if not is_variable(sub_formula.first.root):
+                return False
+        elif not is_variable(root):
+            return False
+    return True
+
+
+def propositional_formula_to_CNFFormula(propositional_formula: PropositionalFormula, variable_table: VariableTable = None,
+                                        budget: ResourceBudget = None) -> CNFFormula:
+    """ Walks the tree of a formula in CNF, building every clause straight from its literals - no string is built and
+    parsed again. Iterative, so long chains of '&' and '|' are fine. With a budget, it stops once the budget is exhausted,
+    leaving clauses out """
+    if variable_table is None:
+        variable_table = VariableTable()
 
-
-def parse_CNFFormula(formula_str: str) -> CNFFormula:
-    """ Since we gat a string representation of a valid propositional formula, we can make this very simple """
+    clauses = list()
+    clause_stack = [propositional_formula]
+    while len(clause_stack) > 0:
+        if budget is not None and budget.is_exhausted_in_step():
+            break
+        sub_formula = clause_stack.pop()
+        if sub_formula.root == '&':
+            clause_stack.append(sub_formula.second)
+            clause_stack.append(sub_formula.first)
+            continue
+
+        literals = list()
+        literal_stack = [sub_formula]
+        while len(literal_stack) > 0:
+            literal_formula = literal_stack.pop()
+            if literal_formula.root == '|':
+                literal_stack.append(literal_formula.second)
+                literal_stack.append(literal_formula.first)
+            elif is_unary(literal_formula.root):
+                literals.append(-variable_table.add_variable(literal_formula.first.root))
+            else:
+                literals.append(variable_table.add_variable(literal_formula.root))
+        clauses.append(CNFClause(literals))
+
+    return CNFFormula(clauses, variable_table)
+
+
+def parse_CNFFormula(formula_str: str, variable_table: VariableTable = None) -> CNFFormula:
+    """ Since we gat a string representation of a valid propositional formula, we can make this very simple.
+    Variable names are translated to ids through variable_table, which is created if not given """
+
+    if variable_table is None:
+        variable_table = VariableTable()
 
     no_parentheses = formula_str.replace('(', '').replace(')', '')
 
@@ -47,11 +100,9 @@ def parse_CNFFormula(formula_str: str) -> CNFFormula:
 
     for clause in clauses_str:
         variables = clause.split("|")
-        positive_variables = {variable for variable in variables if not is_unary(variable[0])}
-        negative_variables = {variable[1:] for variable in variables if is_unary(variable[0])}
-        new_clause = CNFClause(positive_variables, negative_variables)
+        literals = [-variable_table.add_variable(variable[1:]) if is_unary(variable[0]) else variable_table.add_variable(variable)
+                    for variable in variables]
+        new_clause = CNFClause(literals)
         clauses.append(new_clause)
 
-    return CNFFormula(clauses)
-
-
+    return CNFFormula(clauses, variable_table)